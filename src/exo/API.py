@@ -2,6 +2,7 @@ import ast as pyast
 import inspect
 import re
 import types
+import weakref
 from pathlib import Path
 from typing import Optional, Union, List
 
@@ -18,6 +19,9 @@ from .frontend.parse_fragment import parse_fragment
 from .frontend.pattern_match import match_pattern
 from .core.prelude import *
 from .rewrite.new_eff import Check_Aliasing
+from .core.LoopIR_hash import struct_hash
+from .core.LoopIR_serialize import dumps_procs, loads_procs
+from .core.LoopIR_index import get_proc_index
 
 # Moved to new file
 from .core.proc_eqv import decl_new_proc, derive_proc, assert_eqv_proc, check_eqv_proc
@@ -155,6 +159,70 @@ def compile_procs_to_strings(proc_list, h_file_name: str):
     return run_compile([p._loopir_proc for p in proc_list], h_file_name)
 
 
+def save_procs(proc_list, path, known=(), srcinfo=True):
+    """
+    Save the procedures in `proc_list` to the file `path`, so that they
+    can be loaded again with `load_procs`.  The procedures, configs,
+    memories and externs in `known` are saved by name, and must be passed
+    to `load_procs` again.  See `core/LoopIR_serialize.py` for details.
+    """
+    assert isinstance(proc_list, list)
+    assert all(isinstance(p, Procedure) for p in proc_list)
+    data = dumps_procs([p._loopir_proc for p in proc_list], known, srcinfo)
+    Path(path).write_bytes(data)
+
+
+def load_procs(path, known=()):
+    """
+    Load the list of procedures saved to the file `path` by `save_procs`
+    """
+    return [Procedure(p) for p in loads_procs(Path(path).read_bytes(), known)]
+
+
+# procedures with a skip (see `Procedure._skip_forward`), so that sealing a
+# procedure can drop the skips spanning it
+_skipping = weakref.WeakValueDictionary()
+
+
+def _compose_forwards(fwds):
+    """
+    Compose the forwarding functions `fwds`, ordered from the newest procedure
+    to the oldest. The composition is memoized per cursor position, since it
+    is shared by every later forward through the same procedures.
+    """
+    if len(fwds) == 1:
+        return fwds[0]
+
+    memo = {}
+
+    def forward(cursor):
+        key = IC.cursor_key(cursor)
+        if key not in memo:
+            try:
+                for fn in reversed(fwds):
+                    cursor = fn(cursor)
+                memo[key] = cursor
+            except IC.InvalidCursorError as e:
+                memo[key] = e
+        result = memo[key]
+        if isinstance(result, IC.InvalidCursorError):
+            raise IC.InvalidCursorError(*result.args)
+        return result
+
+    return forward
+
+
+def _select_matches(cursors, pattern, count, many=False):
+    # select the matches of `pattern` as `Procedure.find` does, from the list
+    # of all of them
+    if count:
+        n = int(count[1:])
+        cursors = cursors[n : n + 1]
+    if not cursors:
+        raise SchedulingError("failed to find matches", pattern=pattern)
+    return cursors if many else cursors[0]
+
+
 class Procedure(ProcedureBase):
     def __init__(
         self,
@@ -192,13 +260,30 @@ class Procedure(ProcedureBase):
         self._loopir_proc = proc
         self._provenance_eq_Procedure = _provenance_eq_Procedure
         self._forward = _forward
+        self._mod_config = _mod_config
+        self._depth = (
+            _provenance_eq_Procedure._depth + 1 if _provenance_eq_Procedure else 0
+        )
+        self._skip = None
 
     def forward(self, cur: C.Cursor):
+        src = cur.proc()
         p = self
         fwds = []
-        while p is not None and p is not cur.proc():
-            fwds.append(p._forward)
-            p = p._provenance_eq_Procedure
+        while p is not src:
+            parent = p._provenance_eq_Procedure
+            if parent is None or p._depth <= src._depth:
+                raise IC.InvalidCursorError(
+                    "cannot forward a cursor from a procedure that is not "
+                    "an ancestor of this one, or whose history was sealed"
+                )
+            ancestor, fwd = p._skip_forward()
+            if ancestor._depth >= src._depth:
+                fwds.append(fwd)
+                p = ancestor
+            else:
+                fwds.append(p._forward)
+                p = parent
 
         ir = cur._impl
         for fn in reversed(fwds):
@@ -206,13 +291,60 @@ class Procedure(ProcedureBase):
 
         return C.lift_cursor(ir, self)
 
+    def _skip_forward(self):
+        """
+        Returns an ancestor of this procedure and the forwarding function from
+        it to this procedure. The ancestor is at depth `d & (d - 1)`, clearing
+        the lowest bit of this procedure's depth `d`, so that any ancestor is
+        reached in a logarithmic number of skips, as in a Fenwick tree.
+        Skips are built lazily, from the skips of the procedures they span.
+        """
+        if self._skip is None:
+            target = self._depth & (self._depth - 1)
+            fwds = [self._forward]
+            p = self._provenance_eq_Procedure
+            while p._depth > target and p._provenance_eq_Procedure is not None:
+                p, fwd = p._skip_forward()
+                fwds.append(fwd)
+            self._skip = (p, _compose_forwards(fwds))
+            _skipping[id(self)] = self
+        return self._skip
+
+    def seal(self):
+        """
+        Discard the history of this procedure, so that the procedures it was
+        derived from can be garbage collected. Cursors into those procedures
+        can no longer be forwarded to this procedure, or to procedures derived
+        from it; cursors into this procedure still can be.
+        """
+        if self._provenance_eq_Procedure is not None:
+            self._provenance_eq_Procedure = None
+            self._forward = None
+            self._drop_skip()
+            # drop the skips of derived procedures which pass over this one
+            for p in list(_skipping.values()):
+                if p._skip[0]._depth < self._depth < p._depth:
+                    q = p
+                    while q is not None and q._depth > self._depth:
+                        q = q._provenance_eq_Procedure
+                    if q is self:
+                        p._drop_skip()
+        return self
+
+    def _drop_skip(self):
+        self._skip = None
+        _skipping.pop(id(self), None)
+
     def __str__(self):
         return str(self._loopir_proc)
 
     def __eq__(self, other):
         if not isinstance(other, Procedure):
             return False
-        return self._loopir_proc == other._loopir_proc
+        p1, p2 = self._loopir_proc, other._loopir_proc
+        # equal procs have equal structural hashes; check those first to
+        # avoid comparing unequal procs in full
+        return p1 is p2 or (struct_hash(p1) == struct_hash(p2) and p1 == p2)
 
     def _repr_markdown_(self):
         return "```python\n" + self.__str__() + "\n```"
@@ -272,6 +404,7 @@ class Procedure(ProcedureBase):
         if results:
             name, count = results[1], (results[2] if results[2] else "")
             pattern = f"for {name} in _: _{count}"
+            return _select_matches(self.index().loops(name), pattern, count, many)
 
         return self.find(pattern, many, call_depth=1)
 
@@ -285,12 +418,20 @@ class Procedure(ProcedureBase):
                     return arg
 
             pattern = f"{name}: _{count}"
+            return _select_matches(self.index().allocs(name), pattern, count)
 
         return self.find(pattern, call_depth=1)
 
     def find_all(self, pattern):
         return self.find(pattern, many=True, call_depth=1)
 
+    def index(self):
+        """
+        Return an index of the loops, allocations, accesses and calls of this
+        procedure by name, which is built once per procedure.
+        """
+        return ProcQuery(self)
+
     # ---------------------------------------------- #
     #     execution / compilation operations
     # ---------------------------------------------- #
@@ -368,3 +509,61 @@ class Procedure(ProcedureBase):
 
     def _root(self):
         return IC.Cursor.create(self._loopir_proc)
+
+
+class ProcQuery:
+    """
+    Cursors to the loops, allocations, accesses and calls of a procedure, by
+    name.  Each list of cursors is in the order in which `Procedure.find`
+    matches them, and a name of "_" selects every loop or allocation.
+    """
+
+    def __init__(self, proc: Procedure):
+        self._proc = proc
+        self._index = get_proc_index(proc._loopir_proc)
+
+    def _lift(self, entries):
+        root = self._proc._loopir_proc
+        cursors = []
+        for path, node in entries:
+            cur = IC.Node(root, list(path))
+            # noinspection PyPropertyAccess
+            cur._node = node
+            cursors.append(C.lift_cursor(cur, self._proc))
+        return cursors
+
+    def _named(self, table, name):
+        if name == "_":
+            # statement paths are ordered as statements are visited
+            return self._lift(sorted(e for es in table.values() for e in es))
+        return self._lift(table.get(name, ()))
+
+    def loops(self, name="_"):
+        """Return all loops over the iteration variable `name`"""
+        return self._named(self._index.loops, name)
+
+    def allocs(self, name="_"):
+        """Return all allocations of the buffer `name`"""
+        return self._named(self._index.allocs, name)
+
+    def reads(self, name):
+        """Return all reads and windows of the buffer `name`"""
+        return self._lift(self._index.reads.get(name, ()))
+
+    def writes(self, name):
+        """Return all assignments and reductions to the buffer `name`"""
+        return self._lift(self._index.writes.get(name, ()))
+
+    def calls(self, callee):
+        """Return all calls to the procedure `callee`, or to procedures named so"""
+        if isinstance(callee, Procedure):
+            return self._lift(self._index.calls.get(callee._loopir_proc, ()))
+        return self._lift(
+            sorted(
+                e for f, es in self._index.calls.items() if f.name == callee for e in es
+            )
+        )
+
+    def names(self):
+        """Return the set of all names bound or used in the procedure"""
+        return set(self._index.names)
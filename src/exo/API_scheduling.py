@@ -1,13 +1,17 @@
 # import ast as pyast
+import ast
 import functools
+import hashlib
 import inspect
+import os
 import re
 
 # import types
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Any, List, Tuple
 
-from .API import Procedure
+from .API import Procedure, _compose_forwards
 import exo.API_cursors as PC
 from .core.LoopIR import LoopIR, T
 import exo.rewrite.LoopIR_scheduling as scheduling
@@ -19,6 +23,15 @@ from .core.memory import Memory
 from .frontend.parse_fragment import parse_fragment
 from .core.prelude import *
 from .core import internal_cursors as ic
+from .core.caches import register_cache, LRUCache, WeakIdCache
+from .core.configs import reverse_config_lookup
+from .core.extern import Extern
+from .core.LoopIR import get_readconfigs, get_writeconfigs
+from .core.LoopIR_hash import AlphaKey, alpha_map, rename as alpha_rename
+from .core.LoopIR_serialize import dumps_procs, loads_procs, SerializationError
+from .backend.LoopIR_compiler import find_all_subprocs
+from .rewrite.new_eff import SchedulingError
+from .rewrite.smt_budget import SMTTimeout
 
 
 def is_subclass_obj(x, cls):
@@ -97,6 +110,8 @@ class AtomicSchedulingOp:
             bargs[nm] = argp(bargs[nm], bargs)
 
         # invoke the scheduling function with the modified arguments
+        if _schedule_cache.enabled:
+            return _schedule_cache.call(self, bound_args)
         return self.func(*bound_args.args, **bound_args.kwargs)
 
 
@@ -132,6 +147,443 @@ def is_atomic_scheduling_op(x):
     return isinstance(x, AtomicSchedulingOp)
 
 
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Memoization of Atomic Scheduling Operations
+
+# Libraries of kernels run the same schedules on every build.  Once
+# enabled with `enable_schedule_cache`, the result of every atomic
+# scheduling operation is remembered, and applying the same operation to
+# an alpha-equivalent procedure, with the same arguments, returns it
+# without re-running the operation.  So are the scheduling errors it
+# raises, unless they are due to the SMT solver running out of time.
+#
+# The arguments are normalized before being compared: cursors by their
+# path in the procedure, and nodes of LoopIR by their structure, with
+# symbols compared by name (which, for alpha-equivalent procedures, is
+# the same as comparing them up to the renaming).  Other procedures
+# passed as arguments are compared by identity.  Operations called with
+# arguments of any other kind are not memoized.
+#
+# A cached result is renamed to the symbols (and source locations) of
+# the procedure it is requested for, and records the same equivalence
+# with it.  Cursors are forwarded by the forwarding function of the
+# original call; since cursors are paths, they can be moved between
+# alpha-equivalent procedures.
+#
+# If a directory is given, results are also saved there (see
+# `core/LoopIR_serialize.py`), so that later runs can load them.  A
+# result is named by a digest of the version of Exo, the operation, its
+# arguments and its input procedure, so that results saved by another
+# version (whose operations may behave differently) are never loaded.
+# Serializing every input to get its digest would be
+# slow, so the digest of a procedure produced by an operation is the
+# digest of that call instead.  Only the result is saved, with the input
+# as its `base`.  The procedures called and the configs used by the input
+# are saved by name, and resolved when loading.
+#
+# Forwarding functions cannot be saved.  Instead, every cursor forwarded
+# through a result is appended to a trace next to it, so that the same
+# build, running again, finds all of its cursors there.  Other cursors
+# are forwarded by running the operation again.
+#
+# Loading a saved result still deserializes it and resolves the
+# procedures and configs it refers to, so a build running from saved
+# results is only a few times (about 2-3x) faster than without the cache,
+# while the run saving them is somewhat slower, since it serializes every
+# result.
+
+SCHEDULE_CACHE_SIZE = 256
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+class _ScheduleKey:
+    """
+    Normalizes the arguments of a call to an atomic scheduling operation
+    on `proc`, and collects the global objects they refer to
+    """
+
+    def __init__(self, proc):
+        self.proc = proc
+        self.procs = []
+        self.configs = []
+
+    def arg(self, val):
+        if val is None or isinstance(val, (bool, int, float, str)):
+            # keep the type, since e.g. `1 == True`
+            return type(val).__name__, val
+        elif isinstance(val, (list, tuple)):
+            return type(val).__name__, tuple(self.arg(x) for x in val)
+        elif isinstance(val, dict):
+            items = sorted((repr(k), self.arg(v)) for k, v in val.items())
+            return "dict", tuple(items)
+        elif isinstance(val, Procedure):
+            self.procs.append(val._loopir_proc)
+            return "proc", val._loopir_proc
+        elif isinstance(val, PC.Cursor):
+            if val._proc is not self.proc:
+                raise _Uncacheable()
+            return type(val).__name__, ic.cursor_key(val._impl)
+        elif isinstance(val, Sym):
+            return "sym", val.name()
+        elif isinstance(val, (LoopIR.expr, LoopIR.type, LoopIR.w_access)):
+            fields = [f for f in type(val).__annotations__ if f != "srcinfo"]
+            return type(val).__name__, tuple(self.arg(getattr(val, f)) for f in fields)
+        elif is_subclass_obj(val, Memory):
+            return "memory", f"{val.__module__}.{val.__qualname__}"
+        elif isinstance(val, Config):
+            self.configs.append(val)
+            return "config", val.name()
+        elif isinstance(val, Extern):
+            return "extern", val.name()
+        else:
+            raise _Uncacheable()
+
+
+@dataclass
+class _Schedule:
+    # the result `output` of an operation applied to `input`
+    input: LoopIR.proc
+    output: LoopIR.proc
+    forward: Any  # None, if loaded from disk
+    mod_config: frozenset
+    trace: dict  # cursor key -> forwarded cursor key, or error message
+    trace_file: Any = None
+    # the procedure `forward` applies to
+    forward_src: Any = None
+
+    def __post_init__(self):
+        self.forward_src = self.input
+
+    def apply(self, proc, op, bound_args):
+        ir = proc._loopir_proc
+        if ir is self.input and self.trace_file is None:
+            return Procedure(
+                self.output,
+                _provenance_eq_Procedure=proc,
+                _forward=self.forward,
+                _mod_config=self.mod_config,
+            )
+
+        out = self.output
+        if ir is not self.input:
+            out = alpha_rename(out, alpha_map(self.input, ir))
+        return Procedure(
+            out,
+            _provenance_eq_Procedure=proc,
+            _forward=lambda cursor: self.forward_at(cursor, out, op, bound_args),
+            _mod_config=self.mod_config,
+        )
+
+    def forward_at(self, cursor, out, op, bound_args):
+        key = ic.cursor_key(cursor)
+        if (fwd := self.trace.get(key)) is None:
+            if self.forward is None:
+                # re-run the operation to get a forwarding function
+                result = op.func(*bound_args.args, **bound_args.kwargs)
+                self.forward, _ = _derivation(bound_args.arguments["proc"], result)
+                self.forward_src = cursor._root
+            try:
+                fwd = ic.cursor_key(self.forward(ic.cursor_at(key, self.forward_src)))
+            except ic.InvalidCursorError as err:
+                fwd = str(err)
+            self.trace[key] = fwd
+            if self.trace_file is not None:
+                with open(self.trace_file, "a") as f:
+                    f.write(repr((key, fwd)) + "\n")
+        if isinstance(fwd, str):
+            raise ic.InvalidCursorError(fwd)
+        return ic.cursor_at(fwd, out)
+
+
+@dataclass
+class _Failure:
+    # the error an operation raised, as (class, message, keyword arguments)
+    error: tuple
+
+    @staticmethod
+    def of(err):
+        """
+        The failure to remember for the error `err`, if `err` is due to the
+        arguments of the operation, and not to running out of time
+        """
+        cause, seen = err, set()
+        while cause is not None and id(cause) not in seen:
+            if isinstance(cause, SMTTimeout):
+                return None
+            seen.add(id(cause))
+            cause = cause.__cause__ or cause.__context__
+
+        if type(err) is SchedulingError:
+            msg, kwargs = err._orig_args
+            kwargs = {nm: str(blob) for nm, blob in kwargs.items()}
+            return _Failure((SchedulingError, str(msg), kwargs))
+        elif type(err) is UnificationError:
+            return _Failure((UnificationError, err._err_msg, dict()))
+        elif type(err) is ic.InvalidCursorError:
+            return _Failure((ic.InvalidCursorError, str(err), dict()))
+        return None
+
+    def apply(self, proc, op, bound_args):
+        cls, msg, kwargs = self.error
+        raise cls(msg, **kwargs)
+
+
+class _ScheduleCache:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.memo = LRUCache(SCHEDULE_CACHE_SIZE)
+        # digests of procedures, see above
+        self.digests = WeakIdCache()
+
+    @property
+    def hits(self):
+        return self.memo.hits
+
+    @property
+    def misses(self):
+        return self.memo.misses
+
+    def __len__(self):
+        return len(self.memo)
+
+    def clear(self):
+        self.memo.clear()
+        self.digests.clear()
+
+    def call(self, op, bound_args):
+        proc = bound_args.arguments["proc"]
+        ir = proc._loopir_proc
+        key = _ScheduleKey(proc)
+        try:
+            args = tuple(
+                (nm, key.arg(val))
+                for nm, val in bound_args.arguments.items()
+                if nm != "proc"
+            )
+        except _Uncacheable:
+            return op.func(*bound_args.args, **bound_args.kwargs)
+
+        if self.path is None:
+            memo_key = (op.func, AlphaKey(ir), args)
+            entry = self.memo.get(memo_key)
+        else:
+            # with a directory, procedures are identified by their digests
+            memo_key = self.digest(op, ir, args)
+            file = self.path / memo_key
+            if (entry := self.memo.get(memo_key)) is None:
+                if entry := _load_schedule(file, ir, key):
+                    self.memo.put(memo_key, entry)
+
+        if entry is None:
+            try:
+                result = op.func(*bound_args.args, **bound_args.kwargs)
+            except Exception as err:
+                if failure := _Failure.of(err):
+                    self.memo.put(memo_key, failure)
+                    if self.path is not None:
+                        _save_failure(file, failure)
+                raise
+            if (derived := _derivation(proc, result)) is None:
+                return result
+            entry = _Schedule(ir, result._loopir_proc, *derived, dict())
+            self.memo.put(memo_key, entry)
+            if self.path is None:
+                return result
+            if _save_schedule(file, entry, key):
+                entry.trace_file = file.with_suffix(".fwd")
+
+        result = entry.apply(proc, op, bound_args)
+        if self.path is not None:
+            self.digests.put(result._loopir_proc, memo_key)
+        return result
+
+    def digest(self, op, ir, args):
+        h = hashlib.sha256()
+        h.update(f"exo {_exo_version()}\n".encode())
+        h.update(f"{op.func.__module__}.{op.func.__qualname__}".encode())
+        h.update(self.proc_digest(ir).encode())
+        h.update(repr(self.stable(args)).encode())
+        return h.hexdigest()
+
+    def proc_digest(self, ir):
+        if (digest := self.digests.get(ir)) is None:
+            data = dumps_procs([ir], srcinfo=False)
+            digest = hashlib.sha256(data).hexdigest()
+            self.digests.put(ir, digest)
+        return digest
+
+    def stable(self, val):
+        # replace procedures by their digests
+        if isinstance(val, tuple):
+            return tuple(self.stable(x) for x in val)
+        elif isinstance(val, LoopIR.proc):
+            return self.proc_digest(val)
+        return val
+
+
+def _derivation(proc, result):
+    """
+    The forwarding function from `proc` to `result`, and the configs
+    modified on the way, if `result` was derived from `proc`; operations
+    such as `simplify` derive it through intermediate procedures
+    """
+    if not isinstance(result, Procedure):
+        return None
+    fwds, mod_config = [], set()
+    p = result
+    while p is not proc:
+        if p._provenance_eq_Procedure is None or p._depth <= proc._depth:
+            return None
+        fwds.append(p._forward)
+        mod_config |= p._mod_config
+        p = p._provenance_eq_Procedure
+    if not fwds:
+        return None
+    return _compose_forwards(fwds), frozenset(mod_config)
+
+
+def _exo_version():
+    # exo/__init__.py imports this module before defining its version
+    from . import __version__
+
+    return __version__
+
+
+_schedule_cache = register_cache("schedules", _ScheduleCache())
+
+
+def enable_schedule_cache(path=None):
+    """
+    Remember the results of atomic scheduling operations, and return
+    them when an operation is applied to the same procedure with the same
+    arguments again.  If `path` is given, results are also saved to (and
+    loaded from) that directory, which is created if needed.  Saving
+    results makes the first run slower, and later runs load them only a
+    few times faster than running the operations.
+    """
+    _schedule_cache.enabled = True
+    _schedule_cache.path = None
+    if path is not None:
+        _schedule_cache.path = Path(path)
+        _schedule_cache.path.mkdir(parents=True, exist_ok=True)
+
+
+def disable_schedule_cache():
+    """
+    Stop memoizing atomic scheduling operations, and drop the results
+    kept in memory
+    """
+    _schedule_cache.enabled = False
+    _schedule_cache.path = None
+    _schedule_cache.clear()
+
+
+def _globals(ir, key):
+    """the procedures and configs to refer to by name when saving `ir`"""
+    procs = find_all_subprocs([ir] + key.procs)
+    configs = list(key.configs)
+    for p in procs:
+        for cfg, _ in get_readconfigs(p.body) + get_writeconfigs(p.body):
+            configs.append(cfg)
+    return [p for p in procs if p is not ir] + list(dict.fromkeys(configs))
+
+
+# A saved result is a file holding a header, an empty line and the body.
+# The header is either `result`, followed by the configs modified (see
+# `derive_proc`), one `config.field` per line, and the body is the
+# serialized result; or it is `error`, followed by a line describing the
+# error raised, and the body is empty.
+
+
+def _write_file(file, data):
+    tmp = file.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, file)
+    file.with_suffix(".fwd").unlink(missing_ok=True)
+
+
+def _save_schedule(file, entry, key):
+    try:
+        mod_config = [
+            "{}.{}".format(cfg.name(), field)
+            for cfg, field in map(reverse_config_lookup, entry.mod_config)
+        ]
+        known = _globals(entry.input, key)
+        data = dumps_procs([entry.output], known=known, base=entry.input)
+    except (SerializationError, KeyError):
+        return False
+    _write_file(file, "\n".join(["result"] + mod_config).encode() + b"\n\n" + data)
+    return True
+
+
+# the errors a saved failure may raise, by the name they are saved under;
+# other names are never resolved, since anyone able to write the files
+# could otherwise name any function to call
+_SAVED_ERRORS = {
+    (cls.__module__, cls.__qualname__): cls
+    for cls in (SchedulingError, UnificationError, ic.InvalidCursorError)
+}
+
+
+def _save_failure(file, failure):
+    cls, msg, kwargs = failure.error
+    error = (cls.__module__, cls.__qualname__, msg, kwargs)
+    _write_file(file, f"error\n{error!r}\n\n".encode())
+
+
+def _load_failure(line):
+    module, qualname, msg, kwargs = ast.literal_eval(line)
+    cls = _SAVED_ERRORS[(module, qualname)]
+    if not isinstance(msg, str) or not isinstance(kwargs, dict):
+        raise ValueError("malformed failure")
+    if not all(isinstance(x, str) for x in [*kwargs, *kwargs.values()]):
+        raise ValueError("malformed failure")
+    return _Failure((cls, msg, kwargs))
+
+
+def _load_schedule(file, ir, key):
+    try:
+        head, _, data = file.read_bytes().partition(b"\n\n")
+    except OSError:
+        return None
+    kind, *lines = head.decode().split("\n")
+    if kind == "error":
+        try:
+            return _load_failure(lines[0])
+        except (IndexError, KeyError, TypeError, ValueError, SyntaxError):
+            # not a failure this version saves: run the operation again
+            file.unlink(missing_ok=True)
+            return None
+
+    known = _globals(ir, key)
+    configs = {c.name(): c for c in known if isinstance(c, Config)}
+    try:
+        (output,) = loads_procs(data, known=known, base=ir)
+        mod_config = set()
+        for line in lines:
+            cfg, field = line.split(".")
+            mod_config.add(configs[cfg]._INTERNAL_sym(field))
+    except (SerializationError, KeyError, ValueError):
+        return None
+
+    trace = dict()
+    trace_file = file.with_suffix(".fwd")
+    if trace_file.exists():
+        for line in trace_file.read_text().splitlines():
+            try:
+                cur, fwd = ast.literal_eval(line)
+            except (ValueError, SyntaxError):
+                # e.g. a partly written line
+                continue
+            trace[cur] = fwd
+    return _Schedule(ir, output, None, frozenset(mod_config), trace, trace_file)
+
+
 # --------------------------------------------------------------------------- #
 # --------------------------------------------------------------------------- #
 # Argument Processing
@@ -2,6 +2,8 @@ from .API import (
     Procedure,
     compile_procs,
     compile_procs_to_strings,
+    save_procs,
+    load_procs,
     proc,
     instr,
     config,
@@ -12,6 +14,8 @@ from .frontend.parse_fragment import ParseFragmentError
 from .core.configs import Config
 from .core.memory import Memory, DRAM
 from .core.extern import Extern
+from .core.caches import clear_caches
+from .API_scheduling import enable_schedule_cache, disable_schedule_cache
 
 from . import stdlib
 
@@ -21,6 +25,8 @@ __all__ = [
     "Procedure",
     "compile_procs",
     "compile_procs_to_strings",
+    "save_procs",
+    "load_procs",
     "proc",
     "instr",
     "config",
@@ -30,6 +36,9 @@ __all__ = [
     "DRAM",
     "SchedulingError",
     "ParseFragmentError",
+    "clear_caches",
+    "enable_schedule_cache",
+    "disable_schedule_cache",
     #
     "stdlib",
     "ExoType",
@@ -2,8 +2,9 @@ import re
 from collections import ChainMap, defaultdict
 from typing import Type
 
-from asdl_adt import ADT, validators
+from asdl_adt import validators
 
+from .adt import ADT
 from .extern import Extern
 from .configs import Config
 from .memory import Memory
@@ -541,7 +542,51 @@ from . import LoopIR_pprint
 # Standard Pass Templates for Loop IR
 
 
+def _constructors(sum_type):
+    """the classes of the nodes of the LoopIR sum type `sum_type`"""
+    return [
+        c
+        for c in vars(LoopIR).values()
+        if isinstance(c, type) and issubclass(c, sum_type) and c is not sum_type
+    ]
+
+
+def _dispatch_table(cls, prefix, sum_type):
+    """
+    Map the class of every node of `sum_type` to the method of `cls` named
+    `prefix` followed by the name of that class, where there is one
+    """
+    table = dict()
+    for typ in _constructors(sum_type):
+        if (method := getattr(cls, prefix + typ.__name__, None)) is not None:
+            table[typ] = method
+    return table
+
+
+def _ignore(self, node):
+    return None
+
+
+# The visitors below handle each class of node in a method named after it
+# (e.g. `_map_For` or `_do_BinOp`).  Rather than testing a node against
+# every class in turn, `map_s`, `do_e` and the like look the method up in
+# a table indexed by the node's class.  The tables are built once for
+# every subclass when it is created, so subclasses may override the
+# method for a single class, as well as `map_s`, `do_e` etc. as a whole.
+
+
 class LoopIR_Rewrite:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._build_dispatch_tables()
+
+    @classmethod
+    def _build_dispatch_tables(cls):
+        cls._map_s_table = _dispatch_table(cls, "_map_", LoopIR.stmt)
+        cls._map_e_table = _dispatch_table(cls, "_map_", LoopIR.expr)
+        cls._map_w_table = _dispatch_table(cls, "_map_", LoopIR.w_access)
+        cls._map_t_table = _dispatch_table(cls, "_map_", LoopIR.type)
+
     def apply_proc(self, old):
         return self.map_proc(old) or old
 
@@ -582,7 +627,7 @@ class LoopIR_Rewrite:
             new_preds = [
                 p for p in new_preds if not (isinstance(p, LoopIR.Const) and p.val)
             ]
-            return p.update(
+            return p.fast_update(
                 args=new_args or p.args, preds=new_preds, body=new_body or p.body
             )
 
@@ -590,7 +635,7 @@ class LoopIR_Rewrite:
 
     def map_fnarg(self, a):
         if t := self.map_t(a.type):
-            return a.update(type=t)
+            return a.fast_update(type=t)
 
         return None
 
@@ -601,140 +646,179 @@ class LoopIR_Rewrite:
         return self._map_list(self.map_e, exprs)
 
     def map_s(self, s):
-        if isinstance(s, (LoopIR.Assign, LoopIR.Reduce)):
-            new_type = self.map_t(s.type)
-            new_idx = self.map_exprs(s.idx)
-            new_rhs = self.map_e(s.rhs)
-            if any((new_type, new_idx is not None, new_rhs)):
-                return [
-                    s.update(
-                        type=new_type or s.type,
-                        idx=new_idx or s.idx,
-                        rhs=new_rhs or s.rhs,
-                    )
-                ]
-        elif isinstance(s, (LoopIR.WriteConfig, LoopIR.WindowStmt)):
-            new_rhs = self.map_e(s.rhs)
-            if new_rhs:
-                return [s.update(rhs=new_rhs or s.rhs)]
-        elif isinstance(s, LoopIR.If):
-            new_cond = self.map_e(s.cond)
-            new_body = self.map_stmts(s.body)
-            new_orelse = self.map_stmts(s.orelse)
-            if any((new_cond, new_body is not None, new_orelse is not None)):
-                return [
-                    s.update(
-                        cond=new_cond or s.cond,
-                        body=new_body or s.body,
-                        orelse=new_orelse or s.orelse,
-                    )
-                ]
-        elif isinstance(s, LoopIR.For):
-            new_lo = self.map_e(s.lo)
-            new_hi = self.map_e(s.hi)
-            new_body = self.map_stmts(s.body)
-            if any((new_lo, new_hi, new_body is not None)):
-                return [
-                    s.update(
-                        lo=new_lo or s.lo, hi=new_hi or s.hi, body=new_body or s.body
-                    )
-                ]
-        elif isinstance(s, LoopIR.Call):
-            new_args = self.map_exprs(s.args)
-            if new_args is not None:
-                return [s.update(args=new_args or s.args)]
-        elif isinstance(s, LoopIR.Alloc):
-            new_type = self.map_t(s.type)
-            if new_type:
-                return [s.update(type=new_type or s.type)]
-        elif isinstance(s, LoopIR.Pass):
-            return None
-        else:
+        if (method := self._map_s_table.get(type(s))) is None:
             raise NotImplementedError(f"bad case {type(s)}")
+        return method(self, s)
+
+    def _map_Assign(self, s):
+        new_type = self.map_t(s.type)
+        new_idx = self.map_exprs(s.idx)
+        new_rhs = self.map_e(s.rhs)
+        if any((new_type, new_idx is not None, new_rhs)):
+            return [
+                s.fast_update(
+                    type=new_type or s.type,
+                    idx=new_idx or s.idx,
+                    rhs=new_rhs or s.rhs,
+                )
+            ]
         return None
 
-    def map_e(self, e):
-        if isinstance(e, LoopIR.Read):
-            new_type = self.map_t(e.type)
-            new_idx = self.map_exprs(e.idx)
-            if any((new_type, new_idx is not None)):
-                return e.update(
-                    idx=new_idx or e.idx,
-                    type=new_type or e.type,
-                )
-        elif isinstance(e, LoopIR.BinOp):
-            new_lhs = self.map_e(e.lhs)
-            new_rhs = self.map_e(e.rhs)
-            new_type = self.map_t(e.type)
-            if any((new_lhs, new_rhs, new_type)):
-                return e.update(
-                    lhs=new_lhs or e.lhs,
-                    rhs=new_rhs or e.rhs,
-                    type=new_type or e.type,
-                )
-        elif isinstance(e, LoopIR.Extern):
-            new_type = self.map_t(e.type)
-            new_args = self.map_exprs(e.args)
-            if any((new_type, new_args is not None)):
-                return e.update(
-                    args=new_args or e.args,
-                    type=new_type or e.type,
-                )
-        elif isinstance(e, LoopIR.USub):
-            new_arg = self.map_e(e.arg)
-            new_type = self.map_t(e.type)
-            if any((new_arg, new_type)):
-                return e.update(
-                    arg=new_arg or e.arg,
-                    type=new_type or e.type,
+    _map_Reduce = _map_Assign
+
+    def _map_WriteConfig(self, s):
+        new_rhs = self.map_e(s.rhs)
+        if new_rhs:
+            return [s.fast_update(rhs=new_rhs or s.rhs)]
+        return None
+
+    _map_WindowStmt = _map_WriteConfig
+
+    def _map_If(self, s):
+        new_cond = self.map_e(s.cond)
+        new_body = self.map_stmts(s.body)
+        new_orelse = self.map_stmts(s.orelse)
+        if any((new_cond, new_body is not None, new_orelse is not None)):
+            return [
+                s.fast_update(
+                    cond=new_cond or s.cond,
+                    body=new_body or s.body,
+                    orelse=new_orelse or s.orelse,
                 )
-        elif isinstance(e, LoopIR.WindowExpr):
-            new_idx = self._map_list(self.map_w_access, e.idx)
-            new_type = self.map_t(e.type)
-            if any((new_idx is not None, new_type)):
-                return e.update(
-                    idx=new_idx or e.idx,
-                    type=new_type or e.type,
+            ]
+        return None
+
+    def _map_For(self, s):
+        new_lo = self.map_e(s.lo)
+        new_hi = self.map_e(s.hi)
+        new_body = self.map_stmts(s.body)
+        if any((new_lo, new_hi, new_body is not None)):
+            return [
+                s.fast_update(
+                    lo=new_lo or s.lo, hi=new_hi or s.hi, body=new_body or s.body
                 )
-        elif isinstance(e, LoopIR.ReadConfig):
-            if new_type := self.map_t(e.type):
-                return e.update(type=new_type or e.type)
-        elif isinstance(e, (LoopIR.Const, LoopIR.StrideExpr)):
-            return None
-        else:
+            ]
+        return None
+
+    def _map_Call(self, s):
+        new_args = self.map_exprs(s.args)
+        if new_args is not None:
+            return [s.fast_update(args=new_args or s.args)]
+        return None
+
+    def _map_Alloc(self, s):
+        new_type = self.map_t(s.type)
+        if new_type:
+            return [s.fast_update(type=new_type or s.type)]
+        return None
+
+    _map_Pass = _ignore
+
+    def map_e(self, e):
+        if (method := self._map_e_table.get(type(e))) is None:
             raise NotImplementedError(f"bad case {type(e)}")
+        return method(self, e)
+
+    def _map_Read(self, e):
+        new_type = self.map_t(e.type)
+        new_idx = self.map_exprs(e.idx)
+        if any((new_type, new_idx is not None)):
+            return e.fast_update(
+                idx=new_idx or e.idx,
+                type=new_type or e.type,
+            )
         return None
 
+    def _map_BinOp(self, e):
+        new_lhs = self.map_e(e.lhs)
+        new_rhs = self.map_e(e.rhs)
+        new_type = self.map_t(e.type)
+        if any((new_lhs, new_rhs, new_type)):
+            return e.fast_update(
+                lhs=new_lhs or e.lhs,
+                rhs=new_rhs or e.rhs,
+                type=new_type or e.type,
+            )
+        return None
+
+    def _map_Extern(self, e):
+        new_type = self.map_t(e.type)
+        new_args = self.map_exprs(e.args)
+        if any((new_type, new_args is not None)):
+            return e.fast_update(
+                args=new_args or e.args,
+                type=new_type or e.type,
+            )
+        return None
+
+    def _map_USub(self, e):
+        new_arg = self.map_e(e.arg)
+        new_type = self.map_t(e.type)
+        if any((new_arg, new_type)):
+            return e.fast_update(
+                arg=new_arg or e.arg,
+                type=new_type or e.type,
+            )
+        return None
+
+    def _map_WindowExpr(self, e):
+        new_idx = self._map_list(self.map_w_access, e.idx)
+        new_type = self.map_t(e.type)
+        if any((new_idx is not None, new_type)):
+            return e.fast_update(
+                idx=new_idx or e.idx,
+                type=new_type or e.type,
+            )
+        return None
+
+    def _map_ReadConfig(self, e):
+        if new_type := self.map_t(e.type):
+            return e.fast_update(type=new_type or e.type)
+        return None
+
+    _map_Const = _ignore
+    _map_StrideExpr = _ignore
+
     def map_w_access(self, w):
-        if isinstance(w, LoopIR.Interval):
-            new_lo = self.map_e(w.lo)
-            new_hi = self.map_e(w.hi)
-            if new_lo or new_hi:
-                return w.update(
-                    lo=new_lo or w.lo,
-                    hi=new_hi or w.hi,
-                )
-        else:
-            if new_pt := self.map_e(w.pt):
-                return w.update(pt=new_pt or w.pt)
+        return self._map_w_table[type(w)](self, w)
+
+    def _map_Interval(self, w):
+        new_lo = self.map_e(w.lo)
+        new_hi = self.map_e(w.hi)
+        if new_lo or new_hi:
+            return w.fast_update(
+                lo=new_lo or w.lo,
+                hi=new_hi or w.hi,
+            )
+        return None
+
+    def _map_Point(self, w):
+        if new_pt := self.map_e(w.pt):
+            return w.fast_update(pt=new_pt or w.pt)
         return None
 
     def map_t(self, t):
-        if isinstance(t, T.Tensor):
-            new_hi = self.map_exprs(t.hi)
-            new_type = self.map_t(t.type)
-            if (new_hi is not None) or new_type:
-                return t.update(hi=new_hi or t.hi, type=new_type or t.type)
-        elif isinstance(t, T.Window):
-            new_src_type = self.map_t(t.src_type)
-            new_as_tensor = self.map_t(t.as_tensor)
-            new_idx = self._map_list(self.map_w_access, t.idx)
-            if new_src_type or new_as_tensor or (new_idx is not None):
-                return t.update(
-                    src_type=new_src_type or t.src_type,
-                    as_tensor=new_as_tensor or t.as_tensor,
-                    idx=new_idx or t.idx,
-                )
+        if (method := self._map_t_table.get(type(t))) is None:
+            return None
+        return method(self, t)
+
+    def _map_Tensor(self, t):
+        new_hi = self.map_exprs(t.hi)
+        new_type = self.map_t(t.type)
+        if (new_hi is not None) or new_type:
+            return t.fast_update(hi=new_hi or t.hi, type=new_type or t.type)
+        return None
+
+    def _map_WindowType(self, t):
+        new_src_type = self.map_t(t.src_type)
+        new_as_tensor = self.map_t(t.as_tensor)
+        new_idx = self._map_list(self.map_w_access, t.idx)
+        if new_src_type or new_as_tensor or (new_idx is not None):
+            return t.fast_update(
+                src_type=new_src_type or t.src_type,
+                as_tensor=new_as_tensor or t.as_tensor,
+                idx=new_idx or t.idx,
+            )
         return None
 
     @staticmethod
@@ -759,7 +843,21 @@ class LoopIR_Rewrite:
         return new_stmts
 
 
+LoopIR_Rewrite._build_dispatch_tables()
+
+
 class LoopIR_Do:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._build_dispatch_tables()
+
+    @classmethod
+    def _build_dispatch_tables(cls):
+        cls._do_s_table = _dispatch_table(cls, "_do_", LoopIR.stmt)
+        cls._do_e_table = _dispatch_table(cls, "_do_", LoopIR.expr)
+        cls._do_w_table = _dispatch_table(cls, "_do_", LoopIR.w_access)
+        cls._do_t_table = _dispatch_table(cls, "_do_", LoopIR.type)
+
     def __init__(self, proc, *args, **kwargs):
         self.proc = proc
 
@@ -775,73 +873,88 @@ class LoopIR_Do:
             self.do_s(s)
 
     def do_s(self, s):
-        styp = type(s)
-        if styp is LoopIR.Assign or styp is LoopIR.Reduce:
-            for e in s.idx:
-                self.do_e(e)
-            self.do_e(s.rhs)
-            self.do_t(s.type)
-        elif styp is LoopIR.WriteConfig:
-            self.do_e(s.rhs)
-        elif styp is LoopIR.WindowStmt:
-            self.do_e(s.rhs)
-        elif styp is LoopIR.If:
-            self.do_e(s.cond)
-            self.do_stmts(s.body)
-            self.do_stmts(s.orelse)
-        elif styp is LoopIR.For:
-            self.do_e(s.lo)
-            self.do_e(s.hi)
-            self.do_stmts(s.body)
-        elif styp is LoopIR.Call:
-            for e in s.args:
-                self.do_e(e)
-        elif styp is LoopIR.Alloc:
-            self.do_t(s.type)
-        else:
-            pass
+        self._do_s_table.get(type(s), _ignore)(self, s)
 
-    def do_e(self, e):
-        etyp = type(e)
-        if etyp is LoopIR.Read:
-            for e in e.idx:
-                self.do_e(e)
-        elif etyp is LoopIR.BinOp:
-            self.do_e(e.lhs)
-            self.do_e(e.rhs)
-        elif etyp is LoopIR.Extern:
-            for a in e.args:
-                self.do_e(a)
-        elif etyp is LoopIR.USub:
-            self.do_e(e.arg)
-        elif etyp is LoopIR.WindowExpr:
-            for w in e.idx:
-                self.do_w_access(w)
-        else:
-            pass
+    def _do_Assign(self, s):
+        for e in s.idx:
+            self.do_e(e)
+        self.do_e(s.rhs)
+        self.do_t(s.type)
+
+    _do_Reduce = _do_Assign
+
+    def _do_WriteConfig(self, s):
+        self.do_e(s.rhs)
 
+    _do_WindowStmt = _do_WriteConfig
+
+    def _do_If(self, s):
+        self.do_e(s.cond)
+        self.do_stmts(s.body)
+        self.do_stmts(s.orelse)
+
+    def _do_For(self, s):
+        self.do_e(s.lo)
+        self.do_e(s.hi)
+        self.do_stmts(s.body)
+
+    def _do_Call(self, s):
+        for e in s.args:
+            self.do_e(e)
+
+    def _do_Alloc(self, s):
+        self.do_t(s.type)
+
+    def do_e(self, e):
+        self._do_e_table.get(type(e), _ignore)(self, e)
         self.do_t(e.type)
 
+    def _do_Read(self, e):
+        for e in e.idx:
+            self.do_e(e)
+
+    def _do_BinOp(self, e):
+        self.do_e(e.lhs)
+        self.do_e(e.rhs)
+
+    def _do_Extern(self, e):
+        for a in e.args:
+            self.do_e(a)
+
+    def _do_USub(self, e):
+        self.do_e(e.arg)
+
+    def _do_WindowExpr(self, e):
+        for w in e.idx:
+            self.do_w_access(w)
+
     def do_w_access(self, w):
-        if isinstance(w, LoopIR.Interval):
-            self.do_e(w.lo)
-            self.do_e(w.hi)
-        elif isinstance(w, LoopIR.Point):
-            self.do_e(w.pt)
-        else:
-            assert False, "bad case"
+        method = self._do_w_table.get(type(w))
+        assert method is not None, "bad case"
+        method(self, w)
+
+    def _do_Interval(self, w):
+        self.do_e(w.lo)
+        self.do_e(w.hi)
+
+    def _do_Point(self, w):
+        self.do_e(w.pt)
 
     def do_t(self, t):
-        if isinstance(t, T.Tensor):
-            for i in t.hi:
-                self.do_e(i)
-        elif isinstance(t, T.Window):
-            self.do_t(t.src_type)
-            self.do_t(t.as_tensor)
-            for w in t.idx:
-                self.do_w_access(w)
-        else:
-            pass
+        self._do_t_table.get(type(t), _ignore)(self, t)
+
+    def _do_Tensor(self, t):
+        for i in t.hi:
+            self.do_e(i)
+
+    def _do_WindowType(self, t):
+        self.do_t(t.src_type)
+        self.do_t(t.as_tensor)
+        for w in t.idx:
+            self.do_w_access(w)
+
+
+LoopIR_Do._build_dispatch_tables()
 
 
 class LoopIR_Compare:
@@ -1170,13 +1283,13 @@ class Alpha_Rename(LoopIR_Rewrite):
     def map_fnarg(self, fa):
         nm = fa.name.copy()
         self.env[fa.name] = nm
-        return fa.update(name=nm, type=self.map_t(fa.type) or fa.type)
+        return fa.fast_update(name=nm, type=self.map_t(fa.type) or fa.type)
 
     def map_s(self, s):
         if isinstance(s, (LoopIR.Assign, LoopIR.Reduce)):
             s2 = super().map_s(s)
             if new_name := self.env.get(s.name):
-                return [((s2 and s2[0]) or s).update(name=new_name)]
+                return [((s2 and s2[0]) or s).fast_update(name=new_name)]
             else:
                 return s2
         elif isinstance(s, LoopIR.Alloc):
@@ -1184,12 +1297,12 @@ class Alpha_Rename(LoopIR_Rewrite):
             assert s.name not in self.env
             new_name = s.name.copy()
             self.env[s.name] = new_name
-            return [((s2 and s2[0]) or s).update(name=new_name)]
+            return [((s2 and s2[0]) or s).fast_update(name=new_name)]
         elif isinstance(s, LoopIR.WindowStmt):
             rhs = self.map_e(s.rhs) or s.rhs
             name = s.name.copy()
             self.env[s.name] = name
-            return [s.update(name=name, rhs=rhs)]
+            return [s.fast_update(name=name, rhs=rhs)]
         elif isinstance(s, LoopIR.If):
             self.push()
             stmts = super().map_s(s)
@@ -1205,7 +1318,7 @@ class Alpha_Rename(LoopIR_Rewrite):
             body = self.map_stmts(s.body) or s.body
             self.pop()
 
-            return [s.update(iter=itr, lo=lo, hi=hi, body=body)]
+            return [s.fast_update(iter=itr, lo=lo, hi=hi, body=body)]
 
         return super().map_s(s)
 
@@ -1213,7 +1326,7 @@ class Alpha_Rename(LoopIR_Rewrite):
         if isinstance(e, (LoopIR.Read, LoopIR.WindowExpr, LoopIR.StrideExpr)):
             e2 = super().map_e(e)
             if new_name := self.env.get(e.name):
-                return (e2 or e).update(name=new_name)
+                return (e2 or e).fast_update(name=new_name)
             else:
                 return e2
 
@@ -1224,7 +1337,7 @@ class Alpha_Rename(LoopIR_Rewrite):
 
         if isinstance(t, T.Window):
             if src_buf := self.env.get(t.src_buf):
-                return (t2 or t).update(src_buf=src_buf)
+                return (t2 or t).fast_update(src_buf=src_buf)
 
         return t2
 
@@ -1257,7 +1370,7 @@ class SubstArgs(LoopIR_Rewrite):
             if s.name in self.env:
                 sym = self.env[s.name]
                 assert isinstance(sym, LoopIR.Read) and len(sym.idx) == 0
-                return [s_new.update(name=sym.name)]
+                return [s_new.fast_update(name=sym.name)]
 
         return s2
 
@@ -1271,7 +1384,7 @@ class SubstArgs(LoopIR_Rewrite):
                     return sub_e
 
                 assert isinstance(sub_e, LoopIR.Read) and len(sub_e.idx) == 0
-                return e.update(name=sub_e.name, idx=self.apply_exprs(e.idx))
+                return e.fast_update(name=sub_e.name, idx=self.apply_exprs(e.idx))
 
         elif isinstance(e, LoopIR.WindowExpr):
             if e.name in self.env:
@@ -1281,11 +1394,11 @@ class SubstArgs(LoopIR_Rewrite):
                     return sub_e
 
                 assert isinstance(sub_e, LoopIR.Read) and len(sub_e.idx) == 0
-                return (super().map_e(e) or e).update(name=sub_e.name)
+                return (super().map_e(e) or e).fast_update(name=sub_e.name)
 
         elif isinstance(e, LoopIR.StrideExpr):
             if e.name in self.env:
-                return e.update(name=self.env[e.name].name)
+                return e.fast_update(name=self.env[e.name].name)
 
         return super().map_e(e)
 
@@ -1294,7 +1407,7 @@ class SubstArgs(LoopIR_Rewrite):
 
         if isinstance(t, T.Window):
             if src_buf := self.env.get(t.src_buf):
-                return (t2 or t).update(src_buf=src_buf.name)
+                return (t2 or t).fast_update(src_buf=src_buf.name)
 
         return t2
 
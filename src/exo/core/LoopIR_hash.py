@@ -0,0 +1,224 @@
+from functools import lru_cache
+
+from .LoopIR import LoopIR
+from .caches import register_cache, WeakIdCache
+from .prelude import Sym
+
+# This file implements structural hashing and comparison of LoopIR.
+#
+# LoopIR nodes compare by value, but hash by identity (procs) or cannot
+# be hashed at all (nodes holding lists).  Comparing two procs by value
+# walks both of them in full, and caches keyed on procs miss whenever
+# scheduling produces a new proc equal to one seen before.
+#
+# `struct_hash` computes a hash that ignores source locations and the
+# identity of symbols (only their names are hashed), so that it is
+# invariant under alpha-renaming.  The hashes of procs and statements
+# are cached; since rewrites share all unchanged sub-trees of a proc,
+# re-hashing a rewritten proc only visits the statements along the
+# rewritten paths.
+#
+# `alpha_eq` decides whether two procs are equal up to a consistent
+# renaming of their symbols (preserving the names, as `Alpha_Rename`
+# does), and `AlphaKey` wraps a proc so that it can be used as the key
+# of a cache shared by all alpha-equivalent procs.
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Structural hashing
+
+
+@lru_cache(maxsize=None)
+def _fields(cls):
+    return tuple(f for f in cls.__annotations__ if f != "srcinfo")
+
+
+# procs and statements are nodes with a cached hash
+_hashes = register_cache("struct_hash", WeakIdCache())
+
+
+def struct_hash(node):
+    """
+    A hash of `node` which ignores source locations and the identity of
+    symbols, so that alpha-equivalent nodes hash alike
+    """
+    if isinstance(node, (LoopIR.proc, LoopIR.stmt)):
+        if (h := _hashes.get(node)) is None:
+            h = _hash_node(node)
+            _hashes.put(node, h)
+        return h
+    return _hash_val(node)
+
+
+def _hash_node(node):
+    return hash(
+        (type(node).__name__,)
+        + tuple(_hash_val(getattr(node, f)) for f in _fields(type(node)))
+    )
+
+
+def _hash_val(val):
+    if isinstance(val, Sym):
+        return hash(val.name())
+    elif isinstance(val, list):
+        return hash(tuple(_hash_val(x) for x in val))
+    elif isinstance(val, (LoopIR.proc, LoopIR.stmt)):
+        return struct_hash(val)
+    elif isinstance(val, (LoopIR.expr, LoopIR.w_access, LoopIR.type, LoopIR.fnarg)):
+        return _hash_node(val)
+    elif isinstance(val, (LoopIR.loop_mode, LoopIR.instr)):
+        return _hash_node(val)
+    elif isinstance(val, (int, float, bool, str)) or val is None:
+        return hash(val)
+    else:
+        # memories, configs and externs are compared by identity
+        return id(val)
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Alpha-equivalence
+
+
+def alpha_eq(p1, p2):
+    """
+    Returns True if the procs `p1` and `p2` are equal up to a consistent,
+    name-preserving renaming of their symbols (ignoring source locations)
+    """
+    if p1 is p2:
+        return True
+    if struct_hash(p1) != struct_hash(p2):
+        return False
+    return _AlphaEq().node(p1, p2)
+
+
+class _AlphaEq:
+    def __init__(self):
+        self.fwd = dict()
+        self.bwd = dict()
+        self.procs = dict()
+        self.srcinfos = None
+
+    def sym(self, x, y):
+        if x.name() != y.name():
+            return False
+        if self.fwd.setdefault(x, y) is not y:
+            return False
+        return self.bwd.setdefault(y, x) is x
+
+    def node(self, a, b):
+        if type(a) is not type(b):
+            return False
+        if self.srcinfos is not None and hasattr(a, "srcinfo"):
+            self.srcinfos[a.srcinfo] = b.srcinfo
+        return all(self.val(getattr(a, f), getattr(b, f)) for f in _fields(type(a)))
+
+    def val(self, a, b):
+        # shared sub-trees are walked all the same, since the symbols
+        # occurring in them constrain the renaming
+        if isinstance(a, Sym):
+            return isinstance(b, Sym) and self.sym(a, b)
+        elif isinstance(a, list):
+            return (
+                isinstance(b, list)
+                and len(a) == len(b)
+                and all(self.val(x, y) for x, y in zip(a, b))
+            )
+        elif isinstance(a, LoopIR.proc):
+            # sub-procedures have their own symbols
+            if isinstance(b, LoopIR.proc) and alpha_eq(a, b):
+                self.procs[a] = b
+                return True
+            return False
+        elif isinstance(a, (LoopIR.stmt, LoopIR.expr, LoopIR.w_access)):
+            return self.node(a, b)
+        elif isinstance(a, (LoopIR.type, LoopIR.fnarg, LoopIR.loop_mode)):
+            return self.node(a, b)
+        elif isinstance(a, LoopIR.instr):
+            return self.node(a, b)
+        elif isinstance(a, (int, float, bool, str)) or a is None:
+            return type(a) is type(b) and a == b
+        else:
+            return a is b
+
+
+class AlphaKey:
+    """
+    Wraps a proc for use as a dictionary key, such that all
+    alpha-equivalent procs find the same entry
+    """
+
+    __slots__ = ("proc", "_hash")
+
+    def __init__(self, proc):
+        assert isinstance(proc, LoopIR.proc)
+        self.proc = proc
+        self._hash = struct_hash(proc)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return isinstance(other, AlphaKey) and alpha_eq(self.proc, other.proc)
+
+
+def alpha_sym_map(src, dst):
+    """
+    Returns the renaming of symbols mapping the proc `src` onto the
+    alpha-equivalent proc `dst`
+    """
+    eq = _AlphaEq()
+    ok = eq.node(src, dst)
+    assert ok, "expected alpha-equivalent procs"
+    return eq.fwd
+
+
+def alpha_map(src, dst):
+    """
+    Like `alpha_sym_map`, but the mapping also sends every procedure
+    called by `src` to the (alpha-equivalent) one called by `dst`, and
+    the source locations of `src` to those of `dst`
+    """
+    eq = _AlphaEq()
+    eq.srcinfos = dict()
+    ok = eq.node(src, dst)
+    assert ok, "expected alpha-equivalent procs"
+    return {**eq.fwd, **eq.procs, **eq.srcinfos}
+
+
+def rename(proc, mapping):
+    """
+    Copy `proc`, replacing the symbols, called procedures and source
+    locations which are keys of `mapping`.  Unchanged sub-trees are
+    shared with `proc`.
+    """
+    return _rename_node(proc, mapping)
+
+
+def _rename_node(node, mapping):
+    changed = dict()
+    if (info := getattr(node, "srcinfo", None)) in mapping:
+        changed["srcinfo"] = mapping[info]
+    for f in _fields(type(node)):
+        val = getattr(node, f)
+        if (new := _rename_val(val, mapping)) is not val:
+            changed[f] = new
+    return node.fast_update(**changed) if changed else node
+
+
+def _rename_val(val, mapping):
+    if isinstance(val, (Sym, LoopIR.proc)):
+        # called procedures are not renamed inside
+        return mapping.get(val, val)
+    elif isinstance(val, list):
+        new = [_rename_val(x, mapping) for x in val]
+        if any(x is not y for x, y in zip(val, new)):
+            return new
+        return val
+    elif isinstance(val, (LoopIR.stmt, LoopIR.expr, LoopIR.w_access, LoopIR.type)):
+        return _rename_node(val, mapping)
+    elif isinstance(val, (LoopIR.fnarg, LoopIR.instr)):
+        return _rename_node(val, mapping)
+    else:
+        return val
@@ -0,0 +1,112 @@
+from collections import defaultdict
+
+from .LoopIR import LoopIR
+from .caches import register_cache, WeakIdCache
+
+# This file implements an index of the nodes of a proc, by kind and name.
+#
+# Scheduling scripts look up loops, allocations and accesses by name over
+# and over, and each such lookup used to walk the whole proc (by pattern
+# matching, or by iterating over every cursor).  Procs are immutable, so
+# the index of a proc is built by a single walk the first time it is
+# needed, and is shared by every later lookup into the same proc.
+#
+# Each entry is a list of `(path, node)` pairs, where `path` is the path of
+# the node from the root of the proc, as in `internal_cursors.Node`.  The
+# entries are in the order in which pattern matching finds the nodes
+# (pre-order, visiting the expressions of a statement before its body), so
+# that the n-th entry is the n-th match of the corresponding pattern.
+
+
+class ProcIndex:
+    def __init__(self, proc):
+        assert isinstance(proc, LoopIR.proc)
+        self.loops = defaultdict(list)  # iteration variable -> For
+        self.allocs = defaultdict(list)  # buffer -> Alloc
+        self.reads = defaultdict(list)  # buffer -> Read, WindowExpr
+        self.writes = defaultdict(list)  # buffer -> Assign, Reduce
+        self.calls = defaultdict(list)  # callee -> Call
+        self.stmts = defaultdict(list)  # statement class -> statements
+        # every name bound or used in the proc
+        self.names = {str(a.name) for a in proc.args}
+
+        self.do_stmts(proc.body, "body")
+        tables = (self.loops, self.allocs, self.reads, self.writes, self.calls)
+        for d in tables + (self.stmts,):
+            d.default_factory = None
+
+    def do_stmts(self, stmts, attr, prefix=()):
+        for i, s in enumerate(stmts):
+            path = prefix + ((attr, i),)
+            entry = (path, s)
+            self.stmts[type(s)].append(entry)
+            if isinstance(s, (LoopIR.Assign, LoopIR.Reduce)):
+                self.writes[str(s.name)].append(entry)
+                self.names.add(str(s.name))
+                self.do_exprs(s.idx, "idx", path)
+                self.do_expr(s.rhs, path + (("rhs", None),))
+            elif isinstance(s, LoopIR.WriteConfig):
+                self.do_expr(s.rhs, path + (("rhs", None),))
+            elif isinstance(s, LoopIR.WindowStmt):
+                self.names.add(str(s.name))
+                self.do_expr(s.rhs, path + (("rhs", None),))
+            elif isinstance(s, LoopIR.If):
+                self.do_expr(s.cond, path + (("cond", None),))
+                self.do_stmts(s.body, "body", path)
+                self.do_stmts(s.orelse, "orelse", path)
+            elif isinstance(s, LoopIR.For):
+                self.loops[str(s.iter)].append(entry)
+                self.names.add(str(s.iter))
+                self.do_expr(s.lo, path + (("lo", None),))
+                self.do_expr(s.hi, path + (("hi", None),))
+                self.do_stmts(s.body, "body", path)
+            elif isinstance(s, LoopIR.Alloc):
+                self.allocs[str(s.name)].append(entry)
+                self.names.add(str(s.name))
+            elif isinstance(s, LoopIR.Call):
+                self.calls[s.f].append(entry)
+                self.do_exprs(s.args, "args", path)
+
+    def do_exprs(self, es, attr, prefix):
+        for i, e in enumerate(es):
+            self.do_expr(e, prefix + ((attr, i),))
+
+    def do_expr(self, e, path):
+        if isinstance(e, LoopIR.Read):
+            self.reads[str(e.name)].append((path, e))
+            self.names.add(str(e.name))
+            self.do_exprs(e.idx, "idx", path)
+        elif isinstance(e, LoopIR.WindowExpr):
+            self.reads[str(e.name)].append((path, e))
+            self.names.add(str(e.name))
+            for i, w in enumerate(e.idx):
+                w_path = path + (("idx", i),)
+                if isinstance(w, LoopIR.Interval):
+                    self.do_expr(w.lo, w_path + (("lo", None),))
+                    self.do_expr(w.hi, w_path + (("hi", None),))
+                else:
+                    self.do_expr(w.pt, w_path + (("pt", None),))
+        elif isinstance(e, LoopIR.USub):
+            self.do_expr(e.arg, path + (("arg", None),))
+        elif isinstance(e, LoopIR.BinOp):
+            self.do_expr(e.lhs, path + (("lhs", None),))
+            self.do_expr(e.rhs, path + (("rhs", None),))
+        elif isinstance(e, LoopIR.Extern):
+            self.names.add(e.f.name())
+            self.do_exprs(e.args, "args", path)
+        elif isinstance(e, LoopIR.StrideExpr):
+            self.names.add(str(e.name))
+
+
+_indices = register_cache("proc_index", WeakIdCache())
+
+
+def get_proc_index(proc, build=True):
+    """
+    The `ProcIndex` of `proc`, which is built once per proc.  If `build` is
+    False, return None rather than building it.
+    """
+    if (index := _indices.get(proc)) is None and build:
+        index = ProcIndex(proc)
+        _indices.put(proc, index)
+    return index
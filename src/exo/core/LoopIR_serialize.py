@@ -0,0 +1,480 @@
+import struct
+import zlib
+
+from .LoopIR import LoopIR
+from .configs import Config
+from .extern import Extern
+from .memory import Memory
+from .prelude import Sym, SrcInfo, null_srcinfo
+from .proc_eqv import decl_new_proc
+
+# This file implements a binary format for storing procedures, so that
+# the result of scheduling can be saved by one build step and loaded by a
+# later one without re-running the schedule.
+#
+# A file holds a list of procedures, together with all procedures they
+# call.  It starts with a header
+#
+#   - the magic bytes `EXOP`
+#   - the version of the format (`FORMAT_VERSION`)
+#   - a fingerprint of the LoopIR grammar it was written with
+#   - a CRC32 checksum of the rest of the file
+#
+# Files written with a different version or grammar are rejected, rather
+# than misread.  The rest of the file is a sequence of tagged values (see
+# `_Tag`).  Nodes are written as the index of their class, followed by
+# their fields.  Strings, symbols, source locations and procedures are
+# written once, and referred to by their index afterwards.  Symbols are
+# only written by name: loading creates fresh symbols, consistently for
+# all of their occurrences.
+#
+# Memories, externs and configs are global objects and are written by
+# name.  When loading, they are looked up among the objects passed as
+# `known`; memories and the externs in `exo.libs.externs` are also found
+# without being passed.  Procedures passed as `known` (e.g. a library of
+# instructions) are likewise written by name; all other procedures called
+# are written in full.
+#
+# A procedure is often saved along with another one, which it shares most
+# of its symbols and source locations with (e.g. the input of the
+# scheduling operation which produced it).  That procedure can be passed
+# as `base`: its symbols and source locations are then written as
+# references to it, and resolve to those of the `base` (which must be
+# alpha-equivalent to the one written with) passed when loading.
+
+FORMAT_VERSION = 1
+_MAGIC = b"EXOP"
+_HEADER = struct.Struct("<4sHII")
+
+
+class SerializationError(Exception):
+    pass
+
+
+class _Tag:
+    NONE = 0
+    FALSE = 1
+    TRUE = 2
+    INT = 3
+    FLOAT = 4
+    STR = 5
+    STR_REF = 6
+    SYM = 7
+    SYM_REF = 8
+    LIST = 9
+    NODE = 10
+    MEMORY = 11
+    EXTERN = 12
+    CONFIG = 13
+    PROC = 14
+    PROC_REF = 15
+    PROC_KNOWN = 16
+    SRCINFO = 17
+    SRCINFO_REF = 18
+    NULL_SRCINFO = 19
+
+
+def _node_classes():
+    """the classes of LoopIR nodes, in the order of the grammar"""
+    types = [t for t in vars(LoopIR).values() if isinstance(t, type)]
+    # leave out the sum types, which are the base classes of their nodes
+    return [t for t in types if not any(u is not t and issubclass(u, t) for u in types)]
+
+
+_CLASSES = _node_classes()
+_CLASS_IDX = {cls: i for i, cls in enumerate(_CLASSES)}
+_FIELDS = [tuple(cls.__annotations__) for cls in _CLASSES]
+_FINGERPRINT = zlib.crc32(
+    ";".join(
+        f"{c.__name__}({','.join(fs)})" for c, fs in zip(_CLASSES, _FIELDS)
+    ).encode()
+)
+
+# nodes without fields (i.e. the scalar types) are unique
+_SINGLETONS = [cls() if not fields else None for cls, fields in zip(_CLASSES, _FIELDS)]
+
+_DOUBLE = struct.Struct("<d")
+
+
+def _named(objs, kind, name_of):
+    named = dict()
+    for obj in objs:
+        name = name_of(obj)
+        if named.setdefault(name, obj) is not obj:
+            raise SerializationError(f"two different {kind}s are named '{name}'")
+    return named
+
+
+def _sort_known(known):
+    procs, memories, externs, configs = [], [], [], []
+    for obj in known:
+        if isinstance(obj, LoopIR.proc):
+            procs.append(obj)
+        elif hasattr(obj, "INTERNAL_proc"):
+            procs.append(obj.INTERNAL_proc())
+        elif isinstance(obj, type) and issubclass(obj, Memory):
+            memories.append(obj)
+        elif isinstance(obj, Extern):
+            externs.append(obj)
+        elif isinstance(obj, Config):
+            configs.append(obj)
+        else:
+            raise TypeError(f"cannot refer to {obj!r} by name")
+    return (
+        _named(procs, "procedure", lambda p: str(p.name)),
+        _named(memories, "memory", lambda m: m.name()),
+        _named(externs, "extern", lambda e: e.name()),
+        _named(configs, "config", lambda c: c.name()),
+    )
+
+
+def _base_tables(base):
+    """
+    The symbols and source locations occurring in the proc `base` (but
+    not in the procedures it calls), in the order they are first found
+    """
+    syms, srcinfos = dict(), dict()
+
+    def visit(val):
+        if isinstance(val, Sym):
+            syms.setdefault(val, len(syms))
+        elif isinstance(val, list):
+            for x in val:
+                visit(x)
+        elif isinstance(val, SrcInfo):
+            if val is not null_srcinfo():
+                srcinfos.setdefault(id(val), (len(srcinfos), val))
+        elif type(val) in _CLASS_IDX and not isinstance(val, LoopIR.proc):
+            walk(val)
+
+    def walk(node):
+        for f in _FIELDS[_CLASS_IDX[type(node)]]:
+            visit(getattr(node, f))
+
+    if base is not None:
+        walk(base)
+    return syms, srcinfos
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Writing
+
+
+class _Writer:
+    def __init__(self, known, srcinfo, base):
+        procs, _, _, _ = _sort_known(known)
+        self.known_procs = {id(p): name for name, p in procs.items()}
+        self.keep_srcinfo = srcinfo
+        self.out = bytearray()
+        self.strings = dict()
+        self.syms, base_srcinfos = _base_tables(base)
+        self.base_srcinfos = {i: idx for i, (idx, _) in base_srcinfos.items()}
+        self.srcinfos = dict()
+        self.procs = dict()
+
+    def uint(self, n):
+        out = self.out
+        while n >= 0x80:
+            out.append((n & 0x7F) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def string(self, s):
+        s = str(s)
+        if (idx := self.strings.get(s)) is not None:
+            self.out.append(_Tag.STR_REF)
+            self.uint(idx)
+        else:
+            self.strings[s] = len(self.strings)
+            data = s.encode()
+            self.out.append(_Tag.STR)
+            self.uint(len(data))
+            self.out += data
+
+    def srcinfo(self, info):
+        if not self.keep_srcinfo or info is null_srcinfo():
+            self.out.append(_Tag.NULL_SRCINFO)
+            return
+        if (idx := self.base_srcinfos.get(id(info))) is not None:
+            self.out.append(_Tag.SRCINFO_REF)
+            self.uint(idx)
+            return
+        key = (
+            info.filename,
+            info.lineno,
+            info.col_offset,
+            info.end_lineno,
+            info.end_col_offset,
+            info.function,
+        )
+        if (idx := self.srcinfos.get(key)) is not None:
+            self.out.append(_Tag.SRCINFO_REF)
+            self.uint(idx)
+        else:
+            self.srcinfos[key] = len(self.base_srcinfos) + len(self.srcinfos)
+            self.out.append(_Tag.SRCINFO)
+            for v in key:
+                self.value(v)
+
+    def proc(self, p):
+        if (name := self.known_procs.get(id(p))) is not None:
+            self.out.append(_Tag.PROC_KNOWN)
+            self.string(name)
+        elif (idx := self.procs.get(id(p))) is not None:
+            self.out.append(_Tag.PROC_REF)
+            self.uint(idx)
+        else:
+            self.out.append(_Tag.PROC)
+            self.node(p)
+            # indices are assigned once a procedure is complete, as when
+            # reading it back
+            self.procs[id(p)] = len(self.procs)
+
+    def node(self, node):
+        cls = type(node)
+        self.uint(_CLASS_IDX[cls])
+        for f in _FIELDS[_CLASS_IDX[cls]]:
+            self.value(getattr(node, f))
+
+    def value(self, v):
+        out = self.out
+        if v is None:
+            out.append(_Tag.NONE)
+        elif v is True or v is False:
+            out.append(_Tag.TRUE if v else _Tag.FALSE)
+        elif isinstance(v, int):
+            out.append(_Tag.INT)
+            self.uint((v << 1) if v >= 0 else ((-v << 1) - 1))
+        elif isinstance(v, float):
+            out.append(_Tag.FLOAT)
+            out += _DOUBLE.pack(v)
+        elif isinstance(v, str):
+            self.string(v)
+        elif isinstance(v, Sym):
+            if (idx := self.syms.get(v)) is not None:
+                out.append(_Tag.SYM_REF)
+                self.uint(idx)
+            else:
+                self.syms[v] = len(self.syms)
+                out.append(_Tag.SYM)
+                self.string(v.name())
+        elif isinstance(v, list):
+            out.append(_Tag.LIST)
+            self.uint(len(v))
+            for x in v:
+                self.value(x)
+        elif isinstance(v, LoopIR.proc):
+            self.proc(v)
+        elif type(v) in _CLASS_IDX:
+            out.append(_Tag.NODE)
+            self.node(v)
+        elif isinstance(v, SrcInfo):
+            self.srcinfo(v)
+        elif isinstance(v, type) and issubclass(v, Memory):
+            out.append(_Tag.MEMORY)
+            self.string(v.name())
+        elif isinstance(v, Extern):
+            out.append(_Tag.EXTERN)
+            self.string(v.name())
+        elif isinstance(v, Config):
+            out.append(_Tag.CONFIG)
+            self.string(v.name())
+        else:
+            raise SerializationError(f"cannot serialize {type(v).__name__}: {v!r}")
+
+
+def dumps_procs(procs, known=(), srcinfo=True, base=None):
+    """
+    Serialize the list of LoopIR procedures `procs` into bytes.  The
+    procedures in `known` are referred to by name, rather than written.
+    Source locations are only kept if `srcinfo` is set.  The symbols and
+    source locations of the proc `base` are referred to, rather than
+    written (see the top of this file).
+    """
+    assert all(isinstance(p, LoopIR.proc) for p in procs)
+    w = _Writer(known, srcinfo, base)
+    w.value(list(procs))
+    body = bytes(w.out)
+    header = _HEADER.pack(_MAGIC, FORMAT_VERSION, _FINGERPRINT, zlib.crc32(body))
+    return header + body
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Reading
+
+
+def _all_memories(cls=Memory):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _all_memories(sub)
+
+
+class _Reader:
+    def __init__(self, data, known, base):
+        self.data = data
+        self.pos = _HEADER.size
+        self.known_procs, self.memories, self.externs, self.configs = _sort_known(known)
+        self.strings = []
+        syms, srcinfos = _base_tables(base)
+        self.syms = list(syms)
+        self.srcinfos = [info for _, info in srcinfos.values()]
+        self.procs = []
+
+    def uint(self):
+        data, pos = self.data, self.pos
+        n = shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        self.pos = pos
+        return n
+
+    def tag(self):
+        t = self.data[self.pos]
+        self.pos += 1
+        return t
+
+    def string(self):
+        t = self.tag()
+        if t == _Tag.STR_REF:
+            return self.strings[self.uint()]
+        if t != _Tag.STR:
+            raise SerializationError(f"expected a string, found tag {t}")
+        n = self.uint()
+        s = self.data[self.pos : self.pos + n].decode()
+        self.pos += n
+        self.strings.append(s)
+        return s
+
+    def memory(self, name):
+        if (mem := self.memories.get(name)) is None:
+            found = {m for m in _all_memories() if m.name() == name}
+            if len(found) != 1:
+                raise SerializationError(
+                    f"cannot find the memory '{name}'; pass it as known"
+                )
+            (mem,) = found
+            self.memories[name] = mem
+        return mem
+
+    def extern(self, name):
+        if (ext := self.externs.get(name)) is None:
+            from ..libs import externs
+
+            found = [
+                e
+                for e in vars(externs).values()
+                if isinstance(e, Extern) and e.name() == name
+            ]
+            if len(found) != 1:
+                raise SerializationError(
+                    f"cannot find the extern '{name}'; pass it as known"
+                )
+            ext = self.externs[name] = found[0]
+        return ext
+
+    def lookup(self, table, kind, name):
+        if (obj := table.get(name)) is None:
+            raise SerializationError(
+                f"cannot find the {kind} '{name}'; pass it as known"
+            )
+        return obj
+
+    def node(self):
+        idx = self.uint()
+        if idx >= len(_CLASSES):
+            raise SerializationError(f"bad node class {idx}")
+        if (node := _SINGLETONS[idx]) is not None:
+            return node
+        return _CLASSES[idx](*[self.value() for _ in _FIELDS[idx]])
+
+    def value(self):
+        t = self.tag()
+        # the most frequent tags first
+        if t == _Tag.NODE:
+            return self.node()
+        elif t == _Tag.SYM_REF:
+            return self.syms[self.uint()]
+        elif t == _Tag.LIST:
+            return [self.value() for _ in range(self.uint())]
+        elif t == _Tag.NONE:
+            return None
+        elif t == _Tag.FALSE:
+            return False
+        elif t == _Tag.TRUE:
+            return True
+        elif t == _Tag.INT:
+            n = self.uint()
+            return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+        elif t == _Tag.FLOAT:
+            (v,) = _DOUBLE.unpack_from(self.data, self.pos)
+            self.pos += _DOUBLE.size
+            return v
+        elif t == _Tag.STR or t == _Tag.STR_REF:
+            self.pos -= 1
+            return self.string()
+        elif t == _Tag.SYM:
+            sym = Sym(self.string())
+            self.syms.append(sym)
+            return sym
+        elif t == _Tag.PROC:
+            p = self.node()
+            decl_new_proc(p)
+            self.procs.append(p)
+            return p
+        elif t == _Tag.PROC_REF:
+            return self.procs[self.uint()]
+        elif t == _Tag.PROC_KNOWN:
+            return self.lookup(self.known_procs, "procedure", self.string())
+        elif t == _Tag.SRCINFO:
+            info = SrcInfo(*[self.value() for _ in range(6)])
+            self.srcinfos.append(info)
+            return info
+        elif t == _Tag.SRCINFO_REF:
+            return self.srcinfos[self.uint()]
+        elif t == _Tag.NULL_SRCINFO:
+            return null_srcinfo()
+        elif t == _Tag.MEMORY:
+            return self.memory(self.string())
+        elif t == _Tag.EXTERN:
+            return self.extern(self.string())
+        elif t == _Tag.CONFIG:
+            return self.lookup(self.configs, "config", self.string())
+        else:
+            raise SerializationError(f"bad tag {t}")
+
+
+def loads_procs(data, known=(), base=None):
+    """
+    Load the list of LoopIR procedures serialized by `dumps_procs`.
+    `known` resolves the names of the procedures, configs, memories and
+    externs which were not written in full, and `base` the symbols and
+    source locations of the `base` they were written with.
+    """
+    if len(data) < _HEADER.size:
+        raise SerializationError("not a serialized Exo procedure")
+    magic, version, fingerprint, crc = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise SerializationError("not a serialized Exo procedure")
+    if version != FORMAT_VERSION:
+        raise SerializationError(
+            f"unsupported format version {version} (expected {FORMAT_VERSION})"
+        )
+    if fingerprint != _FINGERPRINT:
+        raise SerializationError("written by a version of Exo with a different IR")
+    if zlib.crc32(memoryview(data)[_HEADER.size :]) != crc:
+        raise SerializationError("corrupted data")
+
+    r = _Reader(data, known, base)
+    try:
+        procs = r.value()
+    except (IndexError, UnicodeDecodeError, TypeError, ValueError) as err:
+        raise SerializationError("truncated or corrupted data") from err
+    assert isinstance(procs, list)
+    return procs
@@ -0,0 +1,264 @@
+import functools
+import inspect
+import os
+import sys
+import textwrap
+import typing
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from types import ModuleType
+from typing import List, Type
+
+import asdl
+import attrs
+from asdl_adt.validators import ValidationError, instance_of, subclass_of
+
+# This file builds the classes of Exo's IRs (LoopIR, UAST, PAST, CIR)
+# from their ASDL descriptions.
+#
+# The classes behave as those built by `asdl_adt.ADT`: they are frozen
+# attrs classes, whose constructors validate every field, and whose
+# `update` copies a node with some fields replaced, validating them as
+# well.  They differ in two ways:
+#
+#   - The common base class of all nodes declares `__slots__`, so that
+#     nodes only store their fields (and a weak reference slot), and no
+#     instance dictionary.  With `asdl_adt`'s base class, every node
+#     carries room for an instance dictionary it never uses.
+#
+#   - Besides `update`, nodes have a `fast_update`, which copies the node
+#     with the given fields replaced but without validating them.
+#
+# Nodes built from outside of Exo (the frontend, user-supplied patterns
+# and procedures) are validated by their constructors and by `update`.
+# Internal rewrite passes, which only ever rebuild nodes from the fields
+# of existing nodes, use `fast_update` instead.  Setting the environment
+# variable `EXO_CHECK_IR` makes `fast_update` validate as well, which
+# helps with debugging passes that produce malformed IR.
+#
+# Only the public parts of `asdl` (the parser) and of `asdl_adt` (its
+# validators) are used, so that other releases of them keep working.
+
+_CHECK_VAR = "EXO_CHECK_IR"
+
+
+class _Node(ABC):
+    __slots__ = ()
+
+    @abstractmethod
+    def __init__(self):  # pragma: no cover (unreachable)
+        assert False, "Should be unreachable."
+
+    def update(self, **kwargs):
+        """
+        Copy this node, with only certain fields changed.  The new values
+        are validated.
+        """
+        return attrs.evolve(self, **kwargs)
+
+    def fast_update(self, **kwargs):
+        """
+        Copy this node, with only certain fields changed.  The new values
+        are not validated; see the comment at the top of `core/adt.py`.
+        """
+        return attrs.evolve(self, **kwargs)
+
+
+def _make_function(name, args, body, **context):
+    # functions are generated from source, since their arguments are
+    # named by the fields of the node
+    body = textwrap.indent("\n".join(body or ["pass"]), " " * 4)
+    exec(f"def {name}({', '.join(args)}):\n{body}", context)
+    return context[name]
+
+
+def _make_validator(point_valid, seq, opt):
+    def validate(val):
+        if val is None and opt:
+            return val
+
+        if seq:
+            if not isinstance(val, list):
+                raise ValidationError(list, type(val))
+            try:
+                return [point_valid(y) for y in val]
+            except ValidationError as err:
+                raise ValidationError(List[err.expected], List[err.actual]) from err
+
+        return point_valid(val)
+
+    return validate
+
+
+def _init_fn(fields):
+    """
+    Make an `__init__` method validating `fields` (name -> validator)
+    """
+    context = dict()
+    body = []
+    for name, validator in fields.items():
+        if validator:
+            context[f"_validate_{name}"] = validator
+            body.append(f"{name} = _validate_{name}({name})")
+        body.append(f"object.__setattr__(self, '{name}', {name})")
+    return _make_function("__init__", ["self"] + list(fields), body, **context)
+
+
+def _cached_new_fn(cls, fields):
+    """
+    Make a `__new__` method returning the same node for the same fields
+    """
+    new = _make_function(
+        "__new__",
+        ["cls"] + list(fields),
+        ["return super(_cls, cls).__new__(cls)"],
+        _cls=cls,
+    )
+    new = functools.lru_cache(maxsize=None)(new)
+    sig = inspect.signature(new)
+
+    @functools.wraps(new)
+    def normalized(*args, **kwargs):
+        # so that positional and keyword arguments share cache entries
+        call = sig.bind(*args, **kwargs)
+        return new(*call.args, **call.kwargs)
+
+    return normalized
+
+
+_KEEP = object()
+
+
+def _fast_update_fn(cls, fields):
+    """
+    Make a `fast_update` method for the (non-memoized) node class `cls`
+    """
+    args = ["self"] + [f"{f}=_KEEP" for f in fields]
+    body = ["node = _new(_cls)"]
+    for f in fields:
+        body.append(f"_set(node, '{f}', self.{f} if {f} is _KEEP else {f})")
+    body.append("return node")
+    return _make_function(
+        "fast_update",
+        args,
+        body,
+        _cls=cls,
+        _new=object.__new__,
+        _set=object.__setattr__,
+        _KEEP=_KEEP,
+    )
+
+
+class _BuildClasses(asdl.VisitorBase):
+    _builtin_types = {
+        "bool": bool,
+        "float": float,
+        "int": int,
+        "object": object,
+        "string": str,
+    }
+
+    def __init__(self, ext_types=None, memoize=None):
+        super().__init__()
+        self.module = None
+        self._memoize = memoize or set()
+        self._type_map = {**self._builtin_types, **(ext_types or {})}
+        self._base_types = dict()
+        self._check_updates = bool(os.environ.get(_CHECK_VAR))
+
+    def _adt_class(self, name, base, fields):
+        # `fields` is a list of names for the classes of sum types, and a
+        # dictionary of validators otherwise
+        members = {
+            "__qualname__": f"{self.module.__name__}.{name}",
+            "__annotations__": {f: None for f in fields},
+        }
+        if not isinstance(fields, list):
+            members["__init__"] = _init_fn(fields)
+        cls = attrs.frozen(init=False)(type(name, (base,), members))
+        if name in self._memoize:
+            cls.__new__ = _cached_new_fn(cls, fields)
+        elif fields and not isinstance(fields, list) and not self._check_updates:
+            cls.fast_update = _fast_update_fn(cls, list(fields))
+        return cls
+
+    def _visit_fields(self, node, attributes=None):
+        validators = OrderedDict()
+        for field in node.fields + (attributes or []):
+            self.visit(field, validators)
+        return validators
+
+    def visitModule(self, mod):
+        self.module = ModuleType(mod.name)
+
+        # the classes of all types are created first, so that validators
+        # can refer to them; products get their `__init__` later
+        for dfn in mod.dfns:
+            fields = []
+            if isinstance(dfn.value, asdl.Product):
+                fields = [f.name for f in dfn.value.fields]
+            base_type = self._adt_class(dfn.name, _Node, fields)
+            setattr(self.module, dfn.name, base_type)
+            self._base_types[dfn.name] = base_type
+            self._type_map[dfn.name] = base_type
+
+        for dfn in mod.dfns:
+            self.visit(dfn)
+
+    def visitType(self, typ):
+        self.visit(typ.value, self._base_types[typ.name])
+
+    def visitProduct(self, prod, base_type):
+        base_type.__init__ = _init_fn(self._visit_fields(prod))
+        base_type.__abstractmethods__ = frozenset(
+            set(base_type.__abstractmethods__) - {"__init__"}
+        )
+        fields = list(base_type.__annotations__)
+        if fields and not self._check_updates:
+            base_type.fast_update = _fast_update_fn(base_type, fields)
+
+    def visitSum(self, sum_node, base_type):
+        for t in sum_node.types:
+            self.visit(t, base_type, sum_node.attributes)
+
+    def visitConstructor(self, cons, base_type, attributes):
+        fields = self._visit_fields(cons, attributes)
+        setattr(self.module, cons.name, self._adt_class(cons.name, base_type, fields))
+
+    def visitField(self, field, fields):
+        point_valid = self._point_validator(field)
+        fields[field.name] = _make_validator(point_valid, field.seq, field.opt)
+
+    def _point_validator(self, field):
+        valid = self._type_map[field.type]
+        if isinstance(valid, type):
+            return instance_of(valid)
+        elif isinstance(valid, type(Type[object])):
+            (typ,) = typing.get_args(valid)
+            return subclass_of(typ)
+        elif callable(valid):
+            return valid
+        raise ValueError(f"Unknown validator type {type(valid)}")
+
+
+def ADT(asdl_str, ext_types=None, memoize=None):
+    """
+    Build a module of compact node classes from an ASDL description.
+    The arguments are as for `asdl_adt.ADT`.
+    """
+    asdl_ast = asdl.ASDLParser().parse(asdl_str)
+    assert isinstance(asdl_ast, asdl.Module)
+
+    if mod := sys.modules.get(asdl_ast.name):
+        return mod
+
+    builder = _BuildClasses(ext_types, memoize)
+    builder.visit(asdl_ast)
+
+    mod = builder.module
+    mod.__doc__ = (
+        "\nASDL Module generated by exo.core.adt\nOriginal ASDL description:\n"
+        + textwrap.dedent(asdl_str)
+    )
+    sys.modules[asdl_ast.name] = mod
+    return mod
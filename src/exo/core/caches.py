@@ -0,0 +1,129 @@
+import weakref
+from collections import OrderedDict
+
+# This file implements the caches shared by Exo's analyses.
+#
+# Scheduling produces a new procedure for every rewrite, and a long
+# search (e.g. autotuning) produces millions of them.  Analyses must not
+# keep all of these alive, so every cache is either
+#
+#   - an `LRUCache`, holding a bounded number of entries, or
+#   - a `WeakIdCache`, keyed on the identity of LoopIR nodes and dropping
+#     an entry as soon as its node is garbage collected.
+#
+# Caches are registered by name, so that `cache_stats` can report their
+# sizes and hit rates, and `clear_caches` can empty all of them at once.
+
+_registry = dict()  # name -> cache
+
+
+def register_cache(name, cache):
+    """
+    Register `cache` (which must support `len` and `clear()`) under `name`
+    """
+    assert name not in _registry, f"cache '{name}' registered twice"
+    _registry[name] = cache
+    return cache
+
+
+def clear_caches():
+    """
+    Drop the contents of all of Exo's analysis caches
+    """
+    for cache in _registry.values():
+        cache.clear()
+
+
+def cache_stats():
+    """
+    Returns a dictionary mapping the name of every registered cache to a
+    dictionary with its current `size`, and the number of `hits` and
+    `misses` since it was last cleared (where the cache counts those)
+    """
+    stats = dict()
+    for name, cache in _registry.items():
+        s = {"size": len(cache)}
+        if hasattr(cache, "hits"):
+            s["hits"] = cache.hits
+            s["misses"] = cache.misses
+        stats[name] = s
+    return stats
+
+
+class LRUCache:
+    """
+    A cache holding at most `maxsize` entries, evicting the least recently
+    used one first.  `get` returns None for missing keys.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, val):
+        self.entries[key] = val
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class WeakIdCache:
+    """
+    A cache keyed on the identity of objects, which drops every entry as
+    soon as its key is garbage collected.  The values must not refer to
+    their keys, or the keys are never collected.  `get` returns None for
+    missing keys.
+    """
+
+    def __init__(self):
+        self._entries = dict()  # id(key) -> (weakref to key, value)
+        self._ref_ids = dict()  # id(weakref) -> id(key)
+        self.hits = 0
+        self.misses = 0
+
+    def _forget(self, ref):
+        if (key_id := self._ref_ids.pop(id(ref), None)) is not None:
+            del self._entries[key_id]
+
+    def get(self, key):
+        entry = self._entries.get(id(key))
+        if entry is not None and entry[0]() is key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, key, val):
+        if (entry := self._entries.get(id(key))) is not None:
+            ref = entry[0]
+        else:
+            ref = weakref.ref(key, self._forget)
+            self._ref_ids[id(ref)] = id(key)
+        self._entries[id(key)] = (ref, val)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._ref_ids.clear()
+        self.hits = 0
+        self.misses = 0
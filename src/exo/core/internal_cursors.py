@@ -8,6 +8,8 @@ from dataclasses import dataclass
 from functools import cached_property
 from typing import Optional
 
+from .caches import register_cache, WeakIdCache
+
 
 class InvalidCursorError(Exception):
     pass
@@ -72,6 +74,28 @@ def forward_identity(p, fwd=None):
     return forward
 
 
+def cursor_key(cur):
+    """a hashable key for the position of `cur` within its root"""
+    if isinstance(cur, Node):
+        return "node", tuple(cur._path)
+    elif isinstance(cur, Block):
+        rng = (cur._range.start, cur._range.stop)
+        return "block", tuple(cur._anchor._path), cur._attr, rng
+    else:
+        assert isinstance(cur, Gap)
+        return "gap", tuple(cur._anchor._path), cur._type.name
+
+
+def cursor_at(key, root):
+    """the inverse of `cursor_key`, for a cursor into `root`"""
+    if key[0] == "node":
+        return Node(root, list(key[1]))
+    anchor = Node(root, list(key[1]))
+    if key[0] == "block":
+        return Block(root, anchor, key[2], range(*key[3]))
+    return Gap(root, anchor, GapType[key[2]])
+
+
 @dataclass
 class Cursor(ABC):
     _root: object
@@ -581,6 +605,39 @@ class Block(Cursor):
         return forward
 
 
+# The nodes at the paths resolved so far, for each root.  Roots are never
+# mutated, so all cursors into the same root share these, and navigating
+# between nearby cursors (e.g. to a parent) is a dictionary lookup.
+_path_index = register_cache("cursor_paths", WeakIdCache())
+
+
+def _resolve_path(root, path):
+    index = _path_index.get(root)
+    if index is None:
+        try:
+            _path_index.put(root, index := {})
+        except TypeError:
+            index = {}  # the root can't be weakly referenced, so don't index
+
+    if (n := index.get(path, _MISSING)) is not _MISSING:
+        return n
+
+    # resolve from the parent if it is indexed, and otherwise from the root
+    j = len(path) - 1
+    if not j or (n := index.get(path[:j], _MISSING)) is _MISSING:
+        j, n = 0, root
+    for k in range(j, len(path)):
+        attr, idx = path[k]
+        n = getattr(n, attr)
+        if idx is not None:
+            n = n[idx]
+        index[path[: k + 1]] = n
+    return n
+
+
+_MISSING = object()
+
+
 @dataclass
 class Node(Cursor):
     _path: list[tuple[str, Optional[int]]]
@@ -596,14 +653,9 @@ class Node(Cursor):
         compiler-internal, not class-private, so other parts of the compiler
         may call this, while users should not.
         """
-        n = self._root
-
-        for attr, idx in self._path:
-            n = getattr(n, attr)
-            if idx is not None:
-                n = n[idx]
-
-        return n
+        if not self._path:
+            return self._root
+        return _resolve_path(self._root, tuple(self._path))
 
     # ------------------------------------------------------------------------ #
     # Navigation (implementation)
@@ -1,6 +1,6 @@
 # import inspect
 # import types
-from weakref import WeakKeyDictionary
+from weakref import WeakKeyDictionary, WeakSet
 
 from collections import defaultdict  # ChainMap, OrderedDict
 from itertools import chain
@@ -58,14 +58,22 @@ from .LoopIR import LoopIR, T, Alpha_Rename
 # be achieved by checking that an equivalence is in all tracked equivalences
 #
 
-# This whole scheme will almost certainly scale empirically as
-#  O(a(#P) * #G) where #P is the number of procedures being tracked
-# for equivalence, and #G is the number of global variables being tracked
-# for the sake of equivalence modulo that global.
-# Because #G does not get very large and because a(#P) is
-# significantly sublinear, we expect that this scheme will suffice
-# for a good long while.  (Although note that memory consumption
-# is O(#P * #G))
+# Copying the relation `Unv` for every new key, and declaring every
+# procedure in every relation, would cost O(#P * #G) time and memory, where
+# #P is the number of procedures being tracked for equivalence, and #G is
+# the number of global variables tracked for the sake of equivalence modulo
+# that global.  Instead, we observe that almost all equivalences are
+# asserted modulo the empty set, and that such equivalences hold in every
+# relation.  So we track the strictest relation `{}` over all procedures,
+# and every other relation as a sparse union-find over the classes of `{}`
+# (represented by their roots), which contains only the classes that are
+# joined by equivalences modulo some non-empty set of keys.
+#
+# A new key then copies only the sparse relation `Unv`, and a procedure is
+# declared only in `{}`.  When two classes of `{}` are joined, the sparse
+# relations that refer to the class losing its root join them as well.
+# Memory consumption is thus O(#P + #E * #G), where #E is the number of
+# equivalences modulo a non-empty set of keys, which are few in practice.
 
 
 # --------------------------------------------------------------------------- #
@@ -74,29 +82,37 @@ from .LoopIR import LoopIR, T, Alpha_Rename
 
 
 class _UnionFind:
+    # values which were never added are their own singleton class
     def __init__(self):
         self.lookup = WeakKeyDictionary()
 
+    def __contains__(self, val):
+        return val in self.lookup
+
     def new_node(self, val):
         if val not in self.lookup:
             self.lookup[val] = val
 
     def find(self, val):
-        parent = self.lookup[val]
+        lookup = self.lookup
+        parent = lookup.get(val, val)
         while val is not parent:
             # path splitting optimization
-            grandparent = self.lookup[parent]
-            self.lookup[val] = grandparent
+            grandparent = lookup.get(parent, parent)
+            lookup[val] = grandparent
             val, parent = parent, grandparent
         return val
 
     def union(self, val1, val2):
+        """Join the classes of `val1` and `val2`, returning the root that was
+        subsumed, or None if they were already unified"""
         p1, p2 = self.find(val1), self.find(val2)
 
         if p1 is p2:
-            pass  # then val1 and val2 are already unified
-        else:
-            self.lookup[p2] = p1
+            return None  # then val1 and val2 are already unified
+        self.new_node(p1)
+        self.lookup[p2] = p1
+        return p2
 
     def check_eqv(self, val1, val2):
         p1, p2 = self.find(val1), self.find(val2)
@@ -109,9 +125,13 @@ class _UnionFind:
         return copy
 
 
-_UF_Unv = _UnionFind()
+# the strictest relation, over all procedures
 _UF_Strict = _UnionFind()
+# the relations `Unv` and `Unv-{key}`, over the roots of `_UF_Strict`
+_UF_Unv = _UnionFind()
 _UF_Unv_key = dict()
+# roots of `_UF_Strict` which occur in the relations above
+_UF_Sparse_roots = WeakSet()
 
 
 def new_uf_by_eqv_key(key):
@@ -120,11 +140,7 @@ def new_uf_by_eqv_key(key):
 
 
 def decl_new_proc(proc):
-    # add to all existing union-find data structures
     _UF_Strict.new_node(proc)
-    _UF_Unv.new_node(proc)
-    for uf in _UF_Unv_key.values():
-        uf.new_node(proc)
 
 
 def derive_proc(orig_proc, new_proc, config_set=frozenset()):
@@ -132,44 +148,68 @@ def derive_proc(orig_proc, new_proc, config_set=frozenset()):
     assert_eqv_proc(orig_proc, new_proc, config_set)
 
 
+def _strict_union(proc1, proc2):
+    root = _UF_Strict.union(proc1, proc2)
+    if root is not None and root in _UF_Sparse_roots:
+        # keep the sparse relations consistent with the new root
+        new_root = _UF_Strict.find(root)
+        _UF_Sparse_roots.add(new_root)
+        for uf in chain([_UF_Unv], _UF_Unv_key.values()):
+            if root in uf:
+                uf.union(new_root, root)
+
+
 def assert_eqv_proc(proc1, proc2, config_set=frozenset()):
     assert isinstance(config_set, frozenset)
+    if not config_set:
+        _strict_union(proc1, proc2)
+        return
+
     # First, expand the set of equivalences being tracked if needed
     for key in config_set:
         if key not in _UF_Unv_key:
             new_uf_by_eqv_key(key)
     # then do the appropriate union operations
-    if not config_set:
-        _UF_Strict.union(proc1, proc2)
-    _UF_Unv.union(proc1, proc2)
+    root1, root2 = _UF_Strict.find(proc1), _UF_Strict.find(proc2)
+    if root1 is root2:
+        return
+    _UF_Sparse_roots.add(root1)
+    _UF_Sparse_roots.add(root2)
+    _UF_Unv.union(root1, root2)
     for key, uf in _UF_Unv_key.items():
         if key not in config_set:
-            uf.union(proc1, proc2)
+            uf.union(root1, root2)
 
 
 def check_eqv_proc(proc1, proc2, config_set=frozenset()):
     assert isinstance(config_set, frozenset)
+    root1, root2 = _UF_Strict.find(proc1), _UF_Strict.find(proc2)
+    if root1 is root2:
+        return True
     # if these aren't equal under the weakest assumptions
     # then we can early exit
-    if not _UF_Unv.check_eqv(proc1, proc2):
+    if not _UF_Unv.check_eqv(root1, root2):
         return False
     # otherwise check intersection of all non-excluded equivalence relations
     return all(
-        uf.check_eqv(proc1, proc2)
+        uf.check_eqv(root1, root2)
         for key, uf in _UF_Unv_key.items()
         if key not in config_set
     )
 
 
 def get_strictest_eqv_proc(proc1, proc2):
+    root1, root2 = _UF_Strict.find(proc1), _UF_Strict.find(proc2)
+    if root1 is root2:
+        return True, set()
     # under the weakest assumptions, are these procedures equivalent?
-    is_eqv = _UF_Unv.check_eqv(proc1, proc2)
+    is_eqv = _UF_Unv.check_eqv(root1, root2)
     # then compute the strongest assumptions under which the equivalence
     # continues to hold.  Note that keys == emptyset() is the strictest
     keys = set()
     if is_eqv:
         keys = {
-            key for key, uf in _UF_Unv_key.items() if not uf.check_eqv(proc1, proc2)
+            key for key, uf in _UF_Unv_key.items() if not uf.check_eqv(root1, root2)
         }
 
     return is_eqv, keys
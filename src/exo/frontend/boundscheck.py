@@ -1,11 +1,10 @@
 from collections import ChainMap
 from asdl_adt import ADT, validators
 
-import pysmt
-from pysmt import shortcuts as SMT
-
 from ..core.LoopIR import LoopIR, T, Operator, Config
 from ..core.prelude import *
+from ..rewrite.smt_backend import get_smt_backend
+from ..rewrite.smt_budget import SMTTimeout, smt_scope, smt_query, log_timeout
 
 
 # --------------------------------------------------------------------------- #
@@ -473,14 +472,6 @@ def eff_bind(bind_name, e, pred=None, config_pred=None):
     )
 
 
-def _get_smt_solver():
-    factory = pysmt.factory.Factory(pysmt.shortcuts.get_env())
-    slvs = factory.all_solvers()
-    if len(slvs) == 0:
-        raise OSError("Could not find any SMT solvers")
-    return pysmt.shortcuts.Solver(name=next(iter(slvs)))
-
-
 # --------------------------------------------------------------------------- #
 # --------------------------------------------------------------------------- #
 # Helper Functions
@@ -539,14 +530,15 @@ class CheckBounds:
 
         self.stride_sym = dict()
 
-        self.solver = _get_smt_solver()
+        self.SMT = get_smt_backend()
+        self.solver = self.SMT.solvers.acquire()
 
         self.push()
 
         # Add assertions
         for arg in proc.args:
             if isinstance(arg.type, T.Size):
-                pos_sz = SMT.LT(SMT.Int(0), self.sym_to_smt(arg.name))
+                pos_sz = self.SMT.LT(self.SMT.Int(0), self.sym_to_smt(arg.name))
                 self.solver.add_assertion(pos_sz)
             elif arg.type.is_tensor_or_window() and not arg.type.is_win():
                 self.assume_tensor_strides(arg, arg.name, arg.type.shape())
@@ -554,7 +546,7 @@ class CheckBounds:
         for p in proc.preds:
             # Check whether the assert is even potentially correct
             smt_p = self.expr_to_smt(lift_expr(p))
-            if not self.solver.is_sat(smt_p):
+            if not self.is_sat(p, smt_p):
                 self.err(
                     p, f"The assertion {p} at {p.srcinfo} is always unsatisfiable."
                 )
@@ -576,6 +568,8 @@ class CheckBounds:
                 self.check_bounds(arg.name, shape, body_eff)
 
         self.pop()
+        self.SMT.solvers.release(self.solver)
+        self.solver = None
 
         # do error checking here
         if len(self.errors) > 0:
@@ -611,12 +605,12 @@ class CheckBounds:
             pass
 
     def counter_example(self):
-        smt_syms = [smt for sym, smt in self.env.items() if smt.get_type() == SMT.INT]
+        smt_syms = [smt for sym, smt in self.env.items() if self.SMT.is_int(smt)]
         val_map = self.solver.get_py_values(smt_syms)
 
         mapping = []
         for sym, smt in self.env.items():
-            if smt.get_type() == SMT.INT:
+            if self.SMT.is_int(smt):
                 mapping.append(f" {sym} = {val_map[smt]}")
 
         return ",".join(mapping)
@@ -634,25 +628,55 @@ class CheckBounds:
     def err(self, node, msg):
         self.errors.append(f"{node.srcinfo}: {msg}")
 
+    def is_sat(self, node, e):
+        return self._query(node, self.solver.is_sat, e)
+
+    def is_valid(self, node, e):
+        return self._query(node, self.solver.is_valid, e)
+
+    def _query(self, node, query, e):
+        # a query which runs out of time is neither proven nor refuted,
+        # and there is no counter-example to report, so give up entirely
+        name = self.orig_proc.name
+        try:
+            with smt_scope("CheckBounds", name, node.srcinfo), smt_query() as q:
+                if hasattr(self.solver, "set_timeout"):
+                    self.solver.set_timeout(q.limit)
+                try:
+                    return query(e)
+                except SMTTimeout:
+                    raise q.timeout()
+        except SMTTimeout as err:
+            log_timeout("CheckBounds", node.srcinfo, err)
+            raise TypeError(
+                f"{node.srcinfo}: could not check the bounds of {name}: {err}"
+            )
+
     # TODO: Add allow_allocation arg here, to check if we're introducing new
     # symbols from the right place.
     def sym_to_smt(self, sym, typ=T.index):
         if sym not in self.env:
             if typ.is_indexable() or typ.is_stridable():
-                self.env[sym] = SMT.Symbol(repr(sym), SMT.INT)
+                self.env[sym] = self.SMT.Symbol(repr(sym), self.SMT.INT)
             elif typ is T.bool:
-                self.env[sym] = SMT.Symbol(repr(sym), SMT.BOOL)
+                self.env[sym] = self.SMT.Symbol(repr(sym), self.SMT.BOOL)
         return self.env[sym]
 
     def config_to_smt(self, config, field, typ):
         c = (config, field)
         if c not in self.config_env:
             if typ.is_indexable() or typ.is_stridable():
-                self.config_env[c] = SMT.Symbol(f"{config.name()}_{field}", SMT.INT)
+                self.config_env[c] = self.SMT.Symbol(
+                    f"{config.name()}_{field}", self.SMT.INT
+                )
             elif typ is T.bool:
-                self.config_env[c] = SMT.Symbol(f"{config.name()}_{field}", SMT.BOOL)
+                self.config_env[c] = self.SMT.Symbol(
+                    f"{config.name()}_{field}", self.SMT.BOOL
+                )
             elif typ.is_scalar():
-                self.config_env[c] = SMT.Symbol(f"{config.name()}_{field}", SMT.REAL)
+                self.config_env[c] = self.SMT.Symbol(
+                    f"{config.name()}_{field}", self.SMT.REAL
+                )
             else:
                 assert False, "bad case!"
         return self.config_env[c]
@@ -661,16 +685,16 @@ class CheckBounds:
         assert isinstance(expr, E.expr), "expected Effects.expr"
         if isinstance(expr, E.Const):
             if expr.type == T.bool:
-                return SMT.Bool(expr.val)
+                return self.SMT.Bool(expr.val)
             elif expr.type.is_indexable():
-                return SMT.Int(expr.val)
+                return self.SMT.Int(expr.val)
             else:
                 assert False, f"unrecognized const type: {type(expr.val)}"
         elif isinstance(expr, E.Var):
             return self.sym_to_smt(expr.name, expr.type)
         elif isinstance(expr, E.Not):
             arg = self.expr_to_smt(expr.arg)
-            return SMT.Not(arg)
+            return self.SMT.Not(arg)
         elif isinstance(expr, E.Stride):
             key = (expr.name, expr.dim)
             if key in self.stride_sym:
@@ -683,18 +707,18 @@ class CheckBounds:
             cond = self.expr_to_smt(expr.cond)
             tcase = self.expr_to_smt(expr.tcase)
             fcase = self.expr_to_smt(expr.fcase)
-            return SMT.Ite(cond, tcase, fcase)
+            return self.SMT.Ite(cond, tcase, fcase)
         elif isinstance(expr, E.ConfigField):
             return self.config_to_smt(expr.config, expr.field, expr.type)
         elif isinstance(expr, E.BinOp):
             lhs = self.expr_to_smt(expr.lhs)
             rhs = self.expr_to_smt(expr.rhs)
             if expr.op == "+":
-                return SMT.Plus(lhs, rhs)
+                return self.SMT.Plus(lhs, rhs)
             elif expr.op == "-":
-                return SMT.Minus(lhs, rhs)
+                return self.SMT.Minus(lhs, rhs)
             elif expr.op == "*":
-                return SMT.Times(lhs, rhs)
+                return self.SMT.Times(lhs, rhs)
             elif expr.op == "/":
                 assert isinstance(expr.rhs, E.Const)
                 assert expr.rhs.val > 0
@@ -754,9 +778,11 @@ class CheckBounds:
                 # Introduce new Sym (z in formula below)
                 div_tmp = self.sym_to_smt(Sym("div_tmp"))
                 # rhs*z <= lhs < rhs*(z+1)
-                rhs_eq = SMT.LE(SMT.Times(rhs, div_tmp), lhs)
-                lhs_eq = SMT.LT(lhs, SMT.Times(rhs, SMT.Plus(div_tmp, SMT.Int(1))))
-                self.solver.add_assertion(SMT.And(rhs_eq, lhs_eq))
+                rhs_eq = self.SMT.LE(self.SMT.Times(rhs, div_tmp), lhs)
+                lhs_eq = self.SMT.LT(
+                    lhs, self.SMT.Times(rhs, self.SMT.Plus(div_tmp, self.SMT.Int(1)))
+                )
+                self.solver.add_assertion(self.SMT.And(rhs_eq, lhs_eq))
                 return div_tmp
             elif expr.op == "%":
                 assert isinstance(expr.rhs, E.Const)
@@ -767,32 +793,34 @@ class CheckBounds:
                 # Then,
                 #   lhs % rhs = lhs - rhs * mod_tmp
                 mod_tmp = self.sym_to_smt(Sym("mod_tmp"))
-                rhs_eq = SMT.LE(SMT.Times(rhs, mod_tmp), lhs)
-                lhs_eq = SMT.LT(lhs, SMT.Times(rhs, SMT.Plus(mod_tmp, SMT.Int(1))))
-                self.solver.add_assertion(SMT.And(rhs_eq, lhs_eq))
-                return SMT.Minus(lhs, SMT.Times(rhs, mod_tmp))
+                rhs_eq = self.SMT.LE(self.SMT.Times(rhs, mod_tmp), lhs)
+                lhs_eq = self.SMT.LT(
+                    lhs, self.SMT.Times(rhs, self.SMT.Plus(mod_tmp, self.SMT.Int(1)))
+                )
+                self.solver.add_assertion(self.SMT.And(rhs_eq, lhs_eq))
+                return self.SMT.Minus(lhs, self.SMT.Times(rhs, mod_tmp))
 
             elif expr.op == "<":
-                return SMT.LT(lhs, rhs)
+                return self.SMT.LT(lhs, rhs)
             elif expr.op == ">":
-                return SMT.GT(lhs, rhs)
+                return self.SMT.GT(lhs, rhs)
             elif expr.op == "<=":
-                return SMT.LE(lhs, rhs)
+                return self.SMT.LE(lhs, rhs)
             elif expr.op == ">=":
-                return SMT.GE(lhs, rhs)
+                return self.SMT.GE(lhs, rhs)
             elif expr.op == "==":
                 if expr.lhs.type == T.bool and expr.rhs.type == T.bool:
-                    return SMT.Iff(lhs, rhs)
+                    return self.SMT.Iff(lhs, rhs)
                 elif expr.lhs.type.is_indexable() and expr.rhs.type.is_indexable():
-                    return SMT.Equals(lhs, rhs)
+                    return self.SMT.Equals(lhs, rhs)
                 elif expr.lhs.type.is_stridable() and expr.rhs.type.is_stridable():
-                    return SMT.Equals(lhs, rhs)
+                    return self.SMT.Equals(lhs, rhs)
                 else:
                     assert False, "bad case"
             elif expr.op == "and":
-                return SMT.And(lhs, rhs)
+                return self.SMT.And(lhs, rhs)
             elif expr.op == "or":
-                return SMT.Or(lhs, rhs)
+                return self.SMT.Or(lhs, rhs)
         else:
             assert False, f"bad case: {type(expr)}"
 
@@ -825,17 +853,17 @@ class CheckBounds:
             self.push()
             if eff.pred is not None:
                 self.solver.add_assertion(self.expr_to_smt(eff.pred))
-            in_bds = SMT.Bool(True)
+            in_bds = self.SMT.Bool(True)
 
             assert len(eff.loc) == len(shape)
             for e, hi in zip(eff.loc, shape):
                 # 1 <= loc[i] < shape[i]
                 e = self.expr_to_smt(e)
-                lhs = SMT.LE(SMT.Int(0), e)
-                rhs = SMT.LT(e, self.expr_to_smt(hi))
-                in_bds = SMT.And(in_bds, SMT.And(lhs, rhs))
+                lhs = self.SMT.LE(self.SMT.Int(0), e)
+                rhs = self.SMT.LT(e, self.expr_to_smt(hi))
+                in_bds = self.SMT.And(in_bds, self.SMT.And(lhs, rhs))
 
-            if not self.solver.is_valid(in_bds):
+            if not self.is_valid(eff, in_bds):
                 eg = self.counter_example()
                 self.err(eff, f"{sym} is {eff_str} out-of-bounds when:\n  {eg}.")
 
@@ -849,8 +877,8 @@ class CheckBounds:
                 self.check_in_bounds(sym, shape, e, y)
 
     def check_pos_size(self, expr):
-        e_pos = SMT.LT(SMT.Int(0), self.expr_to_smt(expr))
-        if not self.solver.is_valid(e_pos):
+        e_pos = self.SMT.LT(self.SMT.Int(0), self.expr_to_smt(expr))
+        if not self.is_valid(expr, e_pos):
             eg = self.counter_example()
             self.err(
                 expr,
@@ -859,8 +887,8 @@ class CheckBounds:
             )
 
     def check_non_negative(self, expr):
-        e_nn = SMT.LE(SMT.Int(0), self.expr_to_smt(expr))
-        if not self.solver.is_valid(e_nn):
+        e_nn = self.SMT.LE(self.SMT.Int(0), self.expr_to_smt(expr))
+        if not self.is_valid(expr, e_nn):
             eg = self.counter_example()
             self.err(
                 expr,
@@ -870,11 +898,11 @@ class CheckBounds:
 
     def check_call_shape_eqv(self, argshp, sigshp, node):
         assert len(argshp) == len(sigshp)
-        eqv_dim = SMT.Bool(True)
+        eqv_dim = self.SMT.Bool(True)
         for a, s in zip(argshp, sigshp):
-            eq_here = SMT.Equals(self.expr_to_smt(a), self.expr_to_smt(s))
-            eqv_dim = SMT.And(eqv_dim, eq_here)
-        if not self.solver.is_valid(eqv_dim):
+            eq_here = self.SMT.Equals(self.expr_to_smt(a), self.expr_to_smt(s))
+            eqv_dim = self.SMT.And(eqv_dim, eq_here)
+        if not self.is_valid(node, eqv_dim):
             eg = self.counter_example()
             self.err(
                 node,
@@ -1019,7 +1047,7 @@ class CheckBounds:
                 for sig, arg in zip(stmt.f.args, stmt.args):
                     # Add type assertion from the size signature
                     if isinstance(sig.type, T.Size):
-                        pos_sz = SMT.LT(SMT.Int(0), self.sym_to_smt(sig.name))
+                        pos_sz = self.SMT.LT(self.SMT.Int(0), self.sym_to_smt(sig.name))
                         self.solver.add_assertion(pos_sz)
 
                         # check the caller argument always be positive for sizes
@@ -1067,7 +1095,7 @@ class CheckBounds:
                 for p in stmt.f.preds:
                     p_subst = loopir_subst(p, subst)
                     smt_pred = self.expr_to_smt(lift_expr(p_subst))
-                    if not self.solver.is_valid(smt_pred):
+                    if not self.is_valid(stmt, smt_pred):
                         eg = self.counter_example()
                         self.err(
                             stmt,
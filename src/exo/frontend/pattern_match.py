@@ -1,12 +1,18 @@
 from __future__ import annotations
 
-import inspect
+import bisect
+import heapq
 import re
+import sys
+from itertools import islice
 from typing import Optional, Iterable
 from collections import ChainMap
 
 import exo.frontend.pyparser as pyparser
 from exo.core.LoopIR import LoopIR, PAST
+from exo.core.caches import register_cache, LRUCache
+from exo.core.LoopIR_index import get_proc_index
+from exo.core.extern import Extern
 
 # --------------------------------------------------------------------------- #
 # --------------------------------------------------------------------------- #
@@ -79,25 +85,50 @@ def match_pattern(
     else:
         match_no = default_match_no  # None means match-all
 
-    stack_frames: [inspect.FrameInfo] = inspect.stack()
-    # get source location where this is getting called from
-    caller = inspect.getframeinfo(stack_frames[call_depth][0])
-    func_locals = ChainMap(stack_frames[call_depth].frame.f_locals)
-    func_globals = ChainMap(stack_frames[call_depth].frame.f_globals)
-
-    # parse the pattern we're going to use to match
-    p_ast = pyparser.pattern(
-        pattern_str,
-        filename=caller.filename,
-        lineno=caller.lineno,
-        srclocals=func_locals,
-        srcglobals=func_globals,
-    )
+    # parse the pattern we're going to use to match, in the environment of
+    # the frame where this is getting called from
+    p_ast = _parse_pattern(pattern_str, sys._getframe(call_depth))
 
     # do the pattern match, to find the nodes in ast
     return PatternMatch().find(context, p_ast, match_no=match_no, use_sym_id=use_sym_id)
 
 
+# Scheduling scripts match the same (literal) patterns over and over, so
+# parsed patterns are cached.  The parse depends on the environment of the
+# caller only in one way: a lone call `f(...)` is an expression if `f` names
+# an extern function there, and a statement (a call to a procedure)
+# otherwise.  So the key of a pattern is its string and that distinction.
+# The source locations of a cached pattern are those of its first use,
+# which matching does not look at.
+
+PATTERN_CACHE_SIZE = 1024
+
+_patterns = register_cache("patterns", LRUCache(PATTERN_CACHE_SIZE))
+
+_leading_call_re = re.compile(r"^\s*([a-zA-Z_]\w*)\s*\(")
+
+
+def _parse_pattern(pattern_str, frame):
+    is_extern = False
+    if match := _leading_call_re.match(pattern_str):
+        name = match[1]
+        is_extern = isinstance(frame.f_locals.get(name), Extern) or isinstance(
+            frame.f_globals.get(name), Extern
+        )
+
+    key = (pattern_str, is_extern)
+    if (p_ast := _patterns.get(key)) is None:
+        p_ast = pyparser.pattern(
+            pattern_str,
+            filename=frame.f_code.co_filename,
+            lineno=frame.f_lineno,
+            srclocals=ChainMap(frame.f_locals),
+            srcglobals=ChainMap(frame.f_globals),
+        )
+        _patterns.put(key, p_ast)
+    return p_ast
+
+
 _PAST_to_LoopIR = {
     # list of stmts
     list: list,
@@ -123,19 +154,27 @@ _PAST_to_LoopIR = {
 }
 
 
-class _MatchComplete(Exception):
-    pass
+# Finding the matches of a pattern
+#
+# Matches are found in the order of a pre-order walk of the statements
+# (for statement patterns) or of all nodes (for expression patterns), and
+# are produced lazily, so that the N-th match is found without keeping
+# every earlier one.
+#
+# Most patterns start with a statement of a given constructor (and often
+# a name), or are a read of a given buffer.  For those, the candidates are
+# taken from the index of the proc (see `core/LoopIR_index.py`) instead of
+# trying a match at every position of every block.  The index of a proc
+# is built when the whole proc is searched, and is used to search within
+# a cursor only if it already exists, since building it walks all of the
+# proc.
 
 
 class PatternMatch:
     def __init__(self):
-        self._match_no = None
-        self._results = []
         self._use_sym_id = False
 
     def find(self, cur, pat, match_no=None, use_sym_id=False):
-        self._match_no = match_no
-        self._results = []
         self._use_sym_id = use_sym_id
 
         # prevent the top level of a pattern being just a hole
@@ -144,71 +183,100 @@ class PatternMatch:
         elif isinstance(pat, list) and all(isinstance(p, PAST.S_Hole) for p in pat):
             raise PatternMatchError("pattern match on 'anything' unsupported")
 
-        try:
-            if isinstance(pat, list):
-                assert len(pat) > 0
-                self.find_stmts(pat, cur)
-            else:
-                assert isinstance(pat, PAST.expr)
-                self.find_expr(pat, cur)
-        except _MatchComplete:
-            pass
-
-        return self._results
-
-    def _add_result(self, result):
-        assert isinstance(result, (Node, Block))
-
-        if self._match_no is None:
-            self._results.append(result)
-            return
+        if isinstance(pat, list):
+            assert len(pat) > 0
+            matches = self.find_stmts(pat, cur)
+        else:
+            assert isinstance(pat, PAST.expr)
+            matches = self.find_expr(pat, cur)
 
-        i = self._match_no
-        self._match_no -= 1
-        if i == 0:
-            self._results.append(result)
-            raise _MatchComplete()
+        if match_no is None:
+            return list(matches)
+        return list(islice(matches, match_no, match_no + 1))
 
     ## -------------------
     ##  finding methods
 
     def find_expr(self, pat, cur):
-        # try to match
-        if self.match_e(pat, cur._node):
-            self._add_result(cur)
-
-        for child in _children(cur):
-            self.find_expr(pat, child)
+        candidates = self._indexed_exprs(pat, cur)
+        if candidates is None:
+            candidates = _all_nodes(cur)
+        for c in candidates:
+            if self.match_e(pat, c._node):
+                yield c
 
     def find_stmts(self, pats, cur: Node):
-        if isinstance(cur._node, LoopIR.proc):
-            return self.find_stmts_in_block(pats, cur.body())
-
-        return self.find_stmts_in_block(pats, cur.as_block())
-
-    def find_stmts_in_block(self, pats, curs: Block):
-        # may encounter empty statement blocks, which we should ignore
-        if len(curs) == 0:
-            return
-
-        # try to match a prefix of this sequence of statements
-        if m := self.match_stmts(pats, curs):
-            self._add_result(m)
-
-        # if we need to look for more matches, recurse structurally ...
-
-        # first, look for any subsequences of statements in the first
-        # statement of the sequence `stmts`
-        if isinstance(curs[0]._node, LoopIR.If):
-            self.find_stmts_in_block(pats, curs[0].body())
-            self.find_stmts_in_block(pats, curs[0].orelse())
-        elif isinstance(curs[0]._node, LoopIR.For):
-            self.find_stmts_in_block(pats, curs[0].body())
+        candidates = self._indexed_stmts(pats, cur)
+        if candidates is None:
+            if isinstance(cur._node, LoopIR.proc):
+                candidates = _all_stmt_suffixes(cur.body())
+            else:
+                candidates = _all_stmt_suffixes(cur.as_block())
+        for curs in candidates:
+            # try to match a prefix of this sequence of statements
+            if m := self.match_stmts(pats, curs):
+                yield m
+
+    def _index(self, cur):
+        if not isinstance(cur, Node) or not isinstance(cur._root, LoopIR.proc):
+            return None
+        return get_proc_index(cur._root, build=not cur._path)
+
+    def _name(self, pat_nm):
+        # the name of the symbols matching `pat_nm`, or None if any match
+        if pat_nm == "_":
+            return None
+        if self._use_sym_id:
+            return pat_nm.rsplit("_", 1)[0]
+        return pat_nm
+
+    def _indexed_exprs(self, pat, cur):
+        if not isinstance(pat, PAST.Read) or (name := self._name(pat.name)) is None:
+            return None
+        if (index := self._index(cur)) is None:
+            return None
+
+        scope = tuple(cur._path)
+        return (
+            _node_at(cur._root, path, node)
+            for path, node in index.reads.get(name, ())
+            if path[: len(scope)] == scope
+        )
+
+    def _indexed_stmts(self, pats, cur):
+        pat = pats[0]
+        if isinstance(pat, PAST.S_Hole) or (index := self._index(cur)) is None:
+            return None
+
+        # the candidates for `pat`, in order
+        if isinstance(pat, PAST.For) and (name := self._name(pat.iter)):
+            entries = index.loops.get(name, [])
+        elif isinstance(pat, PAST.Alloc) and (name := self._name(pat.name)):
+            entries = index.allocs.get(name, [])
+        elif isinstance(pat, (PAST.Assign, PAST.Reduce)) and (
+            name := self._name(pat.name)
+        ):
+            types = tuple(_PAST_to_LoopIR[type(pat)])
+            entries = [e for e in index.writes.get(name, []) if isinstance(e[1], types)]
+            if isinstance(pat, PAST.Assign):
+                windows = index.stmts.get(LoopIR.WindowStmt, [])
+                windows = [e for e in windows if str(e[1].name) == name]
+                entries = list(heapq.merge(entries, windows))
         else:
-            pass  # other forms of statement do not contain stmt blocks
-
-        # second, recurse on the tail of this sequence...
-        self.find_stmts_in_block(pats, curs[1:])
+            types = _PAST_to_LoopIR[type(pat)]
+            if isinstance(pat, PAST.Assign):
+                types = types + [LoopIR.WindowStmt]
+            entries = list(heapq.merge(*(index.stmts.get(t, []) for t in types)))
+
+        # statement paths are ordered as the statements are visited, so the
+        # candidates within `cur` are contiguous
+        scope = tuple(cur._path)
+        lo = bisect.bisect_left(entries, (scope,))
+        return (
+            _stmt_suffix(cur._root, path, len(path) == len(scope))
+            for path, _ in entries[lo:]
+            if path[: len(scope)] == scope
+        )
 
     ## -------------------
     ##  matching methods
@@ -405,3 +473,45 @@ def _children_from_attrs(cur, n, *args) -> Iterable[Node]:
                 yield cur._child_node(attr, i)
         else:
             yield cur._child_node(attr, None)
+
+
+def _all_nodes(cur) -> Iterable[Node]:
+    # all nodes within `cur`, in pre-order
+    stack = [cur]
+    while stack:
+        cur = stack.pop()
+        yield cur
+        stack.extend(reversed(list(_children(cur))))
+
+
+def _all_stmt_suffixes(curs: Block) -> Iterable[Block]:
+    # every non-empty suffix of every block within `curs`, in the order of
+    # their first statements in a pre-order walk
+    stack = [curs]
+    while stack:
+        curs = stack.pop()
+        # may encounter empty statement blocks, which we should ignore
+        if len(curs) == 0:
+            continue
+        yield curs
+        stack.append(curs[1:])
+        if isinstance(curs[0]._node, LoopIR.If):
+            stack.append(curs[0].orelse())
+            stack.append(curs[0].body())
+        elif isinstance(curs[0]._node, LoopIR.For):
+            stack.append(curs[0].body())
+
+
+def _node_at(root, path, node) -> Node:
+    cur = Node(root, list(path))
+    # noinspection PyPropertyAccess
+    cur._node = node
+    return cur
+
+
+def _stmt_suffix(root, path, only_first) -> Block:
+    # the statements of a block from the one at `path` on (or only that one)
+    *parent, (attr, i) = path
+    anchor = Node(root, parent)
+    stop = i + 1 if only_first else len(getattr(anchor._node, attr))
+    return Block(root, anchor, attr, range(i, stop))
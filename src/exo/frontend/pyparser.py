@@ -78,9 +78,7 @@ def get_src_locals(*, depth):
     """
     Get global and local environments for context capture purposes
     """
-    stack_frames: [inspect.FrameInfo] = inspect.stack()
-    assert len(stack_frames) >= depth
-    func_locals = stack_frames[depth].frame.f_locals
+    func_locals = sys._getframe(depth).f_locals
     assert isinstance(func_locals, dict)
     return ChainMap(func_locals)
 
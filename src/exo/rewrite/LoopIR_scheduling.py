@@ -34,6 +34,7 @@ from .new_eff import (
 )
 
 from .range_analysis import IndexRangeEnvironment, IndexRange, index_range_analysis
+from .dependence_graph import update_reordered
 
 from ..core.prelude import *
 from ..core.proc_eqv import get_strictest_eqv_proc
@@ -1432,6 +1433,7 @@ def DoLiftScope(inner_c):
             fwd = _compose(fwd_move, fwd)
             ir, fwd_del = fwd(outer_c).body()[0]._delete()
             fwd = _compose(fwd_del, fwd)
+            update_reordered(inner_c.get_root(), ir, outer_s)
             return ir, fwd
 
     ir, fwd_move = fwd(inner_c)._move(fwd(outer_c).after())
@@ -1,11 +1,9 @@
-import functools
 import itertools
 import re
 from collections import ChainMap
+from fractions import Fraction
 
-import pysmt
 from asdl_adt import ADT
-from pysmt import shortcuts as SMT
 
 from ..core.LoopIR import (
     LoopIR,
@@ -19,17 +17,11 @@ from ..core.LoopIR import (
 from .LoopIR_scheduling import SchedulingError
 from ..core.prelude import *
 from .new_eff import Check_Aliasing
+from .smt_backend import get_smt_backend
+from ..core.caches import register_cache, LRUCache
 import exo.core.internal_cursors as ic
 
 
-def _get_smt_solver():
-    factory = pysmt.factory.Factory(pysmt.shortcuts.get_env())
-    slvs = factory.all_solvers()
-    if len(slvs) == 0:
-        raise OSError("Could not find any SMT solvers")
-    return pysmt.shortcuts.Solver(name=next(iter(slvs)))
-
-
 def sanitize_str(s):
     return re.sub(r"\W", "_", s)
 
@@ -276,7 +268,20 @@ def sub(x, y):
 
 @extclass(UEq.problem)
 def solve(prob):
-    solver = _get_smt_solver()
+    key, knowns = _problem_key(prob)
+    if (template := _templates.get(key)) is not None:
+        if (solutions := _solve_from_template(prob, knowns, template)) is not None:
+            return solutions
+
+    SMT = get_smt_backend()
+    with SMT.solvers.solver() as solver:
+        solutions = _solve(prob, SMT, solver)
+    if solutions is not None:
+        _templates.put(key, _make_template(prob, knowns, solutions))
+    return solutions
+
+
+def _solve(prob, SMT, solver):
 
     known_list = prob.knowns
     known_idx = {k: i for i, k in enumerate(known_list)}
@@ -366,23 +371,7 @@ def solve(prob):
             x_syms = get_var(hole_var)
             x_val_dict = solver.get_py_values(x_syms)
             x_vals = [x_val_dict[x_sym] for x_sym in x_syms]
-            expr = None
-            for xx, v in zip(known_list, x_vals):
-                v = int(v)
-                if v == 0:
-                    continue
-                elif v == 1:
-                    term = UEq.Var(xx)
-                else:
-                    term = UEq.Scale(v, UEq.Var(xx))
-
-                expr = term if expr is None else UEq.Add(expr, term)
-
-            # constant offset
-            off = UEq.Const(int(x_vals[-1]))
-            expr = off if expr is None else UEq.Add(expr, off)
-
-            solutions[hole_var] = expr
+            solutions[hole_var] = _solution_expr(known_list, x_vals)
 
         # report on case decisions
         for x in case_set:
@@ -392,6 +381,244 @@ def solve(prob):
         return solutions
 
 
+def _solution_expr(known_list, x_vals):
+    # the affine combination of the knowns with coefficients `x_vals`,
+    # followed by the constant offset
+    expr = None
+    for xx, v in zip(known_list, x_vals):
+        v = int(v)
+        if v == 0:
+            continue
+        elif v == 1:
+            term = UEq.Var(xx)
+        else:
+            term = UEq.Scale(v, UEq.Var(xx))
+
+        expr = term if expr is None else UEq.Add(expr, term)
+
+    # constant offset
+    off = UEq.Const(int(x_vals[-1]))
+    return off if expr is None else UEq.Add(expr, off)
+
+
+# -------------------------------------- #
+# Solving problems of the same structure
+#
+# Replacing the blocks of an unrolled kernel unifies the same
+# sub-procedure with many blocks that have the same structure, whose
+# equations differ only in their constants.  Only the case analysis
+# (which dimensions of each buffer are windowed) needs the SMT solver;
+# once the cases are fixed, the equations are linear, and can be solved
+# exactly by elimination.
+#
+# So each problem is keyed by its structure: its equations, with the
+# holes numbered as in the problem, the knowns and case variables
+# numbered in order of first occurrence, and the constants left out.
+# The first problem with a given key is solved by the SMT solver, and the
+# solution is kept as a template: the chosen cases, and the values of all
+# the holes.  Later problems with the same key are solved by elimination
+# under the cases of the template, taking the values of the template for
+# any holes that the equations leave free.  If that fails (the equations
+# are inconsistent under those cases, or have no integer solution), the
+# problem is handed to the SMT solver as before.
+
+UNIFICATION_TEMPLATES_SIZE = 256
+
+_templates = register_cache(
+    "unification_templates", LRUCache(UNIFICATION_TEMPLATES_SIZE)
+)
+
+
+def _problem_key(prob):
+    """
+    The structure of `prob`, and its knowns in order of first occurrence.
+    """
+    holes = {x: i for i, x in enumerate(prob.holes)}
+    known_set = set(prob.knowns)
+    knowns = dict()
+    others = dict()
+
+    def var_key(x):
+        if x in holes:
+            return ("h", holes[x])
+        elif x in known_set:
+            return ("k", knowns.setdefault(x, len(knowns)))
+        return ("u", others.setdefault(x, len(others)))
+
+    def e_key(e):
+        if isinstance(e, UEq.Const):
+            return ("c",)
+        elif isinstance(e, UEq.Var):
+            return var_key(e.name)
+        elif isinstance(e, UEq.Add):
+            return ("+", e_key(e.lhs), e_key(e.rhs))
+        elif isinstance(e, UEq.Scale):
+            return ("*", e.coeff, e_key(e.e))
+        else:
+            assert False, "bad case"
+
+    def p_key(p):
+        if isinstance(p, UEq.Eq):
+            return ("=", e_key(p.lhs), e_key(p.rhs))
+        elif isinstance(p, UEq.Conj):
+            return ("and",) + tuple(p_key(pp) for pp in p.preds)
+        elif isinstance(p, UEq.Disj):
+            return ("or",) + tuple(p_key(pp) for pp in p.preds)
+        elif isinstance(p, UEq.Cases):
+            return ("cases", var_key(p.case_var)) + tuple(p_key(c) for c in p.cases)
+        else:
+            assert False, "bad case"
+
+    key = (len(prob.holes),) + tuple(p_key(p) for p in prob.preds)
+    return key, list(knowns)
+
+
+def _linear(e):
+    # the coefficients of the variables of `e`, and its constant offset
+    if isinstance(e, UEq.Const):
+        return dict(), e.val
+    elif isinstance(e, UEq.Var):
+        return {e.name: 1}, 0
+    elif isinstance(e, UEq.Add):
+        cs, off = _linear(e.lhs)
+        ycs, yoff = _linear(e.rhs)
+        for x, c in ycs.items():
+            if (c := cs.get(x, 0) + c) == 0:
+                cs.pop(x, None)
+            else:
+                cs[x] = c
+        return cs, off + yoff
+    elif isinstance(e, UEq.Scale):
+        if e.coeff == 0:
+            return dict(), 0
+        cs, off = _linear(e.e)
+        return {x: e.coeff * c for x, c in cs.items()}, e.coeff * off
+    else:
+        assert False, "bad case"
+
+
+def _make_template(prob, knowns, solutions):
+    # the cases chosen in `solutions`, and the values of the holes, where
+    # the knowns are numbered in order of first occurrence
+    known_ids = {x: i for i, x in enumerate(knowns)}
+    cases = dict()
+    values = dict()
+    for i, x in enumerate(prob.holes):
+        if isinstance(sol := solutions[x], int):
+            cases[i] = sol
+        else:
+            cs, off = _linear(sol)
+            values[i] = (
+                {known_ids[k]: c for k, c in cs.items() if k in known_ids},
+                off,
+            )
+    return cases, values
+
+
+def _solve_from_template(prob, knowns, template):
+    cases, values = template
+    holes = {x: i for i, x in enumerate(prob.holes)}
+    known_set = set(prob.knowns)
+
+    # the equations that must hold under the cases of the template
+    eqs = []
+    case_vals = dict()
+
+    def collect(p):
+        if isinstance(p, UEq.Eq):
+            eqs.append(p)
+        elif isinstance(p, UEq.Conj):
+            return all(collect(pp) for pp in p.preds)
+        elif isinstance(p, UEq.Cases):
+            i = cases.get(holes.get(p.case_var))
+            if i is None or not 0 <= i < len(p.cases):
+                return False
+            case_vals[p.case_var] = i
+            return collect(p.cases[i])
+        else:
+            return False
+        return True
+
+    if not all(collect(p) for p in prob.preds):
+        return None
+
+    # Gauss-Jordan elimination of the holes, where each row is a map from
+    # holes to coefficients and the right-hand side maps knowns (and None,
+    # for the constant offset) to coefficients
+    pivots = dict()  # hole -> (row, rhs)
+    for eq in eqs:
+        cs, off = _linear(UEq.Add(eq.lhs, UEq.Scale(-1, eq.rhs)))
+        row, rhs = dict(), dict()
+        for x, c in cs.items():
+            if x in holes:
+                row[x] = c
+            elif x in known_set:
+                rhs[x] = -c
+            else:
+                return None
+        if off != 0:
+            rhs[None] = -off
+
+        for x in [x for x in row if x in pivots]:
+            _eliminate(row, rhs, x, pivots[x])
+        if not row:
+            if rhs:
+                return None  # inconsistent under these cases
+            continue
+
+        x = min(row, key=holes.__getitem__)
+        c = row[x]
+        for d in (row, rhs):
+            for y in d:
+                d[y] = _div(d[y], c)
+        for prow, prhs in pivots.values():
+            if x in prow:
+                _eliminate(prow, prhs, x, (row, rhs))
+        pivots[x] = (row, rhs)
+
+    # the values of the free holes are taken from the template
+    def template_value(x):
+        cs, off = values.get(holes[x], ({}, 0))
+        val = {knowns[k]: c for k, c in cs.items() if k < len(knowns)}
+        val[None] = off
+        return val
+
+    sol = {x: template_value(x) for x in prob.holes if x not in pivots}
+    for x, (row, rhs) in pivots.items():
+        val = dict(rhs)
+        for y, c in row.items():
+            if y != x:
+                for k, v in sol[y].items():
+                    val[k] = val.get(k, 0) - c * v
+        sol[x] = val
+
+    solutions = dict()
+    for x in prob.holes:
+        x_vals = [sol[x].get(k, 0) for k in prob.knowns] + [sol[x].get(None, 0)]
+        if any(v != int(v) for v in x_vals):
+            return None
+        solutions[x] = _solution_expr(prob.knowns, x_vals)
+    solutions.update(case_vals)
+    return solutions
+
+
+def _div(a, b):
+    q, r = divmod(a, b)
+    return q if r == 0 else Fraction(a, b)
+
+
+def _eliminate(row, rhs, x, pivot):
+    # subtract the multiple of the (normalized) `pivot` row that cancels `x`
+    c = row[x]
+    prow, prhs = pivot
+    for d, pd in ((row, prow), (rhs, prhs)):
+        for y, v in pd.items():
+            if (v := d.get(y, 0) - c * v) == 0:
+                d.pop(y, None)
+            else:
+                d[y] = v
+
+
 # --------------------------------------------------------------------------- #
 # --------------------------------------------------------------------------- #
 # Unification compiler pass
@@ -405,15 +632,15 @@ class _Find_Mod_Div_Symbols(LoopIR_Do):
         self.FV = FV
 
         self.unq_count = 0
+        self._tuples = dict()
 
         self.do_stmts(stmts)
 
     def result(self):
         return self.node_to_sym, self.sym_to_node
 
-    @functools.lru_cache(maxsize=None)
     def tuple_memo(self, *args):
-        return tuple(args)
+        return self._tuples.setdefault(args, args)
 
     def do_e(self, e):
         if (
@@ -0,0 +1,393 @@
+from dataclasses import dataclass, replace
+from math import gcd
+
+from .new_analysis_core import A, aeFV
+from .new_eff import E, APoint, AEnv, BindingList, TupleBinding, WinBind
+from .presolve import (
+    _Presolver,
+    _Fresh,
+    _GiveUp,
+    _NonClassical,
+    _TRUE,
+    _FALSE,
+    _lin_add,
+    _refute,
+)
+
+# This file implements classical data dependence tests over effects.
+#
+# The loop-legality checks (reordering, parallelizing and fissioning
+# loops) ask whether the effects of two loop iterations commute.  The
+# general encoding of that question builds location sets for both sides,
+# intersects them and asks the SMT solver to prove the intersections
+# empty, which produces large quantified formulas.  However, the accesses
+# in the vast majority of loop nests have affine subscripts, and for those
+# the question can be settled pair-wise by the classical tests:
+#
+#   ZIV       -- a subscript difference without variables is a non-zero
+#                constant
+#   GCD       -- the gcd of the coefficients of a subscript difference
+#                does not divide its constant term
+#   SIV       -- a subscript difference `a*x - a*y + c` whose dependence
+#                distance `-c/a` contradicts a known bound on `x - y`
+#                (e.g. the `i < i'` ordering of two iterations)
+#   Banerjee  -- the range of a subscript difference over the constant
+#                bounds of the variables excludes zero
+#
+# and, when those are inconclusive, by Fourier-Motzkin elimination over
+# the linear constraints guarding the pair of accesses (see presolve.py).
+#
+# Just like the presolver, the tests here may only ever *prove*
+# independence.  Wherever an effect cannot be translated precisely
+# (non-affine subscripts, guards that are not linear, values of globals
+# that depend on control flow), the analysis over-approximates the set
+# of accessed locations, and if independence cannot be shown, the caller
+# falls back to the SMT encoding.
+
+DEPENDENCE_TESTS = True
+
+
+@dataclass
+class DependenceStats:
+    queries: int = 0
+    proved: int = 0
+
+    @property
+    def fallback(self):
+        return self.queries - self.proved
+
+    def __str__(self):
+        rate = 100.0 * self.proved / self.queries if self.queries > 0 else 0.0
+        return (
+            f"dependence tests: {self.proved} of {self.queries} commutativity "
+            f"conditions proved without SMT ({rate:.1f}%)"
+        )
+
+
+dependence_stats = DependenceStats()
+
+
+def get_dependence_stats():
+    return dependence_stats
+
+
+def reset_dependence_stats():
+    dependence_stats.queries = 0
+    dependence_stats.proved = 0
+
+
+def commutes(a1, a2, assumptions):
+    """
+    Returns True if the effects `a1` and `a2` provably commute under
+    `assumptions` (see `Commutes` in new_eff.py), and False if the
+    dependence tests were inconclusive.
+    """
+    return _run(a1, a2, assumptions, reductions_commute=True)
+
+
+def disjoint(a1, a2, assumptions):
+    """
+    Returns True if the effects `a1` and `a2` provably touch disjoint
+    memory under `assumptions` (see `Disjoint_Memory` in new_eff.py),
+    and False if the dependence tests were inconclusive.
+    """
+    return _run(a1, a2, assumptions, reductions_commute=False)
+
+
+def alloc_commutes(a1, a2):
+    """
+    Returns True if neither of `a1` and `a2` accesses a buffer allocated
+    by the other (see `AllocCommutes` in new_eff.py), and False if this
+    could not be shown.
+    """
+    if not DEPENDENCE_TESTS:
+        return False
+    alc1, alc2 = _allocs(a1), _allocs(a2)
+    if not alc1 and not alc2:
+        return True
+    pres = _Presolver()
+    names1 = {acc.name for acc in _Accesses(pres, a1).accesses}
+    names2 = {acc.name for acc in _Accesses(pres, a2).accesses}
+    return not (alc1 & names2) and not (alc2 & names1)
+
+
+def outer_assumptions(pred, env):
+    """
+    Returns the conjuncts of `pred` which do not mention any name bound
+    by the environment `env`, so that they remain valid when moved into
+    the scope of `env`.
+    """
+    bound = set()
+    for bd in env.bindings:
+        if isinstance(bd, (BindingList, TupleBinding)):
+            bound.update(bd.names)
+        elif isinstance(bd, WinBind):
+            bound.add(bd.name)
+
+    conjs = []
+
+    def split(e):
+        if isinstance(e, A.BinOp) and e.op == "and":
+            split(e.lhs)
+            split(e.rhs)
+        elif not any(x in bound for x in aeFV(e)):
+            conjs.append(e)
+
+    split(pred)
+    return conjs
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Collection of accesses
+
+
+@dataclass
+class _Access:
+    kind: str  # one of "read", "write", "reduce"
+    name: object
+    coords: list  # linear terms, or None where a coordinate is not affine
+    conds: list  # linear atoms guarding the access
+    loops: tuple = ()  # enclosing loops, as pairs (loop key, iteration variable)
+    path: tuple = ()  # position of the accessing statement (see dependence_graph.py)
+
+
+@dataclass(frozen=True)
+class _Scope:
+    env: dict
+    conds: list
+    win_map: dict
+    masks: frozenset
+    loops: tuple = ()
+    path: tuple = ()
+
+
+def _allocs(effs):
+    # AllocCommutes only considers the top-level allocations
+    return {eff.name for eff in effs if isinstance(eff, E.Alloc)}
+
+
+def _atoms(pres, e, env):
+    """the conjunctive linear atoms implied by the formula `e`"""
+    try:
+        f = pres.nnf(e, False, env)
+    except (_GiveUp, _NonClassical):
+        return []
+    if f is _TRUE:
+        return []
+    elif f is _FALSE:
+        return [("ge", ({}, -1))]
+    elif f[0] == "and":
+        return [a for a in f[1] if a[0] != "or"]
+    elif f[0] == "or":
+        return []
+    return [f]
+
+
+class _Accesses:
+    """
+    Flattens a list of effects into the list of accesses it may perform,
+    together with the linear conditions guarding each access.
+
+    This mirrors the construction of location sets in `get_basic_locsets`
+    and their interpretation by `is_elem`, except that reads following a
+    write to the same location and reductions overwritten by a later
+    write are not removed.  The result is therefore a superset of all
+    location sets built from the effects.
+    """
+
+    def __init__(self, pres, effs=()):
+        self.pres = pres
+        self.accesses = []
+        self.collect(effs, _Scope(dict(), [], dict(), frozenset()))
+
+    def term(self, e, env):
+        try:
+            return self.pres.lin(e, env)
+        except (_GiveUp, _NonClassical):
+            return None
+
+    def opaque(self, name):
+        # an unconstrained value, distinct from all other values
+        return {_Fresh(name.name()): 1}, 0
+
+    def bind(self, aenv, env):
+        env = dict(env)
+        for bd in aenv.bindings:
+            if isinstance(bd, BindingList):
+                # bindings in a list are sequential
+                for x, rhs in zip(bd.names, bd.rhs):
+                    env[x] = self.term(rhs, env) or self.opaque(x)
+            elif isinstance(bd, TupleBinding):
+                if isinstance(bd.rhs, A.Tuple):
+                    vals = [self.term(a, env) for a in bd.rhs.args]
+                else:
+                    vals = [None] * len(bd.names)
+                for x, val in zip(bd.names, vals):
+                    env[x] = val or self.opaque(x)
+        return env
+
+    def guard(self, cond, scope):
+        return replace(scope, conds=scope.conds + _atoms(self.pres, cond, scope.env))
+
+    def loop(self, key, name, scope):
+        """enter the body of a loop over `name`"""
+        x = self.opaque(name)
+        return replace(
+            scope,
+            env=scope.env | {name: x},
+            loops=scope.loops + ((key, next(iter(x[0]))),),
+        )
+
+    def add(self, kind, name, coords, scope):
+        acc = _Access(kind, name, coords, scope.conds, scope.loops, scope.path)
+        self.accesses.append(acc)
+
+    def collect(self, effs, scope):
+        """
+        collect the accesses of `effs` within `scope`, and return the
+        scope in effect after them
+        """
+        for eff in effs:
+            typ = type(eff)
+            if typ is E.Guard:
+                self.collect(eff.body, self.guard(eff.cond, scope))
+            elif typ is E.Loop:
+                self.collect(eff.body, self.loop(eff, eff.name, scope))
+            elif typ is E.BindEnv:
+                scope = replace(
+                    scope,
+                    env=self.bind(eff.env, scope.env),
+                    win_map=eff.env.translate_win(scope.win_map),
+                )
+            elif typ in (E.Read, E.Write, E.Reduce):
+                pt = APoint(eff.name, eff.coords, None)
+                if eff.name in scope.win_map:
+                    pt = scope.win_map[eff.name](pt)
+                if pt.name not in scope.masks:
+                    coords = [self.term(c, scope.env) for c in pt.coords]
+                    kind = {E.Read: "read", E.Write: "write", E.Reduce: "reduce"}
+                    self.add(kind[typ], pt.name, coords, scope)
+            elif typ in (E.GlobalRead, E.GlobalWrite):
+                kind = "read" if typ is E.GlobalRead else "write"
+                self.add(kind, eff.name, [], scope)
+            elif typ is E.Alloc:
+                # accesses to the buffer from here on are local
+                scope = replace(scope, masks=scope.masks | {eff.name})
+            else:
+                assert typ is E.Empty, f"bad case: {typ}"
+        return scope
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Dependence tests
+
+
+def _run(a1, a2, assumptions, reductions_commute):
+    if not DEPENDENCE_TESTS:
+        return False
+    dependence_stats.queries += 1
+
+    pres = _Presolver()
+    hyps = [atom for e in assumptions for atom in _atoms(pres, e, dict())]
+    acc1 = _Accesses(pres, a1).accesses
+    acc2 = _Accesses(pres, a2).accesses
+
+    by_name = dict()
+    for b in acc2:
+        by_name.setdefault(b.name, []).append(b)
+
+    for a in acc1:
+        for b in by_name.get(a.name, []):
+            # reads never conflict with each other, and neither do
+            # reductions when only commutativity is asked for
+            if a.kind == b.kind != "write":
+                if a.kind == "read" or reductions_commute:
+                    continue
+            if not _independent(a, b, hyps, pres.defs):
+                return False
+
+    dependence_stats.proved += 1
+    return True
+
+
+def _independent(a, b, hyps, defs):
+    """Returns True if the accesses `a` and `b` never touch the same location"""
+    if len(a.coords) != len(b.coords):
+        return False
+    diffs = [
+        _lin_add(c1, c2, -1)
+        for c1, c2 in zip(a.coords, b.coords)
+        if c1 is not None and c2 is not None
+    ]
+    if any(_ziv_gcd(d) for d in diffs):
+        return True
+
+    cons = hyps + a.conds + b.conds
+    if diffs:
+        ineqs = [atom[1] for atom in cons if atom[0] == "ge"]
+        if any(_siv(d, ineqs) for d in diffs):
+            return True
+        lo, hi = _var_bounds(ineqs)
+        if any(_banerjee(d, lo, hi) for d in diffs):
+            return True
+
+    return _refute(cons + [("eq", d) for d in diffs] + defs)
+
+
+def _ziv_gcd(diff):
+    coeffs, const = diff
+    if not coeffs:
+        return const != 0
+    g = 0
+    for c in coeffs.values():
+        g = gcd(g, c)
+    return const % g != 0
+
+
+def _siv(diff, ineqs):
+    # a*x - a*y + c == 0 requires x - y == -c/a
+    coeffs, const = diff
+    if len(coeffs) != 2:
+        return False
+    (x, cx), (y, cy) = coeffs.items()
+    if cx != -cy or const % cx != 0:
+        return False
+    dist = -const // cx
+
+    # look for constraints  k*(x - y) + m >= 0
+    for icoeffs, m in ineqs:
+        if len(icoeffs) != 2 or x not in icoeffs or y not in icoeffs:
+            continue
+        k = icoeffs[x]
+        if icoeffs[y] != -k or k * dist + m >= 0:
+            continue
+        return True
+    return False
+
+
+def _var_bounds(ineqs):
+    lo, hi = dict(), dict()
+    for coeffs, const in ineqs:
+        if len(coeffs) == 1:
+            ((x, c),) = coeffs.items()
+            if c > 0:  # x >= -const/c
+                b = -(const // c)
+                lo[x] = max(lo.get(x, b), b)
+            else:  # x <= const/-c
+                b = const // -c
+                hi[x] = min(hi.get(x, b), b)
+    return lo, hi
+
+
+def _banerjee(diff, lo, hi):
+    coeffs, const = diff
+    dmin = dmax = const
+    for x, c in coeffs.items():
+        xmin, xmax = (lo, hi) if c > 0 else (hi, lo)
+        if dmin is not None:
+            dmin = dmin + c * xmin[x] if x in xmin else None
+        if dmax is not None:
+            dmax = dmax + c * xmax[x] if x in xmax else None
+    return (dmin is not None and dmin > 0) or (dmax is not None and dmax < 0)
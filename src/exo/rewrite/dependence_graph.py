@@ -0,0 +1,433 @@
+import weakref
+from dataclasses import dataclass, replace
+
+from ..core.LoopIR import LoopIR
+from ..core.caches import register_cache, WeakIdCache
+from .new_analysis_core import AAnd, AInt, ANot
+from .new_eff import E, lift_e, expr_effs, stmts_effs, globenv
+from .presolve import _Presolver, _Fresh, _lin_add, _refute
+from . import dependence
+from .dependence import _Accesses, _Scope
+
+# This file implements a dependence graph for loop nests.
+#
+# The graph of a loop nest records every access performed inside of the
+# nest, and for each (ordered) pair of accesses to the same buffer, the
+# direction vectors of the dependences between them.  A direction vector
+# has one entry per loop enclosing both accesses, describing how the
+# iteration of that loop executing the first access relates to the
+# iteration executing the second:
+#
+#       "<"   an earlier iteration
+#       "="   the same iteration
+#       ">"   a later iteration
+#       "*"   not determined by the analysis (any of the above)
+#
+# The graph is over-approximate: whenever the vectors are computed, every
+# possible dependence is described by one of them, but a vector need not
+# correspond to an actual dependence.  The loop legality checks in
+# new_eff.py query the graph first, and fall back to the general checks
+# whenever the graph cannot rule out a dependence.
+#
+# Graphs are built for the outermost loop of a nest, and then shared by
+# all queries about loops inside of it.  Since LoopIR is immutable, a
+# graph is cached on the loop node it was built for, and is implicitly
+# invalidated when a scheduling operation rewrites that loop (producing
+# a new node).  Building a graph only flattens the nest into its
+# accesses; the direction vectors of a pair of accesses are computed the
+# first time a query needs them, and are then remembered.  When loops are
+# reordered, the graph (including all vectors computed so far) is carried
+# over to the new nest by permuting the affected vector entries.
+#
+# Loops and statements within the nest are identified by their path from
+# the root loop: the sequence of indices into the bodies of the enclosing
+# statements, where the statements of an `else` branch at index `i` are
+# identified by `-1 - i`.
+
+DEPGRAPH_MAX_VECTORS = 27
+
+
+@dataclass
+class Dependence:
+    src: object  # the accesses, see dependence._Access
+    dst: object
+    directions: tuple
+    distances: tuple  # the distance for each entry, where it is constant
+
+
+class DependenceGraph:
+    def __init__(self, loop, accesses=None, vectors=None):
+        assert isinstance(loop, LoopIR.For)
+        # the graph is cached on its loop, so it must not keep it alive
+        self._loop = weakref.ref(loop)
+        self.pres = _Presolver()
+        if accesses is None:
+            accesses = _NestAccesses(self.pres, loop).accesses
+        self.accesses = accesses
+        self.primes = dict()
+        self.vectors = dict() if vectors is None else vectors
+
+    @property
+    def loop(self):
+        return self._loop()
+
+    # ----------------------------------------------------------------- #
+    # queries
+
+    def may_depend(self, path, directions, mode, src=None, dst=None):
+        """
+        Returns True unless it can be ruled out that some access `a`
+        depends on an access `b` (both inside of the loop at `path`) with
+        the given `directions` for that loop and the loops directly
+        nested in it, and with all loops enclosing it in the same
+        iteration.
+
+        `mode` decides which pairs of accesses conflict: for "commute",
+        reductions commute with each other; for "disjoint", only reads
+        do.  `src` and `dst` may restrict `a` and `b` to the statements
+        of the loop body (given by their index) for which they hold.
+        """
+        depth = None
+        accs = []
+        for a in self.accesses:
+            d = _loop_depth(a, path)
+            if d is not None:
+                accs.append(a)
+                depth = d
+        for a in accs:
+            if src is not None and not src(a.path[len(path)]):
+                continue
+            for b in accs:
+                if dst is not None and not dst(b.path[len(path)]):
+                    continue
+                if not _conflict(a, b, mode):
+                    continue
+                for dep in self.pair(a, b):
+                    if _matches(dep.directions, depth, directions):
+                        return True
+        return False
+
+    def dependences(self, path=()):
+        """all dependences between accesses inside of the loop at `path`"""
+        accs = [a for a in self.accesses if _loop_depth(a, path) is not None]
+        return [dep for a in accs for b in accs for dep in self.pair(a, b)]
+
+    # ----------------------------------------------------------------- #
+    # computation of direction vectors
+
+    def prime_var(self, x):
+        if type(x) is not _Fresh:
+            return x
+        if x not in self.primes:
+            self.primes[x] = _Fresh(f"{x.name}'")
+        return self.primes[x]
+
+    def prime(self, lin):
+        return {self.prime_var(x): c for x, c in lin[0].items()}, lin[1]
+
+    def prime_atom(self, atom):
+        if atom[0] in ("ge", "eq"):
+            return atom[0], self.prime(atom[1])
+        return atom
+
+    def pair(self, a, b):
+        key = (id(a), id(b))
+        if key not in self.vectors:
+            self.vectors[key] = self._pair(a, b)
+        return self.vectors[key]
+
+    def _pair(self, a, b):
+        if a.name != b.name or len(a.coords) != len(b.coords):
+            return []
+
+        # the second access is executed by a (possibly) different
+        # iteration, so all of the variables local to the nest are renamed
+        diffs = [
+            _lin_add(ca, self.prime(cb), -1)
+            for ca, cb in zip(a.coords, b.coords)
+            if ca is not None and cb is not None
+        ]
+        if any(not d[0] and d[1] != 0 for d in diffs):
+            return []
+        defs = self.pres.defs + [self.prime_atom(q) for q in self.pres.defs]
+        base = (
+            a.conds
+            + [self.prime_atom(q) for q in b.conds]
+            + [("eq", d) for d in diffs]
+            + defs
+        )
+        if _refute(base):
+            return []
+
+        # common loops
+        levels = []
+        for (ka, xa), (kb, xb) in zip(a.loops, b.loops):
+            if xa is not xb:
+                break
+            levels.append((xa, self.prime_var(xa)))
+
+        used = {x for d in diffs for x in d[0]}
+        vectors = [((), ())]
+        for x, xp in levels:
+            dist = _distance(diffs, x, xp)
+            if x not in used and xp not in used:
+                choices = ["*"]
+            elif dist is not None:
+                choices = ["<" if dist > 0 else "=" if dist == 0 else ">"]
+            elif len(vectors) * 3 > DEPGRAPH_MAX_VECTORS:
+                choices = ["*"]
+            else:
+                choices = ["<", "=", ">"]
+
+            refined = []
+            for dirs, dists in vectors:
+                for d in choices:
+                    vec = dirs + (d,)
+                    if d == "*" or not _refute(base + _direction_atoms(levels, vec)):
+                        refined.append((vec, dists + (dist,)))
+            vectors = refined
+
+        if a is b:
+            # an access does not depend on itself in the same iteration
+            vectors = [(v, ds) for v, ds in vectors if any(d != "=" for d in v)]
+        return [Dependence(a, b, v, ds) for v, ds in vectors]
+
+    # ----------------------------------------------------------------- #
+    # incremental updates
+
+    def reordered(self, new_loop, path):
+        """
+        The graph of the nest after the loop at `path` has been swapped
+        with the loop directly nested in it, producing `new_loop`.
+        """
+        inner = path + (0,)
+
+        def swap(t, depth):
+            t = list(t)
+            t[depth], t[depth + 1] = t[depth + 1], t[depth]
+            return tuple(t)
+
+        accesses = []
+        old_to_new = dict()
+        for a in self.accesses:
+            depth = _loop_depth(a, path)
+            new_a = a
+            if depth is not None and _loop_depth(a, inner) == depth + 1:
+                # keep the loop keys (paths) in place and swap the variables
+                (pk, px), (ik, ix) = a.loops[depth], a.loops[depth + 1]
+                loops = list(a.loops)
+                loops[depth], loops[depth + 1] = (pk, ix), (ik, px)
+                new_a = replace(a, loops=tuple(loops))
+            old_to_new[id(a)] = new_a
+            accesses.append(new_a)
+
+        vectors = dict()
+        by_id = {id(a): a for a in self.accesses}
+        for (ia, ib), deps in self.vectors.items():
+            a, b = old_to_new[ia], old_to_new[ib]
+            depth = _loop_depth(by_id[ia], path)
+            new_deps = []
+            for dep in deps:
+                dirs, dists = dep.directions, dep.distances
+                if depth is not None and len(dirs) > depth + 1:
+                    if _loop_depth(by_id[ib], path) == depth:
+                        dirs, dists = swap(dirs, depth), swap(dists, depth)
+                new_deps.append(Dependence(a, b, dirs, dists))
+            vectors[(id(a), id(b))] = new_deps
+
+        graph = DependenceGraph(new_loop, accesses, vectors)
+        graph.pres = self.pres
+        graph.primes = self.primes
+        return graph
+
+
+def _loop_depth(acc, path):
+    """the depth of the loop at `path` among those enclosing `acc`"""
+    for depth, (key, _) in enumerate(acc.loops):
+        if key == path:
+            return depth
+    return None
+
+
+def _conflict(a, b, mode):
+    if a.kind == b.kind != "write":
+        return a.kind == "reduce" and mode == "disjoint"
+    return True
+
+
+def _matches(vec, depth, directions):
+    if len(vec) < depth + len(directions):
+        return False
+    if any(d not in ("=", "*") for d in vec[:depth]):
+        return False
+    return all(d == "*" or d == want for d, want in zip(vec[depth:], directions))
+
+
+def _distance(diffs, x, xp):
+    # a subscript difference  c*x - c*x' + k  fixes the distance x' - x
+    for coeffs, const in diffs:
+        if len(coeffs) == 2 and x in coeffs and xp in coeffs:
+            c = coeffs[x]
+            if coeffs[xp] == -c and const % c == 0:
+                return const // c
+    return None
+
+
+def _direction_atoms(levels, vec):
+    atoms = []
+    for (x, xp), d in zip(levels, vec):
+        if d == "<":  # x < x'
+            atoms.append(("ge", ({xp: 1, x: -1}, -1)))
+        elif d == "=":
+            atoms.append(("eq", ({x: 1, xp: -1}, 0)))
+        elif d == ">":
+            atoms.append(("ge", ({x: 1, xp: -1}, -1)))
+    return atoms
+
+
+class _NestAccesses(_Accesses):
+    """
+    Collects the accesses of a loop nest, following the construction of
+    effects in `stmts_effs`, but keeping track of the position of loops
+    and statements in the nest.
+    """
+
+    def __init__(self, pres, loop):
+        super().__init__(pres)
+        self.stmt(loop, (), _Scope(dict(), [], dict(), frozenset()))
+
+    def stmts(self, stmts, path, scope, orelse=False):
+        for i, s in enumerate(stmts):
+            scope = self.stmt(s, path + ((-1 - i) if orelse else i,), scope)
+        return scope
+
+    def stmt(self, s, path, scope):
+        scope = replace(scope, path=path)
+        if isinstance(s, LoopIR.For):
+            scope = self.collect(expr_effs(s.lo) + expr_effs(s.hi), scope)
+            bds = AAnd(lift_e(s.lo) <= AInt(s.iter), AInt(s.iter) < lift_e(s.hi))
+            body = self.loop(path, s.iter, scope)
+            body = self.guard(bds, body)
+            body = self.collect([E.BindEnv(globenv([s]))], body)
+            self.stmts(s.body, path, body)
+            return self.collect([E.BindEnv(globenv([s]))], scope)
+        elif isinstance(s, LoopIR.If):
+            scope = self.collect(expr_effs(s.cond), scope)
+            cond = lift_e(s.cond)
+            self.stmts(s.body, path, self.guard(cond, scope))
+            self.stmts(s.orelse, path, self.guard(ANot(cond), scope), True)
+            return self.collect([E.BindEnv(globenv([s]))], scope)
+        else:
+            return self.collect(stmts_effs([s]), scope)
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Graph cache
+
+_graphs = register_cache("dependence_graphs", WeakIdCache())
+
+
+def _cache(loop, graph):
+    _graphs.put(loop, graph)
+    return graph
+
+
+def clear_dependence_graphs():
+    _graphs.clear()
+
+
+def find_loop(stmts, target, path=()):
+    """
+    Returns the path to `target` within `stmts`, along with the loops
+    enclosing it (outermost first), or None if `target` does not occur.
+    """
+    for i, s in enumerate(stmts):
+        if s is target:
+            return path + (i,), []
+        if isinstance(s, LoopIR.For):
+            found = find_loop(s.body, target, path + (i,))
+            if found is not None:
+                return found[0], [(path + (i,), s)] + found[1]
+        elif isinstance(s, LoopIR.If):
+            for body, sign in ((s.body, 1), (s.orelse, -1)):
+                sub = path + (i,)
+                found = find_loop(body, target, sub)
+                if found is not None:
+                    if sign < 0:
+                        p = found[0]
+                        # re-encode the index into the else branch
+                        p = p[: len(sub)] + (-1 - p[len(sub)],) + p[len(sub) + 1 :]
+                        loops = [
+                            (
+                                lp[: len(sub)]
+                                + (-1 - lp[len(sub)],)
+                                + lp[len(sub) + 1 :],
+                                l,
+                            )
+                            for lp, l in found[1]
+                        ]
+                        return p, loops
+                    return found
+    return None
+
+
+def get_dependence_graph(proc, loop):
+    """
+    Returns a pair `(graph, path)`, where `graph` is the dependence graph
+    of a loop nest containing `loop` and `path` the position of `loop`
+    within that nest, or `(None, None)` if no graph is available.
+    """
+    if not dependence.DEPENDENCE_TESTS:
+        return None, None
+    found = find_loop(proc.body, loop)
+    if found is None:
+        return None, None
+    loop_path, ancestors = found
+    ancestors = ancestors + [(loop_path, loop)]
+    for anc_path, anc in ancestors:
+        if (graph := _graphs.get(anc)) is not None:
+            return graph, loop_path[len(anc_path) :]
+    root_path, root = ancestors[0]
+    return _cache(root, DependenceGraph(root)), loop_path[len(root_path) :]
+
+
+def update_reordered(old_proc, new_proc, outer_loop):
+    """
+    Carry the graphs of the nest containing `outer_loop` in `old_proc`
+    over to `new_proc`, where `outer_loop` and the loop nested directly
+    inside of it have been swapped.
+    """
+    found = find_loop(old_proc.body, outer_loop)
+    if found is None:
+        return
+    loop_path, ancestors = found
+    inner_loop = outer_loop.body[0]
+
+    # make sure the swapped loops ended up in the same place
+    new_outer = _stmt_at(new_proc.body, loop_path)
+    if not (
+        isinstance(new_outer, LoopIR.For)
+        and new_outer.iter == inner_loop.iter
+        and isinstance(new_outer.body[0], LoopIR.For)
+        and new_outer.body[0].iter == outer_loop.iter
+    ):
+        return
+
+    for anc_path, anc in ancestors + [(loop_path, outer_loop)]:
+        if (graph := _graphs.get(anc)) is None:
+            continue
+        new_anc = _stmt_at(new_proc.body, anc_path)
+        _cache(new_anc, graph.reordered(new_anc, loop_path[len(anc_path) :]))
+
+
+def _stmt_at(stmts, path):
+    s = None
+    for i in path:
+        if s is not None:
+            stmts = s.orelse if i < 0 else s.body
+        i = -1 - i if i < 0 else i
+        if i >= len(stmts):
+            return None
+        s = stmts[i]
+    return s
@@ -0,0 +1,242 @@
+from collections import defaultdict
+
+from ..core.LoopIR import LoopIR, T
+from ..core.LoopIR_index import get_proc_index
+from ..core.caches import register_cache, WeakIdCache
+
+# This file implements a cheap pre-filter for replacing statements with
+# calls to instructions (or other sub-procedures).
+#
+# `replace` unifies the body of the instruction with a block of statements,
+# which involves renaming the instruction, computing the live variables at
+# the block, and solving a system of equations with the SMT solver.  Tools
+# like `replace_all` attempt this for every instruction at every site where
+# it could apply, and nearly all of those attempts fail.
+#
+# The shape of an instruction records the parts of its body which
+# unification must match exactly: the kinds of statements and how they
+# nest, the bounds of loops with constant bounds, the structure of the
+# non-index expressions, and the memories of its buffer arguments.  A block
+# which does not have the same shape can never unify with the instruction,
+# so `InstrShape.matches` is a necessary condition for `replace` to succeed,
+# never a sufficient one.  Everything unification treats more loosely
+# (index expressions, boolean and stride arguments, windows, precisions)
+# matches anything.
+
+
+def _is_data(typ):
+    return not typ.is_indexable() and typ != T.bool and typ != T.stride
+
+
+def _depth(stmts):
+    # the number of nested statement lists
+    depth = 0
+    for s in stmts:
+        if isinstance(s, LoopIR.If):
+            depth = max(depth, _depth(s.body), _depth(s.orelse))
+        elif isinstance(s, LoopIR.For):
+            depth = max(depth, _depth(s.body))
+    return depth + 1 if stmts else 0
+
+
+def _kinds(stmts, depth):
+    # the kinds of `stmts`, and of the statements nested in them up to
+    # `depth` statement lists deep
+    def kind(s):
+        if depth > 1 and isinstance(s, LoopIR.If):
+            return (type(s), _kinds(s.body, depth - 1), _kinds(s.orelse, depth - 1))
+        elif depth > 1 and isinstance(s, LoopIR.For):
+            return (type(s), _kinds(s.body, depth - 1))
+        return type(s)
+
+    return tuple(kind(s) for s in stmts)
+
+
+class InstrShape:
+    def __init__(self, proc):
+        assert isinstance(proc, LoopIR.proc)
+        self.depth = _depth(proc.body)
+        self.kinds = _kinds(proc.body, self.depth)
+        self.mems = {a.mem for a in proc.args if a.type.is_numeric()}
+        # shapes are cached by procedure, so they keep the body rather
+        # than the procedure itself
+        self.body = proc.body
+
+    def matches(self, stmts, mems=None):
+        """
+        Whether `stmts` could unify with the body of the instruction.  If
+        `mems` maps names of buffers to the memories they may be in, also
+        check that every buffer argument of the instruction could be passed
+        a buffer of `stmts` in a compatible memory.
+        """
+        if not self._match_stmts(self.body, stmts):
+            return False
+        if mems is None or not self.mems:
+            return True
+
+        avail = set()
+        for name in _buffers(stmts):
+            if (ms := mems.get(name)) is None:
+                return True  # not declared by an argument or allocation
+            avail.update(ms)
+        return all(any(issubclass(m, pm) for m in avail) for pm in self.mems)
+
+    def _match_stmts(self, ps, bs):
+        if len(ps) != len(bs):
+            return False
+        for p, b in zip(ps, bs):
+            if type(p) is not type(b):
+                return False
+            elif isinstance(p, (LoopIR.Assign, LoopIR.Reduce)):
+                if not self._match_e(p.rhs, b.rhs):
+                    return False
+            elif isinstance(p, LoopIR.WriteConfig):
+                if p.config != b.config or p.field != b.field:
+                    return False
+                if not self._match_e(p.rhs, b.rhs):
+                    return False
+            elif isinstance(p, LoopIR.If):
+                if not (
+                    self._match_stmts(p.body, b.body)
+                    and self._match_stmts(p.orelse, b.orelse)
+                ):
+                    return False
+            elif isinstance(p, LoopIR.For):
+                if not (
+                    _match_bound(p.lo, b.lo)
+                    and _match_bound(p.hi, b.hi)
+                    and self._match_stmts(p.body, b.body)
+                ):
+                    return False
+            elif isinstance(p, LoopIR.Call):
+                if p.f != b.f:
+                    return False
+                if not all(self._match_e(pa, ba) for pa, ba in zip(p.args, b.args)):
+                    return False
+        return True
+
+    def _match_e(self, pe, be):
+        if pe.type.is_indexable() != be.type.is_indexable() or (pe.type == T.bool) != (
+            be.type == T.bool
+        ):
+            return False
+        elif not _is_data(pe.type):
+            return True
+        elif type(pe) is not type(be):
+            return False
+        elif isinstance(pe, LoopIR.Const):
+            return pe.val == be.val
+        elif isinstance(pe, LoopIR.USub):
+            return self._match_e(pe.arg, be.arg)
+        elif isinstance(pe, LoopIR.BinOp):
+            return (
+                pe.op == be.op
+                and self._match_e(pe.lhs, be.lhs)
+                and self._match_e(pe.rhs, be.rhs)
+            )
+        elif isinstance(pe, LoopIR.Extern):
+            return pe.f == be.f and all(
+                self._match_e(pa, ba) for pa, ba in zip(pe.args, be.args)
+            )
+        elif isinstance(pe, LoopIR.ReadConfig):
+            return pe.config == be.config and pe.field == be.field
+        return True
+
+
+def _match_bound(pe, be):
+    # unification equates loop bounds, which fails for different constants
+    if isinstance(pe, LoopIR.Const) and isinstance(be, LoopIR.Const):
+        return pe.val == be.val
+    return True
+
+
+def _buffers(stmts):
+    # the names of the buffers accessed in `stmts`, which are those the
+    # buffer arguments of an instruction can be unified with
+    names = set()
+
+    def do_e(e):
+        if isinstance(e, LoopIR.Read):
+            if e.type.is_numeric():
+                names.add(str(e.name))
+            for i in e.idx:
+                do_e(i)
+        elif isinstance(e, LoopIR.WindowExpr):
+            names.add(str(e.name))
+        elif isinstance(e, LoopIR.USub):
+            do_e(e.arg)
+        elif isinstance(e, LoopIR.BinOp):
+            do_e(e.lhs)
+            do_e(e.rhs)
+        elif isinstance(e, LoopIR.Extern):
+            for a in e.args:
+                do_e(a)
+
+    def do_stmts(stmts):
+        for s in stmts:
+            if isinstance(s, (LoopIR.Assign, LoopIR.Reduce)):
+                names.add(str(s.name))
+                do_e(s.rhs)
+            elif isinstance(s, (LoopIR.WriteConfig, LoopIR.WindowStmt)):
+                do_e(s.rhs)
+            elif isinstance(s, LoopIR.If):
+                do_stmts(s.body)
+                do_stmts(s.orelse)
+            elif isinstance(s, LoopIR.For):
+                do_stmts(s.body)
+            elif isinstance(s, LoopIR.Call):
+                for a in s.args:
+                    do_e(a)
+
+    do_stmts(stmts)
+    return names
+
+
+def buffer_mems(proc):
+    """
+    The memories that each name of a buffer of `proc` may refer to.
+    """
+    mems = defaultdict(set)
+    for a in proc.args:
+        if a.type.is_numeric():
+            mems[str(a.name)].add(a.mem)
+    for name, entries in get_proc_index(proc).allocs.items():
+        mems[name].update(node.mem for _, node in entries)
+    return dict(mems)
+
+
+_shapes = register_cache("instr_shapes", WeakIdCache())
+
+
+def get_instr_shape(proc):
+    """
+    The `InstrShape` of `proc`, which is computed once per proc.
+    """
+    if (shape := _shapes.get(proc)) is None:
+        shape = InstrShape(proc)
+        _shapes.put(proc, shape)
+    return shape
+
+
+class InstrSelector:
+    """
+    An index of instructions by the kinds of the statements in their body,
+    to select the instructions which could replace a block of statements.
+    """
+
+    def __init__(self, procs):
+        self.shapes = [get_instr_shape(p) for p in procs]
+        self.groups = defaultdict(list)  # (depth, kinds) -> positions
+        for i, shape in enumerate(self.shapes):
+            self.groups[shape.depth, shape.kinds].append(i)
+        self.depths = sorted({shape.depth for shape in self.shapes})
+
+    def select(self, stmts, mems=None):
+        """
+        The positions of the instructions which could replace `stmts`, in
+        the order in which the instructions were given.
+        """
+        candidates = []
+        for depth in self.depths:
+            candidates += self.groups.get((depth, _kinds(stmts, depth)), [])
+        return [i for i in sorted(candidates) if self.shapes[i].matches(stmts, mems)]
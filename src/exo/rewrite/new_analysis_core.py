@@ -1,3 +1,4 @@
+import time
 from collections import ChainMap
 from dataclasses import dataclass
 from typing import Any, Union
@@ -13,18 +14,14 @@ from asdl_adt import ADT, validators
 from asdl_adt.validators import ValidationError
 from ..core.LoopIR import T, LoopIR
 from ..core.prelude import *
+from .smt_budget import smt_query, set_z3_timeout, z3_timed_out
+from .smt_cache import get_query_cache
+from .smt_profile import get_smt_profile
+from .smt_pool import z3_solvers, pysmt_solvers
 
 _first_run = True
 
 
-def _get_smt_solver():
-    factory = pysmt.factory.Factory(pysmt.shortcuts.get_env())
-    slvs = factory.all_solvers(logic=logics.LIA)
-    if len(slvs) == 0:
-        raise OSError("Could not find any SMT solvers")
-    return pysmt.shortcuts.Solver(name=next(iter(slvs)))
-
-
 # --------------------------------------------------------------------------- #
 # --------------------------------------------------------------------------- #
 # Analysis Expr
@@ -455,6 +452,28 @@ def aeFV(e, env=None):
         assert False, "bad case"
 
 
+def aeSize(e):
+    """the number of nodes in the expression tree `e`"""
+    if isinstance(e, (A.Var, A.Unk, A.Const, A.ConstSym, A.Stride)):
+        return 1
+    elif isinstance(e, (A.Not, A.USub, A.Definitely, A.Maybe, A.ForAll, A.Exists)):
+        return 1 + aeSize(e.arg)
+    elif isinstance(e, A.BinOp):
+        return 1 + aeSize(e.lhs) + aeSize(e.rhs)
+    elif isinstance(e, A.LetStrides):
+        return 1 + sum(aeSize(s) for s in e.strides) + aeSize(e.body)
+    elif isinstance(e, A.Select):
+        return 1 + aeSize(e.cond) + aeSize(e.tcase) + aeSize(e.fcase)
+    elif isinstance(e, A.Tuple):
+        return 1 + sum(aeSize(a) for a in e.args)
+    elif isinstance(e, A.LetTuple):
+        return 1 + aeSize(e.rhs) + aeSize(e.body)
+    elif isinstance(e, A.Let):
+        return 1 + sum(aeSize(r) for r in e.rhs) + aeSize(e.body)
+    else:
+        assert False, "bad case"
+
+
 def aeNegPos(e, pos, env=None, res=None):
     res = res or dict()
     env = env or dict()  # ChainMap()
@@ -615,17 +634,25 @@ def is_ternary(x):
 
 
 class SMTSolver:
+    Z3_MODE = True
+    # try to prove queries with the cheap linear presolver first
+    PRESOLVE = True
+
     def __init__(self, verbose=False):
         self.env = ChainMap()
         self.stride_sym = ChainMap()
         self.const_sym = dict()
         self.const_sym_count = 1
-        self.solver = _get_smt_solver()
+        self._solver = None
         self.verbose = verbose
-        self.z3 = Z3SubProc()
 
-        self.Z3_MODE = True
-        self.z3slv = z3lib.Solver()
+        if self.Z3_MODE:
+            # borrow a solver context from the pool, and give it
+            # back once this SMTSolver is no longer in use
+            self.z3slv = z3_solvers.acquire()
+            z3_solvers.release_when_dead(self, self.z3slv)
+        else:
+            self.z3 = Z3SubProc()
 
         # used during lowering
         self.mod_div_tmp_bins = []
@@ -640,17 +667,28 @@ class SMTSolver:
         else:
             return x if is_ternary(x) else TernVal(x, SMT.Bool(True))
 
+    @property
+    def solver(self):
+        # the pysmt solver is only needed to extract counter-examples,
+        # so avoid paying for its construction until then
+        if self._solver is None:
+            self._solver = pysmt_solvers.acquire()
+            pysmt_solvers.release_when_dead(self, self._solver)
+        return self._solver
+
     def push(self):
-        self.solver.push()
-        self.z3.push()
         self.internal_push()
-        self.z3slv.push()
+        if self.Z3_MODE:
+            self.z3slv.push()
+        else:
+            self.z3.push()
 
     def pop(self):
         self.internal_pop()
-        self.z3.pop()
-        self.solver.pop()
-        self.z3slv.pop()
+        if self.Z3_MODE:
+            self.z3slv.pop()
+        else:
+            self.z3.pop()
 
     def internal_push(self):
         self.env = self.env.new_child()
@@ -727,6 +765,9 @@ class SMTSolver:
     def satisfy(self, e):
         assert e.type is T.bool
         e = e.simplify()
+        prof = get_smt_profile()
+        if prof is not None:
+            start = time.perf_counter()
         self.push()
         self._add_free_vars(e)
         self.negative_pos = aeNegPos(e, "-")
@@ -734,23 +775,29 @@ class SMTSolver:
         assert not is_ternary(smt_e), "formulas must be classical"
         if self.Z3_MODE:
             self.z3slv.assert_exprs(smt_e)
-            result = self.z3slv.check()
-            if result == Z3.sat:
-                is_sat = True
-            elif result == Z3.unsat:
-                is_sat = False
-            else:
-                raise TypeError("unknown result from z3")
         else:
             self.z3.add_assertion(smt_e)
-            is_sat = self.z3.run_check_sat()
+        if prof is not None:
+            lowered = time.perf_counter()
+        is_sat = self._check_sat()
         # is_sat      = self.solver.is_sat(smt_e)
         self.pop()
+        if prof is not None:
+            prof.record_query(
+                aeSize(e), lowered - start, time.perf_counter() - lowered, is_sat
+            )
         return is_sat
 
     def verify(self, e):
         assert e.type is T.bool
         e = e.simplify()
+        prof = get_smt_profile()
+        if self.PRESOLVE and presolve_valid(self._assumptions(), e):
+            if prof is not None:
+                prof.record_presolved(aeSize(e))
+            return True
+        if prof is not None:
+            start = time.perf_counter()
         self.push()
         self._add_free_vars(e)
         self.negative_pos = aeNegPos(e, "+")
@@ -771,20 +818,60 @@ class SMTSolver:
             self.z3slv.assert_exprs(Z3.Not(smt_e))
             if self.verbose and self.Z3_MODE:
                 print(self.z3slv.to_smt2())
-            result = self.z3slv.check()
-            if result == Z3.sat:
-                is_valid = False
-            elif result == Z3.unsat:
-                is_valid = True
-            else:
-                raise TypeError("unknown result from z3")
         else:
             self.z3.add_assertion(SMT.Not(smt_e))
-            is_valid = not self.z3.run_check_sat()
+        if prof is not None:
+            lowered = time.perf_counter()
+        is_valid = not self._check_sat()
         # is_valid    = self.solver.is_valid(smt_e)
         self.pop()
+        if prof is not None:
+            prof.record_query(
+                aeSize(e), lowered - start, time.perf_counter() - lowered, not is_valid
+            )
         return is_valid
 
+    def _assumptions(self):
+        return [c[1] for f in self.frames for c in f.commands if c[0] == "assume"]
+
+    def _assertions_str(self):
+        if self.Z3_MODE:
+            return "\n".join(a.sexpr() for a in self.z3slv.assertions())
+        else:
+            return self.z3._get_whole_str()
+
+    def _check_sat(self):
+        """check whether the current set of assertions is satisfiable,
+        consulting the persistent query cache if it has been enabled"""
+        cache = get_query_cache()
+        if cache is not None:
+            key = cache.key("sat", self._assertions_str())
+            if (is_sat := cache.lookup(key)) is not None:
+                return is_sat
+
+        with smt_query() as q:
+            if self.Z3_MODE:
+                set_z3_timeout(self.z3slv, q.limit)
+                result = self.z3slv.check()
+            else:
+                # the subprocess solver does not support timeouts, but
+                # its queries still count against the budget
+                is_sat = self.z3.run_check_sat()
+
+        if self.Z3_MODE:
+            if result == Z3.sat:
+                is_sat = True
+            elif result == Z3.unsat:
+                is_sat = False
+            elif z3_timed_out(self.z3slv, q.limit, q.start):
+                raise q.timeout()
+            else:
+                raise TypeError("unknown result from z3")
+
+        if cache is not None:
+            cache.store(key, is_sat)
+        return is_sat
+
     def counter_example(self):
         raise NotImplementedError("Out of Date")
 
@@ -1184,3 +1271,4 @@ class Z3SubProc:
 
 # install simplify
 from . import analysis_simplify
+from .presolve import presolve_valid
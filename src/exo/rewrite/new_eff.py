@@ -1,8 +1,11 @@
+import functools
 from collections import OrderedDict, ChainMap
 from enum import Enum
 from itertools import chain
 
 from ..core.LoopIR import Alpha_Rename, SubstArgs, LoopIR_Do
+from ..core.LoopIR_hash import AlphaKey, alpha_sym_map
+from ..core.caches import register_cache, LRUCache, WeakIdCache
 from ..core.configs import reverse_config_lookup, Config
 from .new_analysis_core import *
 from ..core.proc_eqv import get_repr_proc
@@ -11,14 +14,38 @@ from ..core.proc_eqv import get_repr_proc
 # --------------------------------------------------------------------------- #
 # Useful Basic Concepts and Structured Data
 
-_simple_proc_cache = dict()
+# The caches of analysis results for whole procs.  They are keyed on
+# alpha-equivalence, so that the procs produced by re-running a schedule
+# share one simple proc (and everything cached on it), and bounded, since
+# they keep the procs in their keys alive.
+PROC_CACHE_SIZE = 1024
+
+_simple_proc_cache = register_cache("simple_proc", LRUCache(PROC_CACHE_SIZE))
 
 
 def get_simple_proc(proc):
-    orig_repr = get_repr_proc(proc)
-    if orig_repr not in _simple_proc_cache:
-        _simple_proc_cache[orig_repr] = Alpha_Rename(orig_repr).result()
-    return _simple_proc_cache[orig_repr]
+    key = AlphaKey(get_repr_proc(proc))
+    if (simple := _simple_proc_cache.get(key)) is None:
+        simple = Alpha_Rename(key.proc).result()
+        _simple_proc_cache.put(key, simple)
+    return simple
+
+
+def _alpha_cached(cache, proc, analysis):
+    """
+    Look up the set of symbols computed by `analysis(proc)` in `cache`,
+    which is shared by all procs alpha-equivalent to `proc`.  Results
+    computed for another proc are renamed to the symbols of `proc`.
+    """
+    key = AlphaKey(proc)
+    if (entry := cache.get(key)) is None:
+        entry = (proc, analysis(proc))
+        cache.put(key, entry)
+    canon, result = entry
+    if canon is proc:
+        return result
+    renaming = alpha_sym_map(canon, proc)
+    return {renaming.get(nm, nm) for nm in result}
 
 
 @dataclass
@@ -613,13 +640,14 @@ def call_bindings(call_args, sig_args):
     return aenv_join(aenvs)
 
 
-_globenv_proc_cache = dict()
+_globenv_proc_cache = register_cache("globenv_proc", WeakIdCache())
 
 
 def globenv_proc(proc):
-    if proc not in _globenv_proc_cache:
-        _globenv_proc_cache[proc] = globenv(proc.body)
-    return _globenv_proc_cache[proc]
+    if (env := _globenv_proc_cache.get(proc)) is None:
+        env = globenv(proc.body)
+        _globenv_proc_cache.put(proc, env)
+    return env
 
 
 # --------------------------------------------------------------------------- #
@@ -1221,23 +1249,24 @@ def stmts_effs(stmts):
     return effs
 
 
-_proc_effs_cache = dict()
+_proc_effs_cache = register_cache("proc_effs", WeakIdCache())
 
 
 def proc_effs(proc):
-    if proc not in _proc_effs_cache:
-        _proc_effs_cache[proc] = stmts_effs(proc.body)
-    return _proc_effs_cache[proc]
+    if (effs := _proc_effs_cache.get(proc)) is None:
+        effs = stmts_effs(proc.body)
+        _proc_effs_cache.put(proc, effs)
+    return effs
     raise NotImplementedError("TODO")
 
 
-_proc_changeset_cache = dict()
+_proc_changeset_cache = register_cache("changing_scalars", LRUCache(PROC_CACHE_SIZE))
 
 
 def proc_changing_scalars(proc):
-    if proc not in _proc_changeset_cache:
-        _proc_changeset_cache[proc] = get_changing_scalars(proc.body)
-    return _proc_changeset_cache[proc]
+    return _alpha_cached(
+        _proc_changeset_cache, proc, lambda p: get_changing_scalars(p.body)
+    )
 
 
 def get_changing_scalars(stmts, changeset=None, aliases=None):
@@ -1568,13 +1597,20 @@ def Shadows(a1, a2):
 # --------------------------------------------------------------------------- #
 # Scheduling Checks
 
-import inspect
+import sys
 import textwrap
+import time
 from ..API_types import ProcedureBase
+from . import dependence, dependence_graph
+from .smt_budget import SMTTimeout, smt_scope, log_timeout
+from .smt_profile import get_smt_profile
 
 
 class SchedulingError(Exception):
     def __init__(self, message, **kwargs):
+        # remember the un-decorated message so that the error can be
+        # re-raised (e.g. from a memoized check) in a different context
+        self._orig_args = (message, kwargs)
         ops = self._get_scheduling_ops()
         # TODO: include outer ops in message
         message = f"{ops[0]}: {message}"
@@ -1592,16 +1628,218 @@ class SchedulingError(Exception):
     @staticmethod
     def _get_scheduling_ops():
         ops = []
-        for frame in inspect.stack():
-            if obj := frame[0].f_locals.get("self"):
-                fn = frame.function
-                if isinstance(obj, ProcedureBase) and not fn.startswith("_"):
-                    ops.append(fn)
+        frame = sys._getframe(1)
+        while frame is not None:
+            code = frame.f_code
+            # only materialize the locals of methods
+            if "self" in code.co_varnames and not code.co_name.startswith("_"):
+                if isinstance(frame.f_locals.get("self"), ProcedureBase):
+                    ops.append(code.co_name)
+            frame = frame.f_back
         if not ops:
             ops = ["<<<unknown directive>>>"]
         return ops
 
 
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Memoization of Scheduling Checks
+
+# Scheduling searches (e.g. autotuning scripts) frequently ask exactly the
+# same safety question about structurally identical procedures.  Each
+# Check_... function below is a pure function of the procedure and of the
+# focused statements/expressions, so we remember its outcome (either its
+# return value or the SchedulingError it raised) under a structural key.
+#
+# The key consists of
+#   - the structure of the procedure, with every Sym renamed in order of
+#     first occurrence (so alpha-equivalent procedures share a key)
+#   - for each focused statement, its path within the procedure
+#     (which determines its context) and its source location
+#     (which shows up in error messages)
+#   - the structure of every other argument, with Syms renamed
+#     consistently with the procedure
+# Sub-procedures, memories, configs and externs are keyed by identity;
+# holding them in the key keeps them alive, so identities cannot be reused.
+
+CHECK_MEMO_SIZE = 2048
+
+
+_check_memo = register_cache("check_memo", LRUCache(CHECK_MEMO_SIZE))
+
+
+def clear_check_memo():
+    _check_memo.clear()
+    _bounds_facts.clear()
+
+
+def check_memo_stats():
+    return {
+        "hits": _check_memo.hits,
+        "misses": _check_memo.misses,
+        "size": len(_check_memo),
+    }
+
+
+class _StructKey:
+    def __init__(self):
+        self.syms = dict()
+        self.paths = dict()
+
+    def sym(self, x):
+        if x not in self.syms:
+            self.syms[x] = len(self.syms)
+        return (x.name(), self.syms[x])
+
+    def proc(self, p):
+        return (
+            p.name,
+            tuple(self.node(fa) for fa in p.args),
+            tuple(self.node(e) for e in p.preds),
+            self.stmts(p.body, ()),
+            p.instr,
+        )
+
+    def stmts(self, stmts, path):
+        res = []
+        for i, s in enumerate(stmts):
+            spath = path + (i,)
+            self.paths.setdefault(id(s), spath)
+            if isinstance(s, LoopIR.If):
+                res.append(
+                    (
+                        "If",
+                        self.node(s.cond),
+                        self.stmts(s.body, spath + ("body",)),
+                        self.stmts(s.orelse, spath + ("orelse",)),
+                    )
+                )
+            elif isinstance(s, LoopIR.For):
+                res.append(
+                    (
+                        "For",
+                        self.sym(s.iter),
+                        self.node(s.lo),
+                        self.node(s.hi),
+                        self.stmts(s.body, spath + ("body",)),
+                        type(s.loop_mode).__name__,
+                    )
+                )
+            else:
+                res.append(self.node(s))
+        return tuple(res)
+
+    def node(self, n):
+        if isinstance(n, Sym):
+            return self.sym(n)
+        elif isinstance(n, (list, tuple)):
+            return tuple(self.node(x) for x in n)
+        elif isinstance(n, (set, frozenset)):
+            return frozenset(n)
+        elif isinstance(n, LoopIR.proc):
+            return n
+        elif isinstance(n, LoopIR.Const):
+            return ("Const", type(n.val).__name__, n.val, self.node(n.type))
+        elif isinstance(n, (LoopIR.stmt, LoopIR.expr, LoopIR.w_access, LoopIR.type)):
+            return (type(n).__name__,) + tuple(
+                self.node(getattr(n, f)) for f in n.__annotations__ if f != "srcinfo"
+            )
+        elif isinstance(n, LoopIR.fnarg):
+            return (self.sym(n.name), self.node(n.type), n.mem)
+        else:
+            return n
+
+    def arg(self, a):
+        if isinstance(a, LoopIR.stmt):
+            return self.focus_stmt(a)
+        elif isinstance(a, list) and all(isinstance(s, LoopIR.stmt) for s in a):
+            return tuple(self.focus_stmt(s) for s in a)
+        else:
+            return self.node(a)
+
+    def focus_stmt(self, s):
+        if (path := self.paths.get(id(s))) is not None:
+            return ("@", path, str(s.srcinfo))
+        return (self.node(s), str(s.srcinfo))
+
+
+def _focus_srcinfo(proc, args):
+    for a in args:
+        if isinstance(a, list) and len(a) > 0:
+            a = a[0]
+        a = getattr(a, "_node", a)  # cursors
+        if isinstance(a, (LoopIR.stmt, LoopIR.expr)):
+            return a.srcinfo
+    return getattr(proc, "srcinfo", None)
+
+
+def _smt_scoped(check):
+    """
+    Attribute the SMT queries of `check` to it and to the procedure being
+    checked (see smt_budget.py and smt_profile.py), and report queries
+    running out of time as an unprovable condition
+    """
+
+    @functools.wraps(check)
+    def scoped(proc, *args, **kwargs):
+        srcinfo = _focus_srcinfo(proc, args)
+        name = proc.name if isinstance(proc, LoopIR.proc) else None
+        prof = get_smt_profile()
+        if prof is not None:
+            start = time.perf_counter()
+        try:
+            with smt_scope(check.__name__, name, srcinfo):
+                return check(proc, *args, **kwargs)
+        except SMTTimeout as err:
+            log_timeout(check.__name__, srcinfo, err)
+            raise SchedulingError(
+                f"could not prove the safety of this rewrite: "
+                f"{check.__name__} at {srcinfo} gave up ({err})"
+            ) from err
+        finally:
+            if prof is not None:
+                elapsed = time.perf_counter() - start
+                prof.record_check(check.__name__, srcinfo, elapsed)
+
+    return scoped
+
+
+def _memoize_check(check):
+    check = _smt_scoped(check)
+
+    @functools.wraps(check)
+    def memoized(proc, *args, **kwargs):
+        if not isinstance(proc, LoopIR.proc):
+            return check(proc, *args, **kwargs)
+
+        sk = _StructKey()
+        key = (
+            check.__name__,
+            sk.proc(proc),
+            tuple(sk.arg(a) for a in args),
+            tuple((k, sk.arg(v)) for k, v in sorted(kwargs.items())),
+        )
+
+        if (entry := _check_memo.get(key)) is not None:
+            is_err, val = entry
+            if is_err:
+                msg, err_kwargs = val
+                raise SchedulingError(msg, **err_kwargs)
+            return set(val) if isinstance(val, set) else val
+
+        try:
+            val = check(proc, *args, **kwargs)
+        except SchedulingError as err:
+            # running out of time is not a property of the procedure
+            if not isinstance(err.__cause__, SMTTimeout):
+                _check_memo.put(key, (True, err._orig_args))
+            raise
+        _check_memo.put(key, (False, set(val) if isinstance(val, set) else val))
+        return val
+
+    return memoized
+
+
 def loop_globenv(i, lo_expr, hi_expr, body):
     assert isinstance(lo_expr, LoopIR.expr)
     assert isinstance(hi_expr, LoopIR.expr)
@@ -1610,6 +1848,7 @@ def loop_globenv(i, lo_expr, hi_expr, body):
     return globenv(loop)
 
 
+@_memoize_check
 def Check_ReorderStmts(proc, s1, s2):
     ctxt = ContextExtraction(proc, [s1, s2])
 
@@ -1632,6 +1871,7 @@ def Check_ReorderStmts(proc, s1, s2):
         )
 
 
+@_memoize_check
 def Check_ReorderLoops(proc, s):
     ctxt = ContextExtraction(proc, [s])
 
@@ -1668,34 +1908,28 @@ def Check_ReorderLoops(proc, s):
     def bds(x, lo, hi):
         return AAnd(lift_e(lo) <= AInt(x), AInt(x) < lift_e(hi))
 
-    reorder_is_safe = AAnd(
-        AForAll(
-            [x, y],
-            AImplies(
-                AMay(AAnd(bds(x, x_loop.lo, x_loop.hi), bds(y, y_loop.lo, y_loop.hi))),
-                Commutes(a_bd, a),
-            ),
-        ),
-        AForAll(
-            [x, y, x2, y2],
-            AImplies(
-                AMay(
-                    AAnd(
-                        bds(x, x_loop.lo, x_loop.hi),
-                        bds(y, y_loop.lo, y_loop.hi),
-                        bds(x2, x_loop.lo, x_loop.hi),
-                        bds(y2, y_loop.lo, y_loop.hi),
-                        AInt(x) < AInt(x2),
-                        AInt(y2) < AInt(y),
-                    )
-                ),
-                Commutes(a, a2),
-            ),
-        ),
-    )
+    # try to discharge each condition with the dependence tests first
+    hyps = dependence.outer_assumptions(p, G)
+    bds_xy = [bds(x, x_loop.lo, x_loop.hi), bds(y, y_loop.lo, y_loop.hi)]
+    bds_xy2 = bds_xy + [
+        bds(x2, x_loop.lo, x_loop.hi),
+        bds(y2, y_loop.lo, y_loop.hi),
+        AInt(x) < AInt(x2),
+        AInt(y2) < AInt(y),
+    ]
 
-    pred = G(reorder_is_safe)
-    is_ok = slv.verify(pred)
+    graph, path = dependence_graph.get_dependence_graph(proc, s)
+    body_ok = graph is not None and not graph.may_depend(path, ("<", ">"), "commute")
+
+    conds = []
+    if not dependence.commutes(a_bd, a, hyps + bds_xy):
+        conds.append(AForAll([x, y], AImplies(AMay(AAnd(*bds_xy)), Commutes(a_bd, a))))
+    if not body_ok and not dependence.commutes(a, a2, hyps + bds_xy2):
+        conds.append(
+            AForAll([x, y, x2, y2], AImplies(AMay(AAnd(*bds_xy2)), Commutes(a, a2)))
+        )
+
+    is_ok = len(conds) == 0 or slv.verify(G(AAnd(*conds)))
     slv.pop()
     if not is_ok:
         raise SchedulingError(f"Loops {x} and {y} at {s.srcinfo} cannot be reordered.")
@@ -1709,6 +1943,7 @@ def Check_ReorderLoops(proc, s):
 #   (forall i. May(InBound(i,e)) ==> Commutes(ae, a1))
 #   /\ ( forall i,i'. May(InBound(i,i',e) /\ i < i') => Commutes(a1', a1) )
 #
+@_memoize_check
 def Check_ParallelizeLoop(proc, s):
     ctxt = ContextExtraction(proc, [s])
 
@@ -1735,20 +1970,27 @@ def Check_ParallelizeLoop(proc, s):
     def bds(x, lo, hi):
         return AAnd(lift_e(lo) <= AInt(x), AInt(x) < lift_e(hi))
 
-    no_bound_change = AForAll(
-        [i],
-        AImplies(AMay(bds(i, lo, hi)), Commutes(a_bd, a)),
-    )
-    bodies_commute = AForAll(
-        [i, i2],
-        AImplies(
-            AMay(AAnd(bds(i, lo, hi), bds(i2, lo, hi), AInt(i) < AInt(i2))),
-            Disjoint_Memory(a, a2),
-        ),
-    )
+    hyps = dependence.outer_assumptions(p, G)
+    bds_i = [bds(i, lo, hi)]
+    bds_ii2 = bds_i + [bds(i2, lo, hi), AInt(i) < AInt(i2)]
 
-    pred = G(AAnd(no_bound_change, bodies_commute))
-    is_ok = slv.verify(pred)
+    conds = []
+    if not dependence.commutes(a_bd, a, hyps + bds_i):
+        no_bound_change = AForAll(
+            [i],
+            AImplies(AMay(AAnd(*bds_i)), Commutes(a_bd, a)),
+        )
+        conds.append(no_bound_change)
+    graph, path = dependence_graph.get_dependence_graph(proc, s)
+    body_ok = graph is not None and not graph.may_depend(path, ("<",), "disjoint")
+    if not body_ok and not dependence.disjoint(a, a2, hyps + bds_ii2):
+        bodies_commute = AForAll(
+            [i, i2],
+            AImplies(AMay(AAnd(*bds_ii2)), Disjoint_Memory(a, a2)),
+        )
+        conds.append(bodies_commute)
+
+    is_ok = len(conds) == 0 or slv.verify(G(AAnd(*conds)))
     slv.pop()
     if not is_ok:
         raise SchedulingError(f"Cannot parallelize loop over {i} at {s.srcinfo}")
@@ -1763,6 +2005,7 @@ def Check_ParallelizeLoop(proc, s):
 #   /\ ( forall i,i'. May(InBound(i,i',e) /\ i < i')  =>
 #                     Commutes(a1', a2) /\ AllocCommutes(a1, a2) )
 #
+@_memoize_check
 def Check_FissionLoop(proc, loop, stmts1, stmts2, no_loop_var_1=False):
     ctxt = ContextExtraction(proc, [loop])
     chgG = get_changing_scalars(proc.body)
@@ -1799,32 +2042,64 @@ def Check_FissionLoop(proc, loop, stmts1, stmts2, no_loop_var_1=False):
     def bds(x, lo, hi):
         return AAnd(lift_e(lo) <= AInt(x), AInt(x) < lift_e(hi))
 
-    commute12 = Gloop(
-        Commutes_Fissioning(
-            a1_j, a2, globenv(stmts1_j), globenv(stmts2), a1_no_loop_var=no_loop_var_1
+    # try to discharge each condition with the dependence tests first.
+    # The commutativity of the two statements is stated under `Gloop`,
+    # so assumptions on values rebound by `Gloop` are dropped for it.
+    hyps = dependence.outer_assumptions(p, G)
+    bds_i = [bds(i, lo, hi)]
+    bds_ij = bds_i + [bds(j, lo, hi), AInt(i) < AInt(j)]
+    hyps_loop = dependence.outer_assumptions(AAnd(*hyps, *bds_ij), Gloop)
+
+    bounds_ok = dependence.commutes(a_bd, a1, hyps + bds_i)
+    bounds_ok = bounds_ok and dependence.commutes(a_bd, a2, hyps + bds_i)
+    commute12_ok = False
+    k = len(stmts1)
+    if loop.body[:k] == stmts1 and loop.body[k:] == stmts2:
+        graph, path = dependence_graph.get_dependence_graph(proc, loop)
+        commute12_ok = graph is not None and not graph.may_depend(
+            path, (">",), "commute", src=lambda i: i < k, dst=lambda i: i >= k
         )
-    )
-
-    no_bound_change = AForAll(
-        [i],
-        AImplies(AMay(bds(i, lo, hi)), AAnd(Commutes(a_bd, a1), Commutes(a_bd, a2))),
-    )
-    stmts_commute = AForAll(
-        [i, j],
-        AImplies(
-            AMay(AAnd(bds(i, lo, hi), bds(j, lo, hi), AInt(i) < AInt(j))),
-            AAnd(commute12, AllocCommutes(a1, a2)),
-        ),
-    )
+    commute12_ok = commute12_ok or dependence.commutes(a1_j, a2, hyps_loop)
+    alloc_ok = dependence.alloc_commutes(a1, a2)
+
+    conds, stmts_conds = [], []
+    if not bounds_ok:
+        no_bound_change = AForAll(
+            [i],
+            AImplies(AMay(AAnd(*bds_i)), AAnd(Commutes(a_bd, a1), Commutes(a_bd, a2))),
+        )
+        conds.append(no_bound_change)
+    if not commute12_ok:
+        commute12 = Gloop(
+            Commutes_Fissioning(
+                a1_j,
+                a2,
+                globenv(stmts1_j),
+                globenv(stmts2),
+                a1_no_loop_var=no_loop_var_1,
+            )
+        )
+        stmts_conds.append(commute12)
+    if not alloc_ok:
+        stmts_conds.append(AllocCommutes(a1, a2))
+    if stmts_conds:
+        stmts_commute = AForAll(
+            [i, j],
+            AImplies(AMay(AAnd(*bds_ij)), AAnd(*stmts_conds)),
+        )
+        conds.append(stmts_commute)
 
-    pred = filter_reals(G(AAnd(no_bound_change, stmts_commute)), chgG)
-    # pred    = G(AAnd(no_bound_change, stmts_commute))
-    is_ok = slv.verify(pred)
+    if len(conds) == 0:
+        is_ok = True
+    else:
+        pred = filter_reals(G(AAnd(*conds)), chgG)
+        is_ok = slv.verify(pred)
     slv.pop()
     if not is_ok:
         raise SchedulingError(f"Cannot fission loop over {i} at {loop.srcinfo}.")
 
 
+@_memoize_check
 def Check_DeleteConfigWrite(proc, stmts):
     assert len(stmts) > 0
     ctxt = ContextExtraction(proc, stmts)
@@ -1900,6 +2175,7 @@ def Check_DeleteConfigWrite(proc, stmts):
 # is equivalent modulo the keys in `cfg_mod`, so
 # the only thing we want to check is whether that can be
 # extended, and if so, modulo what set of output globals?
+@_memoize_check
 def Check_ExtendEqv(proc, stmts0, stmts1, cfg_mod):
     assert len(stmts0) > 0
     assert len(stmts1) > 0
@@ -1952,6 +2228,7 @@ def Check_ExtendEqv(proc, stmts0, stmts1, cfg_mod):
     return cfg_mod_visible
 
 
+@_memoize_check
 def Check_ExprEqvInContext(proc, expr0, stmts0, expr1, stmts1=None):
     assert len(stmts0) > 0
     stmts1 = stmts1 or stmts0
@@ -1977,6 +2254,7 @@ def Check_ExprEqvInContext(proc, expr0, stmts0, expr1, stmts1=None):
         raise SchedulingError(f"Expressions are not equivalent:\n{expr0}\nvs.\n{expr1}")
 
 
+@_memoize_check
 def Check_BufferReduceOnly(proc, stmts, buf, ndim):
     assert len(stmts) > 0
     ctxt = ContextExtraction(proc, stmts)
@@ -2003,6 +2281,7 @@ def Check_BufferReduceOnly(proc, stmts, buf, ndim):
 
 
 # TODO: I think idxs should be passed as either a read, window, or write (assign/reduce)
+@_smt_scoped
 def Check_Access_In_Window(proc, access_cursor, w_exprs, block_cursor):
     """
     Returns True if idxs always lies within w_exprs
@@ -2087,9 +2366,134 @@ def Check_Access_In_Window(proc, access_cursor, w_exprs, block_cursor):
     )
 
 
+# Check_Bounds splits its obligation into one condition per statement of
+# the block, and remembers which statements have been proven in bounds.
+# A fact is keyed by the structure (as in the check memo above) of the
+# statement, the allocation, and everything else the condition depends
+# on: the headers of the enclosing loops and branches, and the statements
+# before it which bind globals, windows or allocations (see `globenv`).
+# After a local rewrite, only the statements which changed, or whose
+# context changed, have to be verified again.  Statements which do not
+# access the buffer at all are not verified.
+
+BOUNDS_FACTS_SIZE = 8192
+
+_bounds_facts = register_cache("bounds_facts", LRUCache(BOUNDS_FACTS_SIZE))
+
+
+def bounds_facts_stats():
+    return {
+        "hits": _bounds_facts.hits,
+        "misses": _bounds_facts.misses,
+        "size": len(_bounds_facts),
+    }
+
+
+class _BufferUses(LoopIR_Do):
+    """
+    Decides whether statements access any of the given buffers, or
+    windows onto them (which are added as they are encountered)
+    """
+
+    def __init__(self, names):
+        self.names = set(names)
+        self.found = False
+
+    def uses(self, stmts):
+        self.found = False
+        self.do_stmts(stmts)
+        return self.found
+
+    def do_s(self, s):
+        if isinstance(s, (LoopIR.Assign, LoopIR.Reduce)) and s.name in self.names:
+            self.found = True
+        elif isinstance(s, LoopIR.WindowStmt) and s.rhs.name in self.names:
+            self.names.add(s.name)
+        super().do_s(s)
+
+    def do_e(self, e):
+        if isinstance(e, (LoopIR.Read, LoopIR.WindowExpr)) and e.name in self.names:
+            self.found = True
+        super().do_e(e)
+
+    def do_t(self, t):
+        pass
+
+
+def _binds_env(s):
+    """does `globenv([s])` bind anything?"""
+    if isinstance(s, (LoopIR.WriteConfig, LoopIR.WindowStmt, LoopIR.Alloc)):
+        return True
+    elif isinstance(s, (LoopIR.If, LoopIR.For)):
+        return len(possible_config_writes([s])) > 0
+    elif isinstance(s, LoopIR.Call):
+        return len(possible_config_writes(s.f.body)) > 0
+    return False
+
+
+def _env_stmts(stmts):
+    return tuple(s for s in stmts if _binds_env(s))
+
+
+def _bounds_context(proc, block):
+    """
+    The parts of `proc` which determine the context of `block` (see
+    `ContextExtraction`), or None if `block` cannot be found
+    """
+
+    def ctx_stmts(stmts):
+        for i, s in enumerate(stmts):
+            if s is block[0]:
+                return (_env_stmts(stmts[:i]),)
+            elif (sub := ctx_s(s)) is not None:
+                return (_env_stmts(stmts[:i]),) + sub
+        return None
+
+    def ctx_s(s):
+        if isinstance(s, LoopIR.If):
+            for branch, body in (("body", s.body), ("orelse", s.orelse)):
+                if (sub := ctx_stmts(body)) is not None:
+                    return (("If", s.cond, branch),) + sub
+        elif isinstance(s, LoopIR.For):
+            if (sub := ctx_stmts(s.body)) is not None:
+                # the previous iterations of the whole body matter as well
+                hdr = ("For", s.iter, s.lo, s.hi, _env_stmts(s.body))
+                return (hdr,) + sub
+        return None
+
+    if (ctx := ctx_stmts(proc.body)) is None:
+        return None
+    return (tuple(proc.args), tuple(proc.preds)) + ctx
+
+
+@_memoize_check
 def Check_Bounds(proc, alloc_stmt, block):
     if len(block) == 0:
         return
+
+    # find the statements whose bounds are not known yet
+    ctx = _bounds_context(proc, block)
+    if ctx is not None:
+        ctx_sk = _StructKey()
+        ctx_key = ctx_sk.node((alloc_stmt.name, alloc_stmt.type, ctx))
+    uses = _BufferUses([alloc_stmt.name])
+    uses.uses(proc.body)  # collect windows onto the buffer
+    todo = []
+    pre_stmts = ()
+    for s in block:
+        if uses.uses([s]):
+            key = None
+            if ctx is not None:
+                sk = _StructKey()
+                sk.syms = dict(ctx_sk.syms)
+                key = (ctx_key, sk.node(pre_stmts), sk.node(s))
+            if key is None or _bounds_facts.get(key) is None:
+                todo.append((key, pre_stmts, s))
+        if _binds_env(s):
+            pre_stmts = pre_stmts + (s,)
+    if len(todo) == 0:
+        return
+
     ctxt = ContextExtraction(proc, block)
 
     p = ctxt.get_control_predicate()
@@ -2119,15 +2523,22 @@ def Check_Bounds(proc, alloc_stmt, block):
         for i in reversed(coords):
             alloc_set = LBigUnion(i, alloc_set)
 
-    a = G(stmts_effs(block))
-    All = getsets([ES.ALL], a)[0]
-    All_inbuf = LIsct(All, LS.WholeBuf(alloc_stmt.name, len(shape)))
-    is_ok = slv.verify(ADef(is_empty(LDiff(All_inbuf, alloc_set))))
+    for key, pre_stmts, s in todo:
+        pre_env = [E.BindEnv(globenv([s0])) for s0 in pre_stmts]
+        a = G(pre_env + stmts_effs([s]))
+        All = getsets([ES.ALL], a)[0]
+        All_inbuf = LIsct(All, LS.WholeBuf(alloc_stmt.name, len(shape)))
+        if not slv.verify(ADef(is_empty(LDiff(All_inbuf, alloc_set)))):
+            slv.pop()
+            raise SchedulingError(
+                f"The buffer {alloc_stmt.name} is accessed out-of-bounds"
+            )
+        if key is not None:
+            _bounds_facts.put(key, True)
     slv.pop()
-    if not is_ok:
-        raise SchedulingError(f"The buffer {alloc_stmt.name} is accessed out-of-bounds")
 
 
+@_memoize_check
 def Check_IsDeadAfter(proc, stmts, bufname, ndim):
     assert len(stmts) > 0
     ctxt = ContextExtraction(proc, stmts)
@@ -2150,6 +2561,7 @@ def Check_IsDeadAfter(proc, stmts, bufname, ndim):
         )
 
 
+@_memoize_check
 def Check_IsIdempotent(proc, stmts):
     assert len(stmts) > 0
     ctxt = ContextExtraction(proc, stmts)
@@ -2169,6 +2581,7 @@ def Check_IsIdempotent(proc, stmts):
         raise SchedulingError(f"The statement at {stmts[0].srcinfo} is not idempotent.")
 
 
+@_memoize_check
 def Check_ExprBound(proc, stmts, expr, op, value, exception=True):
     assert len(stmts) > 0
 
@@ -2216,6 +2629,7 @@ def Check_ExprBound(proc, stmts, expr, op, value, exception=True):
         )
 
 
+@_memoize_check
 def Check_CodeIsDead(proc, stmts):
     assert len(stmts) > 0
     ctxt = ContextExtraction(proc, stmts)
@@ -2361,13 +2775,13 @@ class _OverApproxEffects(LoopIR_Do):
         super().do_e(e)
 
 
-_overapprox_proc_cache = dict()
+_overapprox_proc_cache = register_cache("overapprox_effs", LRUCache(PROC_CACHE_SIZE))
 
 
 def overapprox_proc_effs(proc):
-    if proc not in _overapprox_proc_cache:
-        _overapprox_proc_cache[proc] = _OverApproxEffects(proc).results()
-    return _overapprox_proc_cache[proc]
+    return _alpha_cached(
+        _overapprox_proc_cache, proc, lambda p: _OverApproxEffects(p).results()
+    )
 
 
 class _Check_Aliasing_Helper(LoopIR_Do):
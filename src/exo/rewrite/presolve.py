@@ -0,0 +1,592 @@
+from dataclasses import dataclass
+from math import gcd
+
+from ..core.LoopIR import T
+from .new_analysis_core import A
+
+# This file implements a cheap decision procedure that runs in front of
+# the SMT solver.  Most of the queries issued by the scheduling checks
+# are small linear facts about loop bounds, e.g.
+#
+#       0 <= i < n  ==>  i + 1 <= n
+#
+# which can be proven far faster by elementary means than by lowering
+# them to z3 and running the full solver.
+#
+# The procedure only ever *proves* validity.  Whenever it cannot prove a
+# query, the query is passed on to the solver, so the presolver must be
+# sound but need not be complete.  To prove `H ==> G`, we show that
+# `H /\ ¬G` has no integer solutions, as follows:
+#
+#   1.  The formula is translated into negation normal form over linear
+#       atoms `e >= 0` and `e == 0`.  Along the way
+#         - existentially quantified variables are replaced by fresh
+#           (Skolem) variables,
+#         - universally quantified variables are instantiated with a
+#           term `t` whenever an equation `x == t` occurs in their body
+#           (the one-point rule, which covers the patterns generated by
+#           the effect analysis),
+#         - `x / c` and `x % c` introduce a fresh quotient `q` with
+#           `c*q <= x < c*q + c`, and
+#         - anything else (non-linear terms, unknowns, etc.) is
+#           replaced by `True`.
+#       Replacing a sub-formula of an NNF formula by `True` only weakens
+#       it, so if the weakened formula is unsatisfiable, so is the
+#       original one.
+#   2.  The NNF formula is expanded into a bounded number of cubes
+#       (conjunctions of atoms).
+#   3.  Each cube is refuted by substituting away equations, checking
+#       the interval bounds of single variables, and finally running
+#       Fourier-Motzkin elimination with integer tightening of the
+#       constant terms.
+
+PRESOLVE_MAX_CUBES = 64
+PRESOLVE_MAX_FRESH_VARS = 12
+PRESOLVE_MAX_CONSTRAINTS = 256
+
+
+@dataclass
+class PresolveStats:
+    queries: int = 0
+    proved: int = 0
+
+    @property
+    def fallback(self):
+        return self.queries - self.proved
+
+    def __str__(self):
+        rate = 100.0 * self.proved / self.queries if self.queries > 0 else 0.0
+        return (
+            f"presolver: {self.proved} of {self.queries} queries proved "
+            f"without SMT ({rate:.1f}%)"
+        )
+
+
+presolve_stats = PresolveStats()
+
+
+def get_presolve_stats():
+    return presolve_stats
+
+
+def reset_presolve_stats():
+    presolve_stats.queries = 0
+    presolve_stats.proved = 0
+
+
+def presolve_valid(assumptions, goal):
+    """
+    Returns True if `goal` is provably valid under `assumptions`, and
+    False if the presolver could not decide.
+    """
+    presolve_stats.queries += 1
+    try:
+        proved = _Presolver().prove(assumptions, goal)
+    except _GiveUp:
+        proved = False
+    if proved:
+        presolve_stats.proved += 1
+    return proved
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Linear terms are represented as a pair `(coeffs, const)` where `coeffs`
+# is a dictionary from variables to non-zero integer coefficients.
+
+
+class _GiveUp(Exception):
+    pass
+
+
+class _NonClassical(Exception):
+    """raised on sources of three-valued (possibly undefined) values"""
+
+
+class _Fresh:
+    """a fresh variable, introduced by Skolemization or division"""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"${self.name}"
+
+
+def _lin_add(a, b, scale=1):
+    coeffs = dict(a[0])
+    for x, c in b[0].items():
+        c = coeffs.get(x, 0) + scale * c
+        if c == 0:
+            coeffs.pop(x, None)
+        else:
+            coeffs[x] = c
+    return coeffs, a[1] + scale * b[1]
+
+
+def _lin_scale(a, k):
+    if k == 0:
+        return {}, 0
+    return {x: k * c for x, c in a[0].items()}, k * a[1]
+
+
+def _lin_const(k):
+    return {}, k
+
+
+# NNF nodes
+_TRUE = ("true",)
+_FALSE = ("false",)
+
+
+def _and(args):
+    out = []
+    for a in args:
+        if a is _FALSE:
+            return _FALSE
+        elif a is _TRUE:
+            continue
+        elif a[0] == "and":
+            out += a[1]
+        else:
+            out.append(a)
+    if len(out) == 0:
+        return _TRUE
+    return out[0] if len(out) == 1 else ("and", out)
+
+
+def _or(args):
+    out = []
+    for a in args:
+        if a is _TRUE:
+            return _TRUE
+        elif a is _FALSE:
+            continue
+        elif a[0] == "or":
+            out += a[1]
+        else:
+            out.append(a)
+    if len(out) == 0:
+        return _FALSE
+    return out[0] if len(out) == 1 else ("or", out)
+
+
+def _ge(lin):
+    # lin >= 0
+    if not lin[0]:
+        return _TRUE if lin[1] >= 0 else _FALSE
+    return ("ge", lin)
+
+
+def _eq(lin):
+    # lin == 0
+    if not lin[0]:
+        return _TRUE if lin[1] == 0 else _FALSE
+    return ("eq", lin)
+
+
+def _cmp(op, lhs, rhs, neg):
+    """translate `lhs op rhs` (or its negation) over the integers"""
+    if neg:
+        op = {"<": ">=", ">": "<=", "<=": ">", ">=": "<", "==": "!="}[op]
+    diff = _lin_add(lhs, rhs, -1)  # lhs - rhs
+    if op == "<":
+        return _ge(_lin_add(_lin_scale(diff, -1), _lin_const(-1)))
+    elif op == ">":
+        return _ge(_lin_add(diff, _lin_const(-1)))
+    elif op == "<=":
+        return _ge(_lin_scale(diff, -1))
+    elif op == ">=":
+        return _ge(diff)
+    elif op == "==":
+        return _eq(diff)
+    else:
+        assert op == "!="
+        return _or(
+            [
+                _ge(_lin_add(diff, _lin_const(-1))),
+                _ge(_lin_add(_lin_scale(diff, -1), _lin_const(-1))),
+            ]
+        )
+
+
+_cmp_ops = {"<", ">", "<=", ">=", "=="}
+
+
+class _Presolver:
+    def __init__(self):
+        self.defs = []  # constraints defining division temporaries
+        self.n_fresh = 0
+
+    def fresh(self, name):
+        self.n_fresh += 1
+        if self.n_fresh > PRESOLVE_MAX_FRESH_VARS:
+            raise _GiveUp()
+        return _Fresh(name)
+
+    def prove(self, assumptions, goal):
+        conj = [self.top_nnf(a, False) for a in assumptions]
+        conj.append(self.top_nnf(goal, True))
+        f = _and(conj + self.defs)
+        if f is _FALSE:
+            return True
+        cubes = _cubes(f)
+        if cubes is None:
+            return False
+        return all(_refute(cube) for cube in cubes)
+
+    # ----------------------------------------------------------------- #
+    # translation of terms
+
+    def lin(self, e, env):
+        if type(e) in (A.Unk, A.Let, A.LetTuple, A.Tuple):
+            raise _NonClassical()
+        elif type(e) is A.Const:
+            if type(e.val) is not int or not e.type.is_indexable():
+                raise _GiveUp()
+            return _lin_const(e.val)
+        elif type(e) is A.Var:
+            if e.name in env:
+                return env[e.name]
+            if not (e.type.is_indexable() or e.type.is_stridable()):
+                raise _GiveUp()
+            return {e.name: 1}, 0
+        elif type(e) is A.Stride:
+            return {("stride", e.name, e.dim): 1}, 0
+        elif type(e) is A.USub:
+            return _lin_scale(self.lin(e.arg, env), -1)
+        elif type(e) is A.BinOp:
+            if e.op == "+":
+                return _lin_add(self.lin(e.lhs, env), self.lin(e.rhs, env))
+            elif e.op == "-":
+                return _lin_add(self.lin(e.lhs, env), self.lin(e.rhs, env), -1)
+            elif e.op == "*":
+                lhs = self.lin(e.lhs, env)
+                rhs = self.lin(e.rhs, env)
+                if not lhs[0]:
+                    return _lin_scale(rhs, lhs[1])
+                elif not rhs[0]:
+                    return _lin_scale(lhs, rhs[1])
+                raise _GiveUp()
+            elif e.op in ("/", "%"):
+                if not isinstance(e.rhs, A.Const) or e.rhs.val <= 0:
+                    raise _GiveUp()
+                c = e.rhs.val
+                lhs = self.lin(e.lhs, env)
+                if not lhs[0]:
+                    q = lhs[1] // c
+                    return _lin_const(q if e.op == "/" else lhs[1] - c * q)
+                # c*q <= lhs <= c*q + c - 1
+                q = ({self.fresh("div_tmp"): 1}, 0)
+                cq = _lin_scale(q, c)
+                self.defs.append(_ge(_lin_add(lhs, cq, -1)))
+                self.defs.append(
+                    _ge(_lin_add(_lin_add(cq, _lin_const(c - 1)), lhs, -1))
+                )
+                return q if e.op == "/" else _lin_add(lhs, cq, -1)
+        raise _GiveUp()
+
+    # ----------------------------------------------------------------- #
+    # translation of formulas into negation normal form
+
+    def top_nnf(self, e, neg):
+        try:
+            return self.nnf(e, neg, dict())
+        except _NonClassical:
+            return _TRUE
+
+    def nnf(self, e, neg, env):
+        try:
+            return self._nnf(e, neg, env)
+        except _GiveUp:
+            if self.n_fresh > PRESOLVE_MAX_FRESH_VARS:
+                raise
+            if not _is_classical(e):
+                raise _NonClassical()
+            # weaken the formula by dropping this sub-formula
+            return _TRUE
+
+    def _nnf(self, e, neg, env):
+        if type(e) is A.Const:
+            if type(e.val) is not bool:
+                raise _GiveUp()
+            return _TRUE if e.val != neg else _FALSE
+        elif type(e) is A.Var:
+            if e.type != T.bool or e.name in env:
+                raise _GiveUp()
+            return ("lit", e.name, not neg)
+        elif type(e) is A.Not:
+            return self.nnf(e.arg, not neg, env)
+        elif type(e) in (A.Definitely, A.Maybe):
+            # on classical formulas, both are the identity.  Otherwise,
+            # weakening a sub-formula of the argument need not weaken
+            # the whole, so the entire node is dropped instead.
+            try:
+                return self.nnf(e.arg, neg, env)
+            except _NonClassical:
+                return _TRUE
+        elif type(e) in (A.Unk, A.Let, A.LetTuple, A.Tuple):
+            raise _NonClassical()
+        elif type(e) in (A.ForAll, A.Exists):
+            if (type(e) is A.Exists) != neg:
+                # existential; replace the variable with a fresh one
+                body_env = env | {e.name: ({self.fresh(e.name.name()): 1}, 0)}
+            else:
+                # universal; instantiate at a one-point term if possible
+                t = self.one_point(e.name, e.arg, env)
+                if t is None:
+                    raise _GiveUp()
+                body_env = env | {e.name: t}
+            return self.nnf(e.arg, neg, body_env)
+        elif type(e) is A.BinOp:
+            if e.op in ("and", "or"):
+                lhs = self.nnf(e.lhs, neg, env)
+                rhs = self.nnf(e.rhs, neg, env)
+                if (e.op == "and") != neg:
+                    return _and([lhs, rhs])
+                else:
+                    return _or([lhs, rhs])
+            elif e.op == "==>":
+                # a ==> b  =  ¬a \/ b
+                lhs = self.nnf(e.lhs, not neg, env)
+                rhs = self.nnf(e.rhs, neg, env)
+                return _and([lhs, rhs]) if neg else _or([lhs, rhs])
+            elif e.op == "==" and e.lhs.type == T.bool:
+                # a == b  =  (a /\ b) \/ (¬a /\ ¬b)
+                # ¬(a == b)  =  (a /\ ¬b) \/ (¬a /\ b)
+                a, na = self.nnf(e.lhs, False, env), self.nnf(e.lhs, True, env)
+                b, nb = self.nnf(e.rhs, False, env), self.nnf(e.rhs, True, env)
+                if neg:
+                    return _or([_and([a, nb]), _and([na, b])])
+                else:
+                    return _or([_and([a, b]), _and([na, nb])])
+            elif e.op in _cmp_ops:
+                if not _is_int_typed(e.lhs) or not _is_int_typed(e.rhs):
+                    raise _GiveUp()
+                return _cmp(e.op, self.lin(e.lhs, env), self.lin(e.rhs, env), neg)
+        raise _GiveUp()
+
+    def one_point(self, x, body, env):
+        """
+        Search `body` for an equation `x == t`, where `t` may only
+        mention variables that are in scope outside of `body`, and
+        return the translation of `t`.
+        """
+        bound = set()
+
+        def search(e):
+            if isinstance(e, (A.ForAll, A.Exists)):
+                if e.name == x:
+                    return None  # x is shadowed below here
+                bound.add(e.name)
+                t = search(e.arg)
+                bound.discard(e.name)
+                return t
+            elif isinstance(e, (A.Not, A.Definitely, A.Maybe)):
+                return search(e.arg)
+            elif isinstance(e, A.BinOp):
+                if e.op == "==" and _is_int_typed(e.lhs):
+                    if (t := solve_for_x(e)) is not None:
+                        return t
+                elif e.op in ("and", "or", "==>"):
+                    return search(e.lhs) or search(e.rhs)
+            return None
+
+        def solve_for_x(eq):
+            try:
+                inner_env = {nm: v for nm, v in env.items() if nm not in bound}
+                inner_env.pop(x, None)
+                diff = _lin_add(
+                    self.lin(eq.lhs, inner_env), self.lin(eq.rhs, inner_env), -1
+                )
+            except _GiveUp:
+                return None
+            c = diff[0].get(x, 0)
+            if c not in (1, -1) or any(v in bound for v in diff[0]):
+                return None
+            # c*x + rest == 0  ==>  x == -c*rest
+            rest = ({v: k for v, k in diff[0].items() if v != x}, diff[1])
+            return _lin_scale(rest, -c)
+
+        return search(body)
+
+
+def _is_int_typed(e):
+    return e.type.is_indexable() or e.type.is_stridable()
+
+
+def _is_classical(e):
+    if isinstance(e, (A.Unk, A.Let, A.LetTuple, A.Tuple)):
+        return False
+    elif isinstance(e, (A.Not, A.USub, A.Definitely, A.Maybe, A.ForAll, A.Exists)):
+        return _is_classical(e.arg)
+    elif isinstance(e, A.BinOp):
+        return _is_classical(e.lhs) and _is_classical(e.rhs)
+    elif isinstance(e, A.Select):
+        return all(_is_classical(a) for a in (e.cond, e.tcase, e.fcase))
+    elif isinstance(e, A.LetStrides):
+        return all(_is_classical(s) for s in e.strides) and _is_classical(e.body)
+    return True
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Refutation of cubes
+
+
+def _cubes(f):
+    """expand an NNF formula into a list of cubes, or None if too many"""
+    if f is _TRUE:
+        return [[]]
+    elif f is _FALSE:
+        return []
+    elif f[0] == "and":
+        cubes = [[]]
+        for a in f[1]:
+            sub = _cubes(a)
+            if sub is None:
+                return None
+            cubes = [c + s for c in cubes for s in sub]
+            if len(cubes) > PRESOLVE_MAX_CUBES:
+                return None
+        return cubes
+    elif f[0] == "or":
+        cubes = []
+        for a in f[1]:
+            sub = _cubes(a)
+            if sub is None:
+                return None
+            cubes += sub
+            if len(cubes) > PRESOLVE_MAX_CUBES:
+                return None
+        return cubes
+    else:
+        return [[f]]
+
+
+def _normalize(lin):
+    """
+    Normalize the constraint `lin >= 0` by dividing through by the gcd of
+    its coefficients.  Over the integers, the constant may then be rounded
+    down, which tightens the constraint.
+    """
+    coeffs, const = lin
+    g = 0
+    for c in coeffs.values():
+        g = gcd(g, c)
+    if g > 1:
+        coeffs = {x: c // g for x, c in coeffs.items()}
+        const = const // g
+    return coeffs, const
+
+
+def _refute(cube):
+    """Returns True if the conjunction of atoms in `cube` is unsatisfiable"""
+    lits = dict()
+    eqs, ineqs = [], []
+    for atom in cube:
+        if atom[0] == "lit":
+            _, x, pos = atom
+            if lits.setdefault(x, pos) != pos:
+                return True
+        elif atom[0] == "eq":
+            eqs.append(atom[1])
+        else:
+            assert atom[0] == "ge"
+            ineqs.append(atom[1])
+
+    # eliminate equations, substituting where a variable has unit coefficient
+    while eqs:
+        coeffs, const = eqs.pop()
+        if not coeffs:
+            if const != 0:
+                return True
+            continue
+        g = 0
+        for c in coeffs.values():
+            g = gcd(g, c)
+        if const % g != 0:
+            return True  # no integer solutions
+        unit = next((x for x, c in coeffs.items() if c in (1, -1)), None)
+        if unit is None:
+            ineqs.append((coeffs, const))
+            ineqs.append(_lin_scale((coeffs, const), -1))
+            continue
+        c = coeffs[unit]
+        # unit == -c * rest
+        rest = ({x: k for x, k in coeffs.items() if x != unit}, const)
+        val = _lin_scale(rest, -c)
+
+        def subst(lin):
+            k = lin[0].get(unit)
+            if k is None:
+                return lin
+            lin = ({x: v for x, v in lin[0].items() if x != unit}, lin[1])
+            return _lin_add(lin, val, k)
+
+        eqs = [subst(q) for q in eqs]
+        ineqs = [subst(q) for q in ineqs]
+
+    return _fourier_motzkin(ineqs)
+
+
+def _fourier_motzkin(ineqs):
+    # index constraints by their coefficients, keeping only the tightest
+    cons = dict()
+
+    def add(lin):
+        coeffs, const = _normalize(lin)
+        if not coeffs:
+            return const < 0
+        key = frozenset(coeffs.items())
+        if key not in cons or const < cons[key][1]:
+            cons[key] = (coeffs, const)
+        return False
+
+    for lin in ineqs:
+        if add(lin):
+            return True
+
+    # interval bounds on single variables
+    lo, hi = dict(), dict()
+    for coeffs, const in cons.values():
+        if len(coeffs) == 1:
+            ((x, c),) = coeffs.items()
+            if c == 1:  # x + const >= 0
+                lo[x] = max(lo.get(x, -const), -const)
+            elif c == -1:  # -x + const >= 0
+                hi[x] = min(hi.get(x, const), const)
+    if any(x in hi and lo[x] > hi[x] for x in lo):
+        return True
+
+    while cons:
+        allvars = {x for coeffs, _ in cons.values() for x in coeffs}
+        if not allvars:
+            break
+
+        # eliminate the variable producing the fewest new constraints
+        def cost(x):
+            pos = sum(1 for coeffs, _ in cons.values() if coeffs.get(x, 0) > 0)
+            neg = sum(1 for coeffs, _ in cons.values() if coeffs.get(x, 0) < 0)
+            return pos * neg - pos - neg
+
+        x = min(allvars, key=lambda v: (cost(v), repr(v)))
+        pos, neg, rest = [], [], []
+        for lin in cons.values():
+            c = lin[0].get(x, 0)
+            (pos if c > 0 else neg if c < 0 else rest).append(lin)
+
+        cons = dict()
+        for lin in rest:
+            add(lin)
+        for p in pos:
+            for n in neg:
+                a, b = p[0][x], -n[0][x]
+                if add(_lin_add(_lin_scale(p, b), _lin_scale(n, a))):
+                    return True
+        if len(cons) > PRESOLVE_MAX_CONSTRAINTS:
+            return False
+
+    return False
@@ -0,0 +1,297 @@
+import os
+import time
+from fractions import Fraction
+
+from pysmt import shortcuts as _pysmt
+
+from ..core.caches import register_cache, LRUCache
+from .smt_budget import SMTTimeout, set_z3_timeout, z3_timed_out
+from .smt_pool import SolverPool, pysmt_solvers
+
+try:
+    import z3 as z3lib
+except ImportError:  # pragma: no cover
+    z3lib = None
+
+# This file provides the SMT backends used by the bounds checker
+# (`frontend/boundscheck.py`) and the unification solver
+# (`rewrite/LoopIR_unification.py`).
+#
+# Both clients were written against the pysmt `shortcuts` API.  Building
+# formulas through pysmt is considerably slower than constructing them
+# with the z3 Python API directly (pysmt type-checks and hash-conses every
+# term, and then translates the whole formula to z3 anyway).  The Z3
+# backend therefore mirrors the small subset of `pysmt.shortcuts` that
+# these clients use, along with the pysmt solver methods they call, on
+# top of the z3 API.  Clients simply hold a backend object in place of
+# the `pysmt.shortcuts` module.
+#
+# The Z3 backend is used by default when z3 is installed.  Setting the
+# environment variable `EXO_SMT_BACKEND=pysmt`, or calling
+# `set_smt_backend("pysmt")`, selects the original pysmt path.
+
+_ENV_VAR = "EXO_SMT_BACKEND"
+
+
+class PySMTBackend:
+    name = "pysmt"
+
+    INT = _pysmt.INT
+    BOOL = _pysmt.BOOL
+    REAL = _pysmt.REAL
+
+    Symbol = staticmethod(_pysmt.Symbol)
+    Int = staticmethod(_pysmt.Int)
+    Bool = staticmethod(_pysmt.Bool)
+    FALSE = staticmethod(_pysmt.FALSE)
+    Not = staticmethod(_pysmt.Not)
+    And = staticmethod(_pysmt.And)
+    Or = staticmethod(_pysmt.Or)
+    Iff = staticmethod(_pysmt.Iff)
+    Ite = staticmethod(_pysmt.Ite)
+    Plus = staticmethod(_pysmt.Plus)
+    Minus = staticmethod(_pysmt.Minus)
+    Times = staticmethod(_pysmt.Times)
+    Equals = staticmethod(_pysmt.Equals)
+    LT = staticmethod(_pysmt.LT)
+    GT = staticmethod(_pysmt.GT)
+    LE = staticmethod(_pysmt.LE)
+    GE = staticmethod(_pysmt.GE)
+
+    @staticmethod
+    def is_int(x):
+        return x.get_type() == _pysmt.INT
+
+    solvers = pysmt_solvers
+
+
+if z3lib is not None:
+    _z3 = z3lib.z3core
+
+# z3 terms of integer constants, which queries build over and over
+Z3_INT_CONSTS_SIZE = 4096
+_z3_int_consts = register_cache("z3_int_consts", LRUCache(Z3_INT_CONSTS_SIZE))
+
+
+def _z3_ctx():
+    return z3lib.main_ctx()
+
+
+def _z3_ref():
+    return z3lib.main_ctx().ref()
+
+
+def _z3_bool(ast):
+    return z3lib.BoolRef(ast, z3lib.main_ctx())
+
+
+def _z3_arith(ast):
+    return z3lib.ArithRef(ast, z3lib.main_ctx())
+
+
+def _z3_array(args):
+    arr = (z3lib.Ast * len(args))()
+    for i, a in enumerate(args):
+        arr[i] = a.as_ast()
+    return len(args), arr
+
+
+class Z3Solver:
+    """
+    Wraps a z3 Solver with the subset of the pysmt solver interface
+    used by the bounds checker and unification.
+    """
+
+    def __init__(self):
+        self.slv = z3lib.Solver()
+        self.model = None
+        self.timeout = None
+
+    def reset(self):
+        self.slv.reset()
+        self.model = None
+        self.set_timeout(None)
+
+    def set_timeout(self, seconds):
+        set_z3_timeout(self.slv, seconds)
+        self.timeout = seconds
+
+    def push(self):
+        self.slv.push()
+
+    def pop(self):
+        self.slv.pop()
+
+    def add_assertion(self, e):
+        self.slv.add(e)
+
+    def is_sat(self, e):
+        # checking under an assumption avoids a push/pop pair, which is
+        # surprisingly expensive once the solver holds a few assertions
+        start = time.perf_counter()
+        result = self.slv.check(e)
+        if result == z3lib.sat:
+            self.model = self.slv.model()
+        if result == z3lib.unknown:
+            if z3_timed_out(self.slv, self.timeout, start):
+                raise SMTTimeout("timeout", self.timeout)
+            raise TypeError("unknown result from z3")
+        return result == z3lib.sat
+
+    def is_valid(self, e):
+        # as in pysmt, a failed validity check leaves the model of
+        # a counter-example behind
+        return not self.is_sat(z3lib.Not(e))
+
+    def get_py_value(self, x):
+        assert self.model is not None, "no model available"
+        val = self.model.eval(x, model_completion=True)
+        if z3lib.is_int_value(val):
+            return val.as_long()
+        elif z3lib.is_rational_value(val):
+            return Fraction(val.numerator_as_long(), val.denominator_as_long())
+        elif z3lib.is_true(val) or z3lib.is_false(val):
+            return z3lib.is_true(val)
+        else:
+            assert False, f"unexpected model value: {val}"
+
+    def get_py_values(self, xs):
+        return {x: self.get_py_value(x) for x in xs}
+
+
+class Z3Backend:
+    name = "z3"
+
+    INT = "Int"
+    BOOL = "Bool"
+    REAL = "Real"
+
+    # Terms are built with the low-level z3 API.  The operator overloads
+    # of the high-level API re-discover and coerce the sorts of their
+    # arguments on every call, which makes them slower than pysmt.
+
+    @staticmethod
+    def Symbol(name, typ):
+        if typ == Z3Backend.INT:
+            return z3lib.Int(name)
+        elif typ == Z3Backend.BOOL:
+            return z3lib.Bool(name)
+        elif typ == Z3Backend.REAL:
+            return z3lib.Real(name)
+        else:
+            assert False, f"bad sort: {typ}"
+
+    @staticmethod
+    def Int(val):
+        if (x := _z3_int_consts.get(val)) is None:
+            x = z3lib.IntVal(val)
+            _z3_int_consts.put(val, x)
+        return x
+
+    @staticmethod
+    def Bool(val):
+        return z3lib.BoolVal(val)
+
+    @staticmethod
+    def FALSE():
+        return z3lib.BoolVal(False)
+
+    @staticmethod
+    def Not(x):
+        return _z3_bool(_z3.Z3_mk_not(_z3_ref(), x.as_ast()))
+
+    @staticmethod
+    def And(*args):
+        if len(args) == 0:
+            return z3lib.BoolVal(True)
+        elif len(args) == 1:
+            return args[0]
+        return _z3_bool(_z3.Z3_mk_and(_z3_ref(), *_z3_array(args)))
+
+    @staticmethod
+    def Or(*args):
+        if len(args) == 0:
+            return z3lib.BoolVal(False)
+        elif len(args) == 1:
+            return args[0]
+        return _z3_bool(_z3.Z3_mk_or(_z3_ref(), *_z3_array(args)))
+
+    @staticmethod
+    def Iff(lhs, rhs):
+        return _z3_bool(_z3.Z3_mk_eq(_z3_ref(), lhs.as_ast(), rhs.as_ast()))
+
+    @staticmethod
+    def Ite(cond, tcase, fcase):
+        ast = _z3.Z3_mk_ite(_z3_ref(), cond.as_ast(), tcase.as_ast(), fcase.as_ast())
+        return z3lib._to_expr_ref(ast, _z3_ctx())
+
+    @staticmethod
+    def Plus(lhs, rhs):
+        return _z3_arith(_z3.Z3_mk_add(_z3_ref(), *_z3_array((lhs, rhs))))
+
+    @staticmethod
+    def Minus(lhs, rhs):
+        return _z3_arith(_z3.Z3_mk_sub(_z3_ref(), *_z3_array((lhs, rhs))))
+
+    @staticmethod
+    def Times(lhs, rhs):
+        return _z3_arith(_z3.Z3_mk_mul(_z3_ref(), *_z3_array((lhs, rhs))))
+
+    @staticmethod
+    def Equals(lhs, rhs):
+        return _z3_bool(_z3.Z3_mk_eq(_z3_ref(), lhs.as_ast(), rhs.as_ast()))
+
+    @staticmethod
+    def LT(lhs, rhs):
+        return _z3_bool(_z3.Z3_mk_lt(_z3_ref(), lhs.as_ast(), rhs.as_ast()))
+
+    @staticmethod
+    def GT(lhs, rhs):
+        return _z3_bool(_z3.Z3_mk_gt(_z3_ref(), lhs.as_ast(), rhs.as_ast()))
+
+    @staticmethod
+    def LE(lhs, rhs):
+        return _z3_bool(_z3.Z3_mk_le(_z3_ref(), lhs.as_ast(), rhs.as_ast()))
+
+    @staticmethod
+    def GE(lhs, rhs):
+        return _z3_bool(_z3.Z3_mk_ge(_z3_ref(), lhs.as_ast(), rhs.as_ast()))
+
+    @staticmethod
+    def is_int(x):
+        return z3lib.is_int(x)
+
+    solvers = SolverPool(Z3Solver, Z3Solver.reset)
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Backend selection
+
+_backends = {"pysmt": PySMTBackend}
+if z3lib is not None:
+    _backends["z3"] = Z3Backend
+
+_smt_backend = None
+
+
+def get_smt_backend():
+    global _smt_backend
+    if _smt_backend is None:
+        default = "z3" if z3lib is not None else "pysmt"
+        set_smt_backend(os.environ.get(_ENV_VAR, default))
+    return _smt_backend
+
+
+def set_smt_backend(name):
+    """
+    Select the backend ("z3" or "pysmt") used by the bounds checker
+    and by unification.
+    """
+    global _smt_backend
+    if name not in _backends:
+        raise ValueError(
+            f"unknown SMT backend '{name}'; "
+            f"expected one of: {', '.join(sorted(_backends))}"
+        )
+    _smt_backend = _backends[name]
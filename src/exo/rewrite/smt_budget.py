@@ -0,0 +1,205 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from ..core.caches import register_cache
+
+# This file implements time limits for SMT queries.
+#
+# Most safety checks are answered by the solver within milliseconds, but
+# a single pathological query (typically one with nested quantifiers)
+# can keep it busy for minutes.  Two limits guard against this:
+#
+#   - a timeout for every individual query, and
+#   - a budget for the total solver time spent on each procedure
+#     (identified by its name, so that it covers the whole sequence of
+#     procedures produced while scheduling it).
+#
+# Since budgets are kept by name, unrelated procedures which share a name
+# (e.g. kernels produced by the same generator, before they are renamed)
+# also share a budget.  The time spent is forgotten by `reset_smt_budget`
+# and by `exo.clear_caches()`.
+#
+# Both are given in seconds, either through the environment variables
+# `EXO_SMT_TIMEOUT` and `EXO_SMT_BUDGET`, or by calling `set_smt_timeout`
+# and `set_smt_budget`.  Neither is enforced by default (or when the
+# variable is empty); a limit of 0 leaves no time at all, in both cases.
+#
+# A query that runs out of time has not been proven.  Solver clients
+# raise `SMTTimeout`, which the checks turn into the error they would
+# report for an unprovable condition, after logging which check gave up
+# and where.
+
+_TIMEOUT_VAR = "EXO_SMT_TIMEOUT"
+_BUDGET_VAR = "EXO_SMT_BUDGET"
+
+# z3 interprets this as "no timeout"
+_Z3_NO_TIMEOUT = 4294967295
+
+logger = logging.getLogger("exo.smt")
+
+
+class SMTTimeout(Exception):
+    def __init__(self, reason, limit, proc_name=None):
+        self.reason = reason  # either "timeout" or "budget"
+        self.limit = limit
+        self.proc_name = proc_name
+        if reason == "timeout":
+            msg = f"SMT query timed out after {limit:g}s"
+        else:
+            msg = f"SMT budget of {limit:g}s for procedure {proc_name} exhausted"
+        super().__init__(msg)
+
+
+def _env_seconds(var):
+    val = os.environ.get(var)
+    if not val:
+        return None
+    try:
+        seconds = float(val)
+    except ValueError:
+        raise ValueError(f"{var} must be a number of seconds, got '{val}'")
+    if seconds < 0:
+        raise ValueError(f"{var} must not be negative, got '{val}'")
+    return seconds
+
+
+_smt_timeout = None
+_smt_budget = None
+_checked_env = False
+
+
+def _check_env():
+    global _smt_timeout, _smt_budget, _checked_env
+    if not _checked_env:
+        _checked_env = True
+        _smt_timeout = _env_seconds(_TIMEOUT_VAR)
+        _smt_budget = _env_seconds(_BUDGET_VAR)
+
+
+def get_smt_timeout():
+    _check_env()
+    return _smt_timeout
+
+
+def set_smt_timeout(seconds):
+    """
+    Limit every SMT query to `seconds` (None for no limit)
+    """
+    global _smt_timeout
+    _check_env()
+    _smt_timeout = seconds
+
+
+def get_smt_budget():
+    _check_env()
+    return _smt_budget
+
+
+def set_smt_budget(seconds):
+    """
+    Limit the total SMT time spent on each procedure to `seconds`
+    (None for no limit)
+    """
+    global _smt_budget
+    _check_env()
+    _smt_budget = seconds
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Accounting
+
+_spent = register_cache("smt_budget", dict())  # procedure name -> seconds
+_scopes = []  # (check name, procedure name, srcinfo), innermost last
+
+
+def get_smt_spent(proc_name):
+    return _spent.get(proc_name, 0.0)
+
+
+def reset_smt_budget():
+    _spent.clear()
+
+
+@contextmanager
+def smt_scope(check, proc_name, srcinfo):
+    """
+    Charge the SMT queries issued within the `with` block to `proc_name`
+    """
+    _scopes.append((check, proc_name, srcinfo))
+    try:
+        yield
+    finally:
+        _scopes.pop()
+
+
+def current_scope():
+    """the innermost `(check, proc_name, srcinfo)` scope, or None"""
+    return _scopes[-1] if _scopes else None
+
+
+class _Query:
+    def __init__(self):
+        _check_env()
+        self.proc_name = _scopes[-1][1] if _scopes else None
+        self.limit = _smt_timeout
+        self.reason = "timeout"
+        if _smt_budget is not None and self.proc_name is not None:
+            left = _smt_budget - get_smt_spent(self.proc_name)
+            if left <= 0:
+                raise self.timeout("budget")
+            if self.limit is None or left < self.limit:
+                self.limit = left
+                self.reason = "budget"
+
+    def timeout(self, reason=None):
+        reason = reason or self.reason
+        if reason == "timeout":
+            return SMTTimeout(reason, _smt_timeout)
+        return SMTTimeout(reason, _smt_budget, self.proc_name)
+
+
+@contextmanager
+def smt_query():
+    """
+    Account for a single solver call made within the `with` block.  The
+    block receives a query object, whose `limit` is the time (in seconds,
+    or None) that the call may take, whose `start` is the time at which
+    it started, and whose `timeout()` is the exception to raise if the
+    solver ran out of time.
+    """
+    q = _Query()
+    q.start = time.perf_counter()
+    try:
+        yield q
+    finally:
+        if q.proc_name is not None:
+            elapsed = time.perf_counter() - q.start
+            _spent[q.proc_name] = get_smt_spent(q.proc_name) + elapsed
+
+
+def set_z3_timeout(slv, limit):
+    """set the timeout of the z3 solver `slv` to `limit` seconds (or None)"""
+    if limit is None and getattr(slv, "_exo_timeout", None) is None:
+        return
+    slv.set("timeout", _Z3_NO_TIMEOUT if limit is None else max(1, int(limit * 1000)))
+    slv._exo_timeout = limit
+
+
+def z3_timed_out(slv, limit, start):
+    """
+    Returns True if the z3 solver `slv`, whose last check started at
+    `start` and was limited to `limit` seconds, returned unknown because
+    it ran out of time
+    """
+    if limit is None:
+        return False
+    # z3 does not reliably report interrupted checks as timeouts
+    reason = slv.reason_unknown()
+    return reason in ("timeout", "canceled") or time.perf_counter() - start >= limit
+
+
+def log_timeout(check, srcinfo, err):
+    logger.warning("%s at %s gave up: %s", check, srcinfo, err)
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import re
+import sqlite3
+from dataclasses import dataclass
+
+# This file implements a persistent, content-addressed cache of the
+# results of SMT queries issued by the analyses in `new_analysis_core`.
+#
+# Scheduling a library re-proves the same safety formulas on every build.
+# Since the formulas are generated deterministically from the procedures
+# being scheduled, we can remember whether a given query was sat/unsat
+# and skip the solver entirely the next time we see the same query.
+#
+# The only wrinkle is that the lowered formulas mention variables
+# named after `Sym` objects (e.g. `i_1234`), whose numeric suffix
+# depends on how many symbols happened to be allocated beforehand.
+# Before hashing, we therefore canonicalize the query text by renaming
+# every such variable in order of first occurrence.  This renaming is
+# injective, so two queries with the same canonical text are identical
+# up to a consistent renaming of their variables and must agree on
+# satisfiability.
+#
+# The cache is opt-in.  It is enabled either by setting the environment
+# variable `EXO_SMT_CACHE` to the path of a database file, or by calling
+# `enable_query_cache(path)`.  All entries are dropped whenever the
+# version of Exo (or the format of this cache) changes.
+
+_FORMAT_VERSION = 1
+
+_ENV_VAR = "EXO_SMT_CACHE"
+
+# any token of the form `<name>_<id>` (optionally followed by `_def`,
+# which is how ternary-logic definedness variables are named)
+_sym_token_re = re.compile(r"(?<![\w!$|])[A-Za-z_]\w*?_\d+(?:_def)?(?![\w!$|])")
+
+
+def canonicalize_query(text):
+    """
+    Rename all Sym-derived variable names in `text` to `$0`, `$1`, ...
+    in order of first occurrence.
+    """
+    renaming = dict()
+
+    def rename(match):
+        nm = match.group(0)
+        if nm not in renaming:
+            renaming[nm] = f"${len(renaming)}"
+        return renaming[nm]
+
+    return _sym_token_re.sub(rename, text)
+
+
+def _exo_version():
+    import exo
+
+    return getattr(exo, "__version__", "unknown")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total > 0 else 0.0
+        return (
+            f"SMT query cache: {self.hits} hits, {self.misses} misses "
+            f"({rate:.1f}% hit rate), {self.stores} stores"
+        )
+
+
+class SMTQueryCache:
+    def __init__(self, path, version=None):
+        self.path = str(path)
+        self.version = f"{version or _exo_version()}/{_FORMAT_VERSION}"
+        self.stats = CacheStats()
+
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dirname, exist_ok=True)
+
+        self._db = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, val TEXT)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queries (hash TEXT PRIMARY KEY, result INTEGER)"
+        )
+
+        # invalidate every entry produced by a different version of Exo
+        row = self._db.execute("SELECT val FROM meta WHERE key='version'").fetchone()
+        if row is None or row[0] != self.version:
+            self.clear()
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('version', ?)", (self.version,)
+            )
+
+    @staticmethod
+    def key(kind, text):
+        """
+        Compute the key for a query. `kind` distinguishes different
+        questions asked about the same formula (e.g. "sat" vs. "valid")
+        """
+        canon = canonicalize_query(text)
+        return hashlib.sha256(f"{kind}\0{canon}".encode()).hexdigest()
+
+    def lookup(self, key):
+        row = self._db.execute(
+            "SELECT result FROM queries WHERE hash=?", (key,)
+        ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return bool(row[0])
+
+    def store(self, key, result):
+        assert isinstance(result, bool)
+        self._db.execute(
+            "INSERT OR REPLACE INTO queries VALUES (?, ?)", (key, int(result))
+        )
+        self.stats.stores += 1
+
+    def clear(self):
+        self._db.execute("DELETE FROM queries")
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Process-wide cache instance
+
+_query_cache = None
+_checked_env = False
+
+
+def get_query_cache():
+    """
+    Returns the active SMTQueryCache, or None if caching is disabled
+    """
+    global _query_cache, _checked_env
+    if not _checked_env:
+        _checked_env = True
+        if _query_cache is None and (path := os.environ.get(_ENV_VAR)):
+            _query_cache = SMTQueryCache(path)
+    return _query_cache
+
+
+def enable_query_cache(path, version=None):
+    global _query_cache, _checked_env
+    disable_query_cache()
+    _checked_env = True
+    _query_cache = SMTQueryCache(path, version=version)
+    return _query_cache
+
+
+def disable_query_cache():
+    global _query_cache
+    if _query_cache is not None:
+        _query_cache.close()
+    _query_cache = None
+
+
+def get_query_cache_stats():
+    cache = get_query_cache()
+    return cache.stats if cache is not None else CacheStats()
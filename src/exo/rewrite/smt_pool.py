@@ -0,0 +1,101 @@
+import weakref
+from contextlib import contextmanager
+
+import pysmt
+from pysmt import logics
+
+from ..core.caches import register_cache
+
+try:
+    import z3 as z3lib
+except ImportError:  # pragma: no cover
+    z3lib = None
+
+# This file implements pools of pre-initialized solver contexts.
+#
+# Every safety check and every bounds check used to construct its own
+# solver.  For the pysmt solvers in particular, this means running the
+# solver factory and instantiating a brand new backend each time, which
+# costs milliseconds and dominates the cost of the small queries that
+# scheduling typically issues.  Instead, solvers are handed out from a
+# pool and wiped clean when they are returned.
+#
+# Solvers are not thread-safe, so a solver is only ever owned by one
+# client at a time.  A client that fails part-way through (and so may
+# have left unbalanced push/pop scopes behind) simply does not return
+# its solver; it is then garbage collected as usual.
+
+SOLVER_POOL_SIZE = 8
+
+
+class SolverPool:
+    def __init__(self, make, reset, max_size=SOLVER_POOL_SIZE):
+        self._make = make
+        self._reset = reset
+        self._free = []
+        self.max_size = max_size
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self):
+        if self._free:
+            self.reused += 1
+            return self._free.pop()
+        self.created += 1
+        return self._make()
+
+    def release(self, slv):
+        if len(self._free) < self.max_size:
+            self._reset(slv)
+            self._free.append(slv)
+
+    @contextmanager
+    def solver(self):
+        """
+        Borrow a solver for the duration of a `with` block.  The solver
+        is only returned to the pool if the block exits normally.
+        """
+        slv = self.acquire()
+        yield slv
+        self.release(slv)
+
+    def release_when_dead(self, owner, slv):
+        """
+        Return `slv` to the pool once `owner` is garbage collected
+        """
+        weakref.finalize(owner, self.release, slv)
+
+    def clear(self):
+        self._free.clear()
+
+    def __len__(self):
+        return len(self._free)
+
+
+def _reset_z3_solver(slv):
+    slv.reset()
+
+
+def _make_pysmt_solver():
+    factory = pysmt.factory.Factory(pysmt.shortcuts.get_env())
+    slvs = factory.all_solvers(logic=logics.LIA)
+    if len(slvs) == 0:
+        raise OSError("Could not find any SMT solvers")
+    return pysmt.shortcuts.Solver(name=next(iter(slvs)))
+
+
+def _reset_pysmt_solver(slv):
+    slv.reset_assertions()
+
+
+z3_solvers = register_cache(
+    "z3_solvers", SolverPool(lambda: z3lib.Solver(), _reset_z3_solver)
+)
+pysmt_solvers = register_cache(
+    "pysmt_solvers", SolverPool(_make_pysmt_solver, _reset_pysmt_solver)
+)
+
+
+def clear_solver_pools():
+    z3_solvers.clear()
+    pysmt_solvers.clear()
@@ -0,0 +1,179 @@
+import atexit
+import json
+import os
+import sys
+from dataclasses import dataclass, asdict
+
+from .smt_budget import current_scope
+
+# This file implements a profile of the SMT queries issued by scheduling.
+#
+# Queries are attributed to the safety check issuing them (the
+# `Check_...` functions in new_eff.py) and to the source location that
+# check focuses on, so that a slow build can be traced back to the
+# scheduling operation responsible for it.  For every such pair, the
+# profile records
+#
+#   - how often the check ran, and for how long in total
+#   - how many queries it issued, and how many of those were settled by
+#     the presolver instead of the solver
+#   - the time spent lowering formulas to the solver, and solving them
+#   - the total and the largest number of nodes in the formulas
+#   - how many of the solver calls were satisfiable and unsatisfiable
+#
+# Profiling is off by default and costs a single check per query then.
+# Setting the environment variable `EXO_SMT_PROFILE` to a file name turns
+# it on for the whole process; at exit, the profile is written to that
+# file as JSON, and a summary of the most expensive checks is printed to
+# stderr.  `enable_smt_profile` turns profiling on programmatically.
+
+_ENV_VAR = "EXO_SMT_PROFILE"
+_FORMAT_VERSION = 1
+
+
+@dataclass
+class ProfileEntry:
+    check: str
+    srcinfo: str
+    calls: int = 0
+    check_time: float = 0.0
+    queries: int = 0
+    presolved: int = 0
+    lower_time: float = 0.0
+    solve_time: float = 0.0
+    nodes: int = 0
+    max_nodes: int = 0
+    sat: int = 0
+    unsat: int = 0
+
+    @property
+    def smt_time(self):
+        return self.lower_time + self.solve_time
+
+
+class SMTProfile:
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = dict()
+
+    def entry(self, check, srcinfo):
+        key = (check, str(srcinfo))
+        if (e := self.entries.get(key)) is None:
+            e = self.entries[key] = ProfileEntry(*key)
+        return e
+
+    def _current(self):
+        if (scope := current_scope()) is not None:
+            check, _, srcinfo = scope
+            return self.entry(check, srcinfo)
+        return self.entry("<no check>", None)
+
+    def record_check(self, check, srcinfo, elapsed):
+        e = self.entry(check, srcinfo)
+        e.calls += 1
+        e.check_time += elapsed
+
+    def record_query(self, nodes, lower_time, solve_time, is_sat):
+        e = self._current()
+        e.queries += 1
+        e.lower_time += lower_time
+        e.solve_time += solve_time
+        e.nodes += nodes
+        e.max_nodes = max(e.max_nodes, nodes)
+        if is_sat:
+            e.sat += 1
+        else:
+            e.unsat += 1
+
+    def record_presolved(self, nodes):
+        e = self._current()
+        e.queries += 1
+        e.presolved += 1
+        e.nodes += nodes
+        e.max_nodes = max(e.max_nodes, nodes)
+
+    def clear(self):
+        self.entries.clear()
+
+    def sorted_entries(self):
+        return sorted(
+            self.entries.values(),
+            key=lambda e: (e.smt_time, e.check_time),
+            reverse=True,
+        )
+
+    def to_json(self):
+        return {
+            "version": _FORMAT_VERSION,
+            "entries": [asdict(e) for e in self.sorted_entries()],
+        }
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    def summary(self, limit=20):
+        entries = self.sorted_entries()
+        smt_time = sum(e.smt_time for e in entries)
+        queries = sum(e.queries for e in entries)
+        lines = [
+            f"SMT profile: {queries} queries, {smt_time:.3f}s lowering and solving",
+            f"{'smt(s)':>8} {'lower(s)':>8} {'check(s)':>8} {'calls':>6} "
+            f"{'queries':>7} {'presolv':>7} {'sat':>5} {'unsat':>5} "
+            f"{'maxnode':>7}  check @ srcinfo",
+        ]
+        for e in entries[:limit]:
+            lines.append(
+                f"{e.smt_time:8.3f} {e.lower_time:8.3f} {e.check_time:8.3f} "
+                f"{e.calls:6d} {e.queries:7d} {e.presolved:7d} {e.sat:5d} "
+                f"{e.unsat:5d} {e.max_nodes:7d}  {e.check} @ {e.srcinfo}"
+            )
+        if len(entries) > limit:
+            lines.append(f"... and {len(entries) - limit} more")
+        return "\n".join(lines)
+
+    def report(self):
+        if self.path is not None:
+            self.dump(self.path)
+        print(self.summary(), file=sys.stderr)
+
+
+# --------------------------------------------------------------------------- #
+# --------------------------------------------------------------------------- #
+# Process-wide profile instance
+
+_smt_profile = None
+_checked_env = False
+
+
+def get_smt_profile():
+    """
+    Returns the active SMTProfile, or None if profiling is disabled
+    """
+    global _checked_env
+    if not _checked_env:
+        _checked_env = True
+        if _smt_profile is None and (path := os.environ.get(_ENV_VAR)):
+            enable_smt_profile(path, report_at_exit=True)
+    return _smt_profile
+
+
+def enable_smt_profile(path=None, report_at_exit=False):
+    """
+    Start a new SMT profile.  If `report_at_exit` is set, the profile is
+    written to `path` (if given) and summarized on stderr at exit.
+    """
+    global _smt_profile, _checked_env
+    disable_smt_profile()
+    _checked_env = True
+    _smt_profile = SMTProfile(path)
+    if report_at_exit:
+        atexit.register(_smt_profile.report)
+    return _smt_profile
+
+
+def disable_smt_profile():
+    global _smt_profile
+    if _smt_profile is not None:
+        atexit.unregister(_smt_profile.report)
+    _smt_profile = None
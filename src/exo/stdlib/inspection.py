@@ -144,9 +144,17 @@ def get_declaration(proc, ctxt, name):
     else:
         stmt = ctxt
 
-    for stmt in get_observed_stmts(stmt):
-        if isinstance(stmt, AllocCursor) and stmt.name() == name:
-            return stmt
+    # the allocation observed by `stmt` which is closest to it, if any
+    path = stmt._impl._path
+    best = None
+    for alloc in proc.index().allocs(name):
+        *scope, (attr, i) = alloc._impl._path
+        if len(scope) < len(path) and path[: len(scope)] == scope:
+            if path[len(scope)][0] == attr and path[len(scope)][1] > i:
+                if best is None or (len(scope), i) > best[0]:
+                    best = (len(scope), i), alloc
+    if best is not None:
+        return best[1]
     for arg in proc.args():
         if arg.name() == name:
             return arg
@@ -155,7 +163,7 @@ def get_declaration(proc, ctxt, name):
 
 def get_unique_names(proc):
     cnt = 0
-    syms = set(get_symbols(proc))
+    syms = proc.index().names()
     while cnt < 100:
         name = f"var{cnt}"
         cnt += 1
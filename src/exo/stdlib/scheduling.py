@@ -97,6 +97,8 @@ from ..API_scheduling import (
 from .analysis import check_call_mem_types
 from ..API_cursors import *
 from ..rewrite.LoopIR_unification import UnificationError as _UnificationError
+from ..rewrite.instr_select import get_instr_shape as _get_instr_shape
+from ..rewrite.instr_select import buffer_mems as _buffer_mems
 
 
 # --------------------------------------------------------------------------- #
@@ -253,23 +255,30 @@ def _replace_helper(proc, subprocs, mem_aware, once):
     for subproc in subprocs:
         body = subproc.body()
         pattern = patterns[type(body[0])]
-        i = 0
+        shape = _get_instr_shape(subproc.INTERNAL_proc())
+        i, sites = 0, None
         while True:
-            try:
-                block = proc.find(f"{pattern} #{i}").expand(0, len(body) - 1)
-                if len(block) != len(body):
-                    raise _UnificationError("Unification failed due to length mismatch")
+            if sites is None:
+                sites = _find_sites(proc, pattern)
+                mems = _buffer_mems(proc.INTERNAL_proc()) if mem_aware else None
+
+            # skip the sites which cannot unify with `subproc`
+            blocks = (site.expand(0, len(body) - 1) for site in sites[i:])
+            for block in blocks:
+                if shape.matches([c._impl._node for c in block], mems):
+                    break
+                i += 1
+            else:
+                break
 
+            try:
                 if mem_aware:
                     proc = call_site_mem_aware_replace(proc, block, subproc, quiet=True)
                 else:
                     proc = replace(proc, block, subproc, quiet=True)
                 if once:
                     break
-            except (TypeError, SchedulingError) as e:
-                if "failed to find matches" in str(e):
-                    break
-                raise
+                sites = None
             except (
                 _UnificationError,
                 MemoryError,
@@ -280,6 +289,15 @@ def _replace_helper(proc, subprocs, mem_aware, once):
     return proc
 
 
+def _find_sites(proc, pattern):
+    try:
+        return proc.find(pattern, many=True)
+    except SchedulingError as e:
+        if "failed to find matches" in str(e):
+            return []
+        raise
+
+
 def replace_all(proc, subprocs, mem_aware=True):
     """
     Givin a proc and subprocs, replace the body of proc with subproc
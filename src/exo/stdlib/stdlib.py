@@ -3,6 +3,7 @@ from dataclasses import dataclass
 
 from exo import *
 from exo.frontend.syntax import *
+from exo.rewrite.instr_select import InstrSelector
 
 from .scheduling import *
 from .inspection import *
@@ -1045,6 +1046,7 @@ def checked_replace(proc, stmt, subproc, quiet=False):
 def replace_all_stmts(proc, instructions):
     if not isinstance(instructions, list):
         instructions = [instructions]
+    selector = InstrSelector([instr.INTERNAL_proc() for instr in instructions])
 
     for stmt in nlr_stmts(proc):
         try:
@@ -1052,9 +1054,9 @@ def replace_all_stmts(proc, instructions):
         except InvalidCursorError:
             continue
 
-        for instr in instructions:
+        for i in selector.select([stmt._impl._node]):
             try:
-                proc = checked_replace(proc, stmt, instr, quiet=True)
+                proc = checked_replace(proc, stmt, instructions[i], quiet=True)
                 break
             except SchedulingError:
                 pass
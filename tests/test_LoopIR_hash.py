@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import gc
+
+from exo import proc
+from exo.core.LoopIR import LoopIR, T
+from exo.core.LoopIR_hash import (
+    AlphaKey,
+    alpha_eq,
+    alpha_sym_map,
+    struct_hash,
+    _hashes,
+)
+from exo.core.prelude import Sym, null_srcinfo
+from exo.rewrite.new_eff import get_simple_proc, overapprox_proc_effs
+from exo.stdlib.scheduling import *
+
+
+def _make_foo():
+    @proc
+    def foo(n: size, x: f32[n], y: f32[n]):
+        for i in seq(0, n):
+            y[i] = x[i] + 1.0
+
+    return foo
+
+
+def _make_bar():
+    @proc
+    def foo(n: size, x: f32[n], y: f32[n]):
+        for i in seq(0, n):
+            y[i] = x[i] + 2.0
+
+    return foo
+
+
+def test_alpha_equivalent_procs():
+    p1 = _make_foo()._loopir_proc
+    p2 = _make_foo()._loopir_proc
+    assert p1.args[0].name is not p2.args[0].name
+    assert struct_hash(p1) == struct_hash(p2)
+    assert alpha_eq(p1, p2)
+    assert AlphaKey(p1) == AlphaKey(p2)
+    assert len({AlphaKey(p1), AlphaKey(p2)}) == 1
+
+    renaming = alpha_sym_map(p1, p2)
+    assert all(renaming[a1.name] is a2.name for a1, a2 in zip(p1.args, p2.args))
+
+
+def test_different_procs():
+    p1 = _make_foo()._loopir_proc
+    p2 = _make_bar()._loopir_proc
+    assert struct_hash(p1) != struct_hash(p2)
+    assert not alpha_eq(p1, p2)
+
+    # reading a different buffer of the same name is not a renaming
+    s = p1.body[0].body[0]
+    other_x = s.rhs.update(lhs=s.rhs.lhs.update(name=Sym("x")))
+    p3 = p1.update(body=[p1.body[0].update(body=[s.update(rhs=other_x)])])
+    assert struct_hash(p1) == struct_hash(p3)
+    assert not alpha_eq(p1, p3)
+
+
+def test_procedure_equality():
+    foo = _make_foo()
+    assert foo == foo
+    assert foo != _make_bar()
+    assert foo == rename(foo, "foo")
+    assert foo != divide_loop(foo, "i", 4, ["io", "ii"], tail="cut")
+
+
+def test_statement_hashes_are_cached():
+    foo = _make_foo()
+    p = foo._loopir_proc
+    struct_hash(p)
+    assert _hashes.get(p.body[0]) is not None
+
+    # the cached hash is dropped along with the statement
+    loop = p.body[0].update(hi=LoopIR.Const(8, T.index, null_srcinfo()))
+    struct_hash(loop)
+    gc.collect()
+    size = len(_hashes)
+    del loop
+    gc.collect()
+    assert len(_hashes) == size - 1
+
+
+def test_analysis_caches_shared_by_equivalent_procs():
+    p1 = _make_foo()._loopir_proc
+    p2 = _make_foo()._loopir_proc
+    assert get_simple_proc(p1) is get_simple_proc(p2)
+
+    effs1 = overapprox_proc_effs(p1)
+    effs2 = overapprox_proc_effs(p2)
+    assert effs1 == {a.name for a in p1.args}
+    assert effs2 == {a.name for a in p2.args}
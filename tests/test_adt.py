@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import pytest
+from asdl_adt.validators import ValidationError
+
+from exo.core.LoopIR import LoopIR, UAST, PAST, T
+from exo.core.prelude import Sym, null_srcinfo
+
+
+def _read(name, *idx):
+    return LoopIR.Read(name, list(idx), T.index, null_srcinfo())
+
+
+def test_nodes_are_compact():
+    x = Sym("x")
+    for node in (
+        _read(x),
+        LoopIR.fnarg(x, T.size, None, null_srcinfo()),
+        UAST.Read(x, [], null_srcinfo()),
+        PAST.Read("x", [], null_srcinfo()),
+    ):
+        assert not hasattr(node, "__dict__")
+        with pytest.raises(AttributeError):
+            object.__setattr__(node, "extra", 1)
+
+
+def test_update_validates():
+    e = _read(Sym("x"))
+    with pytest.raises(ValidationError):
+        e.update(name="x")
+    with pytest.raises(TypeError):
+        e.update(nope=1)
+
+
+def test_fast_update():
+    x, y = Sym("x"), Sym("y")
+    e = _read(x, _read(y))
+    f = e.fast_update(name=y)
+    assert f is not e
+    assert f.name is y and f.idx == e.idx
+    assert f.type is e.type and f.srcinfo is e.srcinfo
+    assert f == e.update(name=y)
+    with pytest.raises(TypeError):
+        e.fast_update(nope=1)
+
+    a = LoopIR.fnarg(x, T.size, None, null_srcinfo())
+    assert a.fast_update(type=T.index) == a.update(type=T.index)
+
+    # memoized nodes stay unique
+    assert T.index.fast_update() is T.index
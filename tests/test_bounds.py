@@ -514,3 +514,32 @@ def test_partial_eval_bounds():
     @proc
     def bar(A: f32[10, 20]):
         foo(A)
+
+
+@pytest.fixture(params=["z3", "pysmt"])
+def smt_backend(request):
+    from exo.rewrite.smt_backend import get_smt_backend, set_smt_backend
+
+    old = get_smt_backend()
+    set_smt_backend(request.param)
+    yield request.param
+    set_smt_backend(old.name)
+
+
+def test_backend_counter_example(smt_backend):
+    with pytest.raises(TypeError, match=r"A is read out-of-bounds when:\n.* n = "):
+
+        @proc
+        def foo(n: size, A: i8[n]):
+            a: i8
+            for i in seq(0, n + 1):
+                a = A[i]
+
+
+def test_backend_div_mod(smt_backend):
+    @proc
+    def foo(n: size, A: i8[n, 4]):
+        assert n % 4 == 0
+        a: i8
+        for i in seq(0, 4 * n):
+            a = A[i / 4, i % 4]
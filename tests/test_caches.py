@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import gc
+
+import exo
+from exo import proc
+from exo.core.proc_eqv import decl_new_proc
+from exo.core.caches import LRUCache, WeakIdCache, cache_stats
+from exo.rewrite import new_eff
+from exo.rewrite.dependence_graph import get_dependence_graph
+from exo.stdlib.scheduling import *
+
+
+class _Key:
+    pass
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_weak_id_cache_drops_dead_keys():
+    cache = WeakIdCache()
+    k1, k2 = _Key(), _Key()
+    cache.put(k1, "one")
+    cache.put(k2, "two")
+    cache.put(k2, "three")
+    assert cache.get(k1) == "one" and cache.get(k2) == "three"
+    assert cache.get(_Key()) is None
+    assert len(cache) == 2
+
+    del k1
+    gc.collect()
+    assert len(cache) == 1
+
+    cache.clear()
+    del k2
+    gc.collect()
+    assert len(cache) == 0
+
+
+def _make_foo():
+    @proc
+    def foo(n: size, x: f32[n], y: f32[n]):
+        for i in seq(0, n):
+            for j in seq(0, n):
+                y[i] += x[j]
+
+    return foo
+
+
+def test_clear_caches():
+    foo = _make_foo()
+    foo = reorder_loops(foo, "i j")
+    stats = cache_stats()
+    assert stats["check_memo"]["size"] > 0
+    assert stats["dependence_graphs"]["size"] > 0
+
+    exo.clear_caches()
+    for name, s in cache_stats().items():
+        assert s["size"] == 0, name
+
+
+def test_proc_caches_are_bounded(monkeypatch):
+    exo.clear_caches()
+    monkeypatch.setattr(new_eff._simple_proc_cache, "maxsize", 4)
+    foo = _make_foo()._loopir_proc
+    for k in range(10):
+        bar = foo.update(name=f"foo{k}")
+        decl_new_proc(bar)
+        new_eff.get_simple_proc(bar)
+    assert cache_stats()["simple_proc"]["size"] == 4
+
+
+def test_dependence_graphs_die_with_their_procs():
+    exo.clear_caches()
+    foo = _make_foo()._loopir_proc
+    # a fresh loop, which is not shared with the proc defined above
+    loop = foo.body[0].update()
+    graph, _ = get_dependence_graph(foo.update(body=[loop]), loop)
+    assert graph is not None and graph.loop is loop
+    assert cache_stats()["dependence_graphs"]["size"] == 1
+
+    del loop, graph
+    gc.collect()
+    assert cache_stats()["dependence_graphs"]["size"] == 0
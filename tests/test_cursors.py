@@ -6,6 +6,7 @@ from exo import proc, ExoType
 from exo.libs.memories import *
 from exo.libs.externs import *
 from exo.API_cursors import *
+from exo.core.caches import cache_stats
 
 from exo.stdlib.inspection import *
 from exo.stdlib.scheduling import *
@@ -70,6 +71,24 @@ def test_builtin_cursor():
     assert select_builtin == bar.body()[1].rhs()
 
 
+def test_parsed_patterns_are_cached():
+    @proc
+    def baz(x: f32):
+        x = 0.0
+
+    @proc
+    def bar(x: f32):
+        x = select(0.0, 1.0, 2.0, 3.0)
+        baz(x)
+
+    for _ in range(2):
+        hits = cache_stats()["patterns"]["hits"]
+        # a call to an extern is an expression, and to a proc a statement
+        assert bar.find("select(_)") == bar.body()[0].rhs()
+        assert bar.find("baz(_)") == bar.body()[1]
+    assert cache_stats()["patterns"]["hits"] == hits + 2
+
+
 def test_basic_forwarding(golden):
     @proc
     def p():
@@ -761,3 +780,79 @@ def test_cursor_print(golden):
 
     with pytest.raises(InvalidCursorError, match="Trying to print the Invalid Cursor!"):
         print(i_loop1.parent())
+
+
+def test_proc_index():
+    @proc
+    def bar(n: size, x: f32[n]):
+        for i in seq(0, n):
+            x[i] = 1.0
+
+    @proc
+    def foo(n: size, x: f32[n], y: f32[n]):
+        for i in seq(0, n):
+            tmp: f32
+            tmp = x[i]
+            if i > 0:
+                for j in seq(0, 2):
+                    y[i] += tmp
+            else:
+                tmp: f32
+                tmp = 0.0
+        for i in seq(0, n):
+            bar(n, y)
+
+    index = foo.index()
+    assert index.loops("i") == foo.find_loop("i", many=True)
+    assert index.loops() == foo.find("for _ in _: _", many=True)
+    assert index.allocs("tmp") == foo.find("tmp: _", many=True)
+    assert index.loops("k") == []
+
+    assert [type(w.rhs()) for w in index.writes("tmp")] == [ReadCursor, LiteralCursor]
+    assert len(index.writes("y")) == 1
+    assert index.reads("tmp") == [index.writes("y")[0].rhs()]
+    assert index.calls(bar) == index.calls("bar") == [foo.find("bar(_)")]
+    assert {"n", "x", "y", "i", "j", "tmp"} == index.names()
+
+    # lookups by name use the index
+    assert foo.find_loop("i #1") == index.loops("i")[1]
+    assert foo.find_alloc_or_arg("tmp #1") == index.allocs("tmp")[1]
+    with pytest.raises(SchedulingError, match="failed to find matches"):
+        foo.find_loop("i #2")
+
+    # the closest declaration observed by a statement
+    assign = index.writes("tmp")[1]
+    assert get_declaration(foo, assign, "tmp") == index.allocs("tmp")[1]
+    assert get_declaration(foo, index.writes("y")[0], "tmp") == index.allocs("tmp")[0]
+    assert get_declaration(foo, assign, "x") == foo.args()[1]
+
+
+def test_find_in_long_blocks():
+    @proc
+    def foo(x: f32[2000], y: f32[2000]):
+        for i in seq(0, 2000):
+            x[i] = 0.0
+            y[i] += x[i]
+
+    foo = unroll_loop(foo, "i")
+    # matches are found in order, without recursing through the block
+    assert foo.find("y[_] += _ #1999") == foo.body()[3999]
+    assert len(foo.find("x[_] = _", many=True)) == 2000
+    assert foo.find("x[_] ", many=True)[-1] == foo.body()[3999].rhs()
+    assert foo.find("x[_] = _; y[_] += _ #3") == foo.body()[6:8]
+
+    # and within the scope of a cursor
+    @proc
+    def bar(n: size, x: f32[n]):
+        for i in seq(0, n):
+            x[i] = 1.0
+        for j in seq(0, n):
+            x[j] = 2.0
+            x[j] += 3.0
+
+    j_loop = bar.find_loop("j")
+    assert j_loop.find("x[_] = _") == j_loop.body()[0]
+    assert j_loop.find("x[_] += _ #0") == j_loop.body()[1]
+    assert j_loop.find("j", many=True) == [s.idx()[0] for s in j_loop.body()]
+    with pytest.raises(SchedulingError, match="failed to find matches"):
+        j_loop.find("x[_] = _ #1")
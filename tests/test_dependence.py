@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import pytest
+
+from exo import proc, compile_procs_to_strings
+from exo.core.prelude import Sym
+from exo.stdlib.scheduling import *
+from exo.rewrite.new_analysis_core import *
+from exo.rewrite.new_eff import E, clear_check_memo
+from exo.rewrite.dependence import (
+    commutes,
+    disjoint,
+    get_dependence_stats,
+    reset_dependence_stats,
+)
+from exo.rewrite.dependence_graph import (
+    clear_dependence_graphs,
+    get_dependence_graph,
+)
+
+
+@pytest.fixture
+def syms():
+    return {nm: Sym(nm) for nm in ("A", "i", "i2", "k", "n")}
+
+
+def bds(x, hi):
+    return AAnd(AInt(0) <= AInt(x), AInt(x) < hi)
+
+
+def test_ziv_gcd(syms):
+    A, i = syms["A"], syms["i"]
+    # A[2*i] vs. A[2*i + 1]
+    a1 = [E.Write(A, [AInt(2) * AInt(i)])]
+    a2 = [E.Read(A, [AInt(2) * AInt(i) + AInt(1)])]
+    assert commutes(a1, a2, [])
+    # A[4] vs. A[5]
+    assert commutes([E.Write(A, [AInt(4)])], [E.Write(A, [AInt(5)])], [])
+    assert not commutes([E.Write(A, [AInt(4)])], [E.Write(A, [AInt(4)])], [])
+
+
+def test_siv_ordered_iterations(syms):
+    A, i, i2, n = syms["A"], syms["i"], syms["i2"], syms["n"]
+    hyps = [bds(i, AInt(n)), bds(i2, AInt(n)), AInt(i) < AInt(i2)]
+    a1 = [E.Write(A, [AInt(i)])]
+    a2 = [E.Read(A, [AInt(i2)])]
+    assert disjoint(a1, a2, hyps)
+    # A[i + 1] vs. A[i'] has a dependence at distance 1
+    a1 = [E.Write(A, [AInt(i) + AInt(1)])]
+    assert not disjoint(a1, a2, hyps)
+
+
+def test_banerjee_inner_loop(syms):
+    A, i, i2, k, n = (syms[x] for x in ("A", "i", "i2", "k", "n"))
+    hyps = [bds(i, AInt(n)), bds(i2, AInt(n)), AInt(i) < AInt(i2)]
+
+    # for k in seq(0, 8): A[8*i + k] = ...
+    def tile(x):
+        idx = AInt(8) * AInt(x) + AInt(k)
+        return [E.Loop(k, [E.Guard(bds(k, AInt(8)), [E.Write(A, [idx])])])]
+
+    assert disjoint(tile(i), tile(i2), hyps)
+
+    # for k in seq(0, 9): A[8*i + k] = ... overlaps its neighbor
+    def overlap(x):
+        idx = AInt(8) * AInt(x) + AInt(k)
+        return [E.Loop(k, [E.Guard(bds(k, AInt(9)), [E.Write(A, [idx])])])]
+
+    assert not disjoint(overlap(i), overlap(i2), hyps)
+
+
+def test_reductions_commute(syms):
+    A, i = syms["A"], syms["i"]
+    a1 = [E.Reduce(A, [AInt(0)])]
+    a2 = [E.Reduce(A, [AInt(0)])]
+    assert commutes(a1, a2, [])
+    assert not disjoint(a1, a2, [])
+
+
+def test_loop_checks_skip_smt():
+    @proc
+    def foo(n: size, A: f32[n, 16], B: f32[n, 16]):
+        for i in seq(0, n):
+            for j in seq(0, 16):
+                A[i, j] = B[i, j]
+                B[i, j] = 0.0
+
+    clear_check_memo()
+    reset_dependence_stats()
+    foo = reorder_loops(foo, "i j")
+    foo = fission(foo, foo.find("A[_] = _").after())
+    foo = parallelize_loop(foo, "j")
+    compile_procs_to_strings([foo], "test.h")
+    stats = get_dependence_stats()
+    assert stats.queries > 0
+    assert stats.fallback == 0
+
+
+def test_loop_checks_fall_back_to_smt():
+    @proc
+    def foo(n: size, A: f32[n + 1]):
+        for i in par(0, n):
+            A[i + 1] = A[i]
+
+    clear_check_memo()
+    reset_dependence_stats()
+    with pytest.raises(TypeError, match="not parallelizable"):
+        compile_procs_to_strings([foo], "test.h")
+    assert get_dependence_stats().fallback > 0
+
+
+def test_dependence_graph_directions():
+    @proc
+    def foo(n: size, A: f32[n + 1, n + 1]):
+        for i in seq(1, n):
+            for j in seq(0, n):
+                A[i, j] = A[i - 1, j + 1]
+
+    clear_dependence_graphs()
+    ir = foo._loopir_proc
+    graph, path = get_dependence_graph(ir, ir.body[0])
+    assert path == ()
+    vecs = {(dep.directions, dep.distances) for dep in graph.dependences()}
+    assert (("<", ">"), (1, -1)) in vecs
+    assert graph.may_depend((), ("<", ">"), "commute")
+    assert not graph.may_depend((0,), ("<",), "disjoint")
+
+
+def test_dependence_graph_follows_reorder():
+    @proc
+    def foo(n: size, A: f32[n, n, n]):
+        for i in seq(0, n):
+            for j in seq(0, n):
+                for k in seq(0, n):
+                    A[i, j, k] = A[i, j, k] + 1.0
+
+    clear_check_memo()
+    clear_dependence_graphs()
+    foo = reorder_loops(foo, "i j")
+    ir = foo._loopir_proc
+    graph, path = get_dependence_graph(ir, ir.body[0].body[0])
+    # the graph of the original nest was carried over, not rebuilt
+    assert graph.loop is ir.body[0]
+    assert path == (0,)
+    assert len(graph.vectors) > 0
+    assert not graph.may_depend(path, ("<", ">"), "commute")
+    foo = reorder_loops(foo, "i k")
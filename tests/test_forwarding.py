@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import gc
+import weakref
+
 import pytest
 
 from exo import proc
+from exo.API_cursors import InvalidCursorError
 from exo.stdlib.scheduling import *
 from exo.platforms.x86 import *
 
@@ -72,3 +76,68 @@ def test_fuse_loops():
 
     # Block containing both loops forwards to block containing fused loop.
     assert foo.forward(both_loops) == foo.find_loop("i").as_block()
+
+
+def _rename_chain(foo, n):
+    procs = [foo]
+    for k in range(n):
+        procs.append(rename(procs[-1], f"foo{k}"))
+    return procs
+
+
+def test_forward_long_history():
+    @proc
+    def foo(x: R[4]):
+        for i in seq(0, 4):
+            x[i] = 1.0
+        x[0] = 2.0
+
+    procs = _rename_chain(foo, 37)
+    for p in procs[:: len(procs) // 6]:
+        loop = p.find_loop("i")
+        for q in procs[procs.index(p) :]:
+            assert q.forward(loop) == q.find_loop("i")
+            assert q.forward(loop.after()) == q.find_loop("i").after()
+
+    with pytest.raises(InvalidCursorError, match="not an ancestor"):
+        procs[3].forward(procs[5].find_loop("i"))
+    with pytest.raises(InvalidCursorError, match="not an ancestor"):
+        procs[3].forward(_foo_other().find_loop("i"))
+
+
+def _foo_other():
+    @proc
+    def bar(x: R[4]):
+        for i in seq(0, 4):
+            x[i] = 1.0
+
+    return bar
+
+
+def test_seal():
+    @proc
+    def foo(x: R[4]):
+        for i in seq(0, 4):
+            x[i] = 1.0
+
+    procs = _rename_chain(foo, 20)
+    last = procs[-1]
+    assert last.forward(foo.find_loop("i")) == last.find_loop("i")
+
+    kept = procs[2]
+    old = weakref.ref(procs[5])
+    # the skips of other histories are kept
+    other = _rename_chain(_foo_other(), 20)
+    other[-1].forward(other[0].find_loop("i"))
+    skip = other[-1]._skip
+    assert skip is not None
+    procs[10].seal()
+    assert other[-1]._skip is skip
+    del procs[:10], foo
+    gc.collect()
+    assert old() is None
+
+    # cursors from the sealed procedure onwards can still be forwarded
+    assert last.forward(procs[0].find_loop("i")) == last.find_loop("i")
+    with pytest.raises(InvalidCursorError, match="sealed"):
+        last.forward(kept.find_loop("i"))
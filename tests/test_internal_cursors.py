@@ -10,6 +10,7 @@ from exo.core.internal_cursors import (
     Block,
     InvalidCursorError,
     Node,
+    _path_index,
 )
 from exo.frontend.pattern_match import match_pattern
 from exo.core.prelude import Sym
@@ -968,3 +969,21 @@ def test_move_forwarding_for_blocks_gap_after(proc_baz, golden):
         output.append(_print_cursor(fwd(b_with_endpoint_in_moved_block)))
 
     assert "\n\n".join(output) == golden
+
+
+def test_cursors_share_resolved_paths(proc_bar):
+    root = proc_bar.INTERNAL_proc()
+    loop = root.body[1].body[0]
+    path = [("body", 1), ("body", 0), ("body", 3)]
+
+    c = Node(root, path)
+    assert c._node is loop.body[3]
+    # a fresh cursor finds the nodes resolved for the first one
+    index = _path_index.get(root)
+    assert index[tuple(path[:2])] is loop
+    assert Node(root, path[:2])._node is loop
+    assert Node(root, path).parent()._node is loop
+    assert c.next()._node is loop.body[4]
+
+    with pytest.raises(IndexError):
+        Node(root, [("body", 7)])._node
@@ -336,3 +336,105 @@ def test_alias_check():
         @proc
         def bar(N: size, x: [f32][N]):
             foo(N, x, x)
+
+
+def test_check_memo_hit_on_equivalent_proc():
+    def make():
+        @proc
+        def foo(N: size, x: R[N, N]):
+            for i in seq(0, N):
+                for j in seq(0, N):
+                    x[i, j] = x[i, j] * 2.0
+
+        return foo
+
+    clear_check_memo()
+    foo1 = reorder_loops(make(), "i j")
+    stats = check_memo_stats()
+    assert stats["hits"] == 0 and stats["size"] > 0
+
+    foo2 = reorder_loops(make(), "i j")
+    assert check_memo_stats()["hits"] == stats["misses"]
+    assert str(foo1) == str(foo2)
+
+
+def test_check_memo_caches_failures():
+    @proc
+    def foo(N: size, x: R[N, N]):
+        for i in seq(0, N):
+            for j in seq(0, N):
+                x[i, j] = x[j, i] * 2.0
+
+    clear_check_memo()
+    for _ in range(2):
+        with pytest.raises(
+            SchedulingError, match="Loops i and j at .* cannot be reordered"
+        ):
+            reorder_loops(foo, "i j")
+    assert check_memo_stats()["hits"] == 1
+
+
+def test_check_memo_distinguishes_context():
+    @proc
+    def foo(N: size, x: R[N]):
+        for i in seq(0, N):
+            x[i] = 1.0
+        if N > 4:
+            for i in seq(0, N):
+                x[i] = 1.0
+
+    ir = foo.INTERNAL_proc()
+    N = LoopIR.Read(ir.args[0].name, [], T.size, null_srcinfo())
+    loop0 = ir.body[0]
+    loop1 = ir.body[1].body[0]
+
+    clear_check_memo()
+    for _ in range(2):
+        assert not Check_ExprBound(ir, [loop0], N, ">", 4, exception=False)
+        assert Check_ExprBound(ir, [loop1], N, ">", 4, exception=False)
+    assert check_memo_stats()["hits"] == 2
+
+
+def test_bounds_facts_reused_after_local_rewrite():
+    @proc
+    def foo(N: size, x: R[N, 16]):
+        tmp: R[16]
+        for i in seq(0, 16):
+            tmp[i] = 0.0
+        for k in seq(0, N):
+            x[k, 0] = 1.0
+        for i in seq(0, 16):
+            x[0, i] = tmp[i]
+        for i in seq(0, 16):
+            tmp[i] = x[0, i]
+
+    def check(p):
+        ir = p.INTERNAL_proc()
+        Check_Bounds(ir, ir.body[0], ir.body[1:])
+
+    clear_check_memo()
+    check(foo)
+    # the loop over k does not access tmp
+    assert bounds_facts_stats()["misses"] == 3
+
+    foo = divide_loop(foo, "i #2", 4, ["io", "ii"], perfect=True)
+    check(foo)
+    stats = bounds_facts_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 4
+
+
+def test_bounds_facts_depend_on_context():
+    @proc
+    def foo(N: size, x: R[N]):
+        assert N <= 8
+        tmp: R[8]
+        for i in seq(0, N):
+            tmp[i] = x[i]
+
+    clear_check_memo()
+    ir = foo.INTERNAL_proc()
+    Check_Bounds(ir, ir.body[0], ir.body[1:])
+    # the same statements are out of bounds without the assertion
+    ir = ir.update(preds=[])
+    with pytest.raises(SchedulingError, match="accessed out-of-bounds"):
+        Check_Bounds(ir, ir.body[0], ir.body[1:])
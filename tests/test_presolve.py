@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import pytest
+
+from exo.core.prelude import Sym
+from exo.rewrite.new_analysis_core import *
+from exo.rewrite.presolve import (
+    presolve_valid,
+    get_presolve_stats,
+    reset_presolve_stats,
+)
+
+
+@pytest.fixture
+def syms():
+    return {nm: AInt(Sym(nm)) for nm in ("i", "j", "n", "m")}
+
+
+def test_presolve_loop_bound(syms):
+    i, n = syms["i"], syms["n"]
+    hyp = AAnd(AInt(0) <= i, i < n)
+    assert presolve_valid([hyp], i + AInt(1) <= n)
+    assert presolve_valid([], AImplies(hyp, AInt(0) < n))
+    assert not presolve_valid([hyp], i + AInt(1) < n)
+
+
+def test_presolve_integer_tightening(syms):
+    i = syms["i"]
+    # 2*i >= 1 implies i >= 1 over the integers, but not over the rationals
+    assert presolve_valid([AInt(2) * i >= AInt(1)], i >= AInt(1))
+    # 2*i == 1 has no integer solutions
+    assert presolve_valid([AEq(AInt(2) * i, AInt(1))], ABool(False))
+
+
+def test_presolve_div_mod(syms):
+    i, n = syms["i"], syms["n"]
+    assert presolve_valid([AInt(0) <= n], n / AInt(4) * AInt(4) <= n)
+    assert presolve_valid([], AInt(0) <= i % AInt(4))
+    assert presolve_valid([], i % AInt(4) < AInt(4))
+    assert not presolve_valid([], i / AInt(4) < i)
+
+
+def test_presolve_one_point_quantifiers(syms):
+    i, n = syms["i"], syms["n"]
+    x = Sym("x")
+    X = AInt(x)
+    hyp = AAnd(AInt(0) <= i, i < n)
+    # the effect analysis produces location sets like ∃x, x == i ∧ P(x)
+    assert presolve_valid([hyp], AExists([x], AAnd(AEq(X, i), X < n)))
+    assert presolve_valid([hyp], AForAll([x], AImplies(AEq(X, i + AInt(1)), X <= n)))
+    assert not presolve_valid([hyp], AForAll([x], X < n))
+
+
+def test_presolve_nonlinear_falls_back(syms):
+    i, j = syms["i"], syms["j"]
+    # valid, but non-linear, so the presolver must leave it to the solver
+    assert not presolve_valid([], i * j <= i * j + AInt(1))
+    slv = SMTSolver()
+    assert slv.verify(i * j <= i * j + AInt(1))
+
+
+def test_presolve_stats(syms):
+    i, n = syms["i"], syms["n"]
+    reset_presolve_stats()
+    slv = SMTSolver()
+    slv.assume(AAnd(AInt(0) <= i, i < n))
+    assert slv.verify(i < n + AInt(1))
+    assert not slv.verify(i < n - AInt(1))
+    stats = get_presolve_stats()
+    assert stats.queries == 2
+    assert stats.proved == 1
+    assert stats.fallback == 1
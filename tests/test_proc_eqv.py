@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from exo import proc
+from exo.core import proc_eqv
+from exo.core.proc_eqv import (
+    decl_new_proc,
+    derive_proc,
+    assert_eqv_proc,
+    check_eqv_proc,
+    get_strictest_eqv_proc,
+    get_repr_proc,
+)
+
+
+def _procs(n):
+    @proc
+    def foo(x: f32):
+        x = 1.0
+
+    p = foo.INTERNAL_proc()
+    procs = [p.update(name=f"foo{k}") for k in range(n)]
+    for q in procs:
+        decl_new_proc(q)
+    return procs
+
+
+def test_modulo_keys():
+    a, b, c, d, e = _procs(5)
+    assert_eqv_proc(a, b)
+    assert_eqv_proc(b, c, frozenset({"x"}))
+    assert_eqv_proc(c, d, frozenset({"y"}))
+
+    assert check_eqv_proc(a, b) and get_repr_proc(a) is get_repr_proc(b)
+    assert not check_eqv_proc(a, c)
+    assert check_eqv_proc(a, c, frozenset({"x"}))
+    assert not check_eqv_proc(a, d, frozenset({"x"}))
+    assert check_eqv_proc(a, d, frozenset({"x", "y"}))
+    assert get_strictest_eqv_proc(a, d) == (True, {"x", "y"})
+    assert get_strictest_eqv_proc(a, e) == (False, set())
+
+    # a second path from `a` to `d` which does not depend on `y`
+    assert_eqv_proc(a, e, frozenset({"x"}))
+    assert_eqv_proc(e, d)
+    assert get_strictest_eqv_proc(a, d) == (True, {"x"})
+
+    # joining the classes of `a` and `d` makes them strictly equivalent
+    assert_eqv_proc(d, a)
+    assert get_strictest_eqv_proc(a, d) == (True, set())
+    assert get_repr_proc(d) is get_repr_proc(a)
+
+
+def test_keys_are_not_tracked_per_proc(monkeypatch):
+    monkeypatch.setattr(proc_eqv, "_UF_Strict", proc_eqv._UnionFind())
+    monkeypatch.setattr(proc_eqv, "_UF_Unv", proc_eqv._UnionFind())
+    monkeypatch.setattr(proc_eqv, "_UF_Unv_key", dict())
+    (p,) = _procs(1)
+    for k in range(50):
+        q = p.update(name=f"bar{k}")
+        derive_proc(p, q, frozenset({("cfg", k)}) if k % 10 == 0 else frozenset())
+        p = q
+
+    # only the procedures joined modulo some key are in the relations
+    # which track keys
+    assert all(len(uf.lookup) <= 10 for uf in proc_eqv._UF_Unv_key.values())
+    assert get_strictest_eqv_proc(p, q)[0]
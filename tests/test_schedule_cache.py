@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import pytest
+
+import exo
+from exo import proc, instr, DRAM, SchedulingError
+from exo import enable_schedule_cache, disable_schedule_cache
+from exo.core.caches import cache_stats
+from exo.core.LoopIR import LoopIR
+from exo.stdlib.scheduling import *
+
+
+@pytest.fixture
+def schedule_cache():
+    yield enable_schedule_cache
+    disable_schedule_cache()
+
+
+@instr("{dst_data} = {src_data};")
+def copy_one(src: [f32][1] @ DRAM, dst: [f32][1] @ DRAM):
+    for i in seq(0, 1):
+        dst[i] = src[i]
+
+
+def _foo():
+    @proc
+    def foo(n: size, x: f32[n], y: f32[n]):
+        assert n % 4 == 0
+        for i in seq(0, n):
+            y[i] += 2.0 * x[i]
+
+    return foo
+
+
+def _schedule(foo):
+    foo = divide_loop(foo, "i", 4, ["io", "ii"], perfect=True)
+    foo = unroll_loop(foo, "ii")
+    # derives its result through an intermediate procedure
+    foo = simplify(foo)
+    return foo
+
+
+def test_memoized_in_memory(schedule_cache):
+    schedule_cache()
+    p1 = _schedule(_foo())
+    misses = cache_stats()["schedules"]["misses"]
+
+    foo = _foo()
+    p2 = _schedule(foo)
+    assert str(p2) == str(p1)
+    stats = cache_stats()["schedules"]
+    assert stats["misses"] == misses and stats["hits"] > 0
+
+    # the result is renamed to the symbols of the new procedure
+    assert p2.INTERNAL_proc().args[0].name is foo.INTERNAL_proc().args[0].name
+    # and cursors are forwarded to it
+    loop = p2.forward(foo.find_loop("i"))
+    assert loop.name() == "io"
+
+    # the same call returns the same result
+    foo = rename(foo, "foo2")
+    p3 = divide_loop(foo, "i", 4, ["io", "ii"], perfect=True)
+    p4 = divide_loop(foo, "i", 4, ["io", "ii"], perfect=True)
+    assert p3.INTERNAL_proc() is p4.INTERNAL_proc()
+
+
+def test_failures_are_memoized(schedule_cache):
+    schedule_cache()
+    foo = _foo()
+    with pytest.raises(SchedulingError, match="cannot perfectly divide"):
+        divide_loop(foo, "i", 3, ["io", "ii"], perfect=True)
+    hits = cache_stats()["schedules"]["hits"]
+    with pytest.raises(SchedulingError, match="cannot perfectly divide"):
+        divide_loop(_foo(), "i", 3, ["io", "ii"], perfect=True)
+    assert cache_stats()["schedules"]["hits"] == hits + 1
+
+
+def test_saved_to_disk(schedule_cache, tmp_path):
+    schedule_cache(tmp_path)
+    foo = _foo()
+    p1 = _schedule(foo)
+    assert p1.forward(foo.find_loop("i")).name() == "io"
+    assert list(tmp_path.glob("*.fwd"))
+
+    # a later run loads the results
+    disable_schedule_cache()
+    schedule_cache(tmp_path)
+    foo = _foo()
+    p2 = _schedule(foo)
+    assert str(p2) == str(p1)
+    assert cache_stats()["schedules"]["size"] > 0
+    assert p2.INTERNAL_proc().args[0].name is foo.INTERNAL_proc().args[0].name
+    # from the saved trace, and by running the operation again otherwise
+    assert p2.forward(foo.find_loop("i")).name() == "io"
+    gap = p2.forward(foo.body()[0].after())
+    assert gap.anchor().name() == "io"
+
+    # the results can be scheduled further
+    p2 = simplify(p2)
+    assert str(p2) == str(simplify(p1))
+
+
+def test_disk_is_per_version(schedule_cache, tmp_path, monkeypatch):
+    schedule_cache(tmp_path)
+    p1 = _schedule(_foo())
+    saved = set(tmp_path.iterdir())
+
+    # results saved by another version of Exo are not loaded
+    disable_schedule_cache()
+    monkeypatch.setattr(exo, "__version__", exo.__version__ + "+other")
+    schedule_cache(tmp_path)
+    p2 = _schedule(_foo())
+    assert str(p2) == str(p1)
+    assert cache_stats()["schedules"]["hits"] == 0
+    assert saved < set(tmp_path.iterdir())
+
+
+def test_disk_failures_only_raise_errors(schedule_cache, tmp_path):
+    schedule_cache(tmp_path)
+    with pytest.raises(SchedulingError, match="cannot perfectly divide"):
+        divide_loop(_foo(), "i", 3, ["io", "ii"], perfect=True)
+    (file,) = tmp_path.iterdir()
+    assert file.read_text().startswith("error\n")
+
+    # a saved failure naming anything but an error of Exo is not loaded
+    file.write_text("error\n('builtins', 'print', 'tampered', {})\n\n")
+    disable_schedule_cache()
+    schedule_cache(tmp_path)
+    with pytest.raises(SchedulingError, match="cannot perfectly divide"):
+        divide_loop(_foo(), "i", 3, ["io", "ii"], perfect=True)
+    assert cache_stats()["schedules"]["hits"] == 0
+    assert "print" not in file.read_text()
+
+
+def test_disk_refers_to_instructions(schedule_cache, tmp_path):
+    @proc
+    def bar(x: f32[4], y: f32[4]):
+        for i in seq(0, 4):
+            y[i] = x[i]
+
+    def schedule():
+        p = divide_loop(bar, "i", 1, ["io", "ii"], perfect=True)
+        return replace(p, "for ii in _: _", copy_one)
+
+    schedule_cache(tmp_path)
+    p1 = schedule()
+    disable_schedule_cache()
+    schedule_cache(tmp_path)
+    p2 = schedule()
+
+    assert str(p2) == str(p1)
+    (call,) = [s for s in p2.INTERNAL_proc().body[0].body]
+    assert isinstance(call, LoopIR.Call) and call.f is copy_one.INTERNAL_proc()
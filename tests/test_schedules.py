@@ -3870,6 +3870,28 @@ def test_replace_all_unambiguous(golden):
     assert str(bar) == golden
 
 
+def test_replace_smt_backends():
+    from exo.rewrite.smt_backend import get_smt_backend, set_smt_backend
+
+    @proc
+    def bar(n: size, src: f32[n, 16] @ DRAM):
+        assert n > 2
+        dst: f32[8] @ AVX2
+        for i in seq(0, 8):
+            dst[i] = src[n - 2, i + 8]
+
+    old = get_smt_backend()
+    results = []
+    try:
+        for backend in ["z3", "pysmt"]:
+            set_smt_backend(backend)
+            results.append(str(replace_all(bar, [mm256_loadu_ps])))
+    finally:
+        set_smt_backend(old.name)
+    assert results[0] == results[1]
+    assert "mm256_loadu_ps(dst[0:8], src[n + -2, 8:16])" in results[0]
+
+
 def test_replace_all_arch(golden):
     @proc
     def bar(src: f32[8] @ DRAM):
@@ -3900,6 +3922,81 @@ def test_replace_all_length_mismatch(golden):
     assert str(foo) == golden
 
 
+def test_replace_all_skips_mismatched_shapes(monkeypatch):
+    import exo.stdlib.scheduling as scheduling
+    from exo.rewrite.instr_select import InstrSelector, buffer_mems
+
+    @proc
+    def bar(src: f32[8] @ DRAM):
+        dst: f32[8] @ AVX2
+        for i in seq(0, 8):
+            dst[i] = src[i]
+        for i in seq(0, 4):
+            src[i] = dst[i]
+        x: f32[8] @ AVX2
+        y: f32[8] @ AVX2
+        for i in seq(0, 8):
+            x[i] = dst[i] + y[i]
+
+    attempts = []
+
+    def counted_replace(proc, block, subproc, quiet=False):
+        attempts.append(subproc.name())
+        return replace(proc, block, subproc, quiet=quiet)
+
+    arch = [mm256_storeu_ps, mm256_mul_ps, mm256_loadu_ps, mm256_add_ps]
+    selector = InstrSelector([i.INTERNAL_proc() for i in arch])
+    loops = [[s._impl._node] for s in bar.find("for _ in _: _", many=True)]
+    assert [selector.select(loop) for loop in loops] == [[0, 2], [], [3]]
+    mems = buffer_mems(bar.INTERNAL_proc())
+    assert selector.select(loops[0], mems) == [0, 2]
+    assert selector.select(loops[2], {"x": {DRAM}, "y": {DRAM}, "dst": {DRAM}}) == []
+
+    monkeypatch.setattr(scheduling, "replace", counted_replace)
+    bar = replace_all(bar, arch)
+    # neither loop over 4 elements nor a sum has the shape of a load or store
+    assert attempts == ["mm256_storeu_ps", "mm256_loadu_ps", "mm256_add_ps"]
+    assert "mm256_loadu_ps(dst[0:8], src[0:8])" in str(bar)
+    assert "mm256_add_ps(x[0:8], dst[0:8], y[0:8])" in str(bar)
+
+
+def test_unification_templates():
+    from exo.core.caches import cache_stats
+    from exo.core.prelude import Sym
+    from exo.rewrite.LoopIR_unification import UEq
+
+    @proc
+    def bar(src: f32[4, 8] @ DRAM):
+        dst: f32[4, 8] @ AVX2
+        for i in seq(0, 4):
+            for j in seq(0, 8):
+                dst[i, j] = src[i, j]
+
+    hits = cache_stats()["unification_templates"]["hits"]
+    bar = unroll_loop(bar, "i")
+    bar = replace_all(bar, [mm256_loadu_ps])
+    for i in range(4):
+        assert f"mm256_loadu_ps(dst[{i}, 0:8], src[{i}, 0:8])" in str(bar)
+    # the blocks differ only in constants, so all but the first reuse the
+    # cases chosen by the solver for the first
+    assert cache_stats()["unification_templates"]["hits"] >= hits + 3
+
+    # an equation whose solution is not an integer falls back to the solver
+    h, k = Sym("h"), Sym("k")
+
+    def solve(c):
+        rhs = UEq.Add(UEq.Scale(2, UEq.Var(k)), UEq.Const(c))
+        eq = UEq.Eq(UEq.Scale(2, UEq.Var(h)), rhs)
+        sol = UEq.problem([h], [k], [eq]).solve()
+        return sol and str(sol[h])
+
+    assert solve(-4) == "k + -2"
+    hits = cache_stats()["unification_templates"]["hits"]
+    assert solve(6) == "k + 3"
+    assert solve(3) is None
+    assert cache_stats()["unification_templates"]["hits"] == hits + 2
+
+
 def test_eliminate_dead_code(golden):
     @proc
     def foo():
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import pytest
+
+from exo import DRAM, proc, instr, config, compile_procs_to_strings
+from exo import save_procs, load_procs
+from exo.core.LoopIR import LoopIR
+from exo.core.LoopIR_hash import alpha_eq
+from exo.core.LoopIR_serialize import dumps_procs, loads_procs, SerializationError
+from exo.libs.externs import select
+from exo.stdlib.scheduling import *
+
+
+@config
+class ConfigScale:
+    scale: f32
+
+
+@instr("{dst_data} = {src_data};")
+def copy_one(src: [f32][1] @ DRAM, dst: [f32][1] @ DRAM):
+    for i in seq(0, 1):
+        dst[i] = src[i]
+
+
+def _procs():
+    @proc
+    def helper(n: size, x: [f32][n]):
+        assert stride(x, 0) == 1
+        for i in seq(0, n):
+            x[i] = ConfigScale.scale * x[i]
+
+    @proc
+    def foo(n: size, x: f32[n] @ DRAM, y: f32[n]):
+        assert n % 4 == 0
+        ConfigScale.scale = 2.0
+        for i in seq(0, n):
+            tmp: f32
+            tmp = select(x[i], 0.0, -x[i], y[i])
+            y[i] += tmp
+        helper(n, y[0:n])
+        copy_one(x[0:1], y[0:1])
+
+    foo = divide_loop(foo, "i", 4, ["io", "ii"], perfect=True)
+    return foo, helper
+
+
+def test_roundtrip(tmp_path):
+    foo, helper = _procs()
+    save_procs([foo, helper], tmp_path / "procs.exo")
+    foo2, helper2 = load_procs(tmp_path / "procs.exo", known=[ConfigScale])
+
+    assert str(foo2) == str(foo) and str(helper2) == str(helper)
+    assert alpha_eq(foo2.INTERNAL_proc(), foo.INTERNAL_proc())
+    # called procedures are shared, as in the original
+    calls = [s for s in foo2.INTERNAL_proc().body if isinstance(s, LoopIR.Call)]
+    assert calls[0].f is helper2.INTERNAL_proc()
+
+    c1, h1 = compile_procs_to_strings([foo], "test.h")
+    c2, h2 = compile_procs_to_strings([foo2], "test.h")
+    assert (c1, h1) == (c2, h2)
+
+    # the loaded procedure can be scheduled further
+    foo2 = unroll_loop(foo2, "ii")
+    assert "ii" not in str(foo2)
+
+
+def test_srcinfo():
+    foo, _ = _procs()
+    p = foo.INTERNAL_proc()
+    (q,) = loads_procs(dumps_procs([p]), known=[ConfigScale])
+    assert str(q.body[0].srcinfo) == str(p.body[0].srcinfo)
+
+    small = dumps_procs([p], srcinfo=False)
+    assert len(small) < len(dumps_procs([p]))
+    (q,) = loads_procs(small, known=[ConfigScale])
+    assert str(q) == str(p)
+    assert q.body[0].srcinfo.filename == "unknown"
+
+
+def test_known_procs():
+    foo, _ = _procs()
+    p = foo.INTERNAL_proc()
+    data = dumps_procs([p], known=[copy_one])
+    assert len(data) < len(dumps_procs([p]))
+
+    (q,) = loads_procs(data, known=[ConfigScale, copy_one])
+    instrs = [s.f for s in q.body if isinstance(s, LoopIR.Call) and s.f.instr]
+    assert instrs == [copy_one.INTERNAL_proc()]
+    assert instrs[0] is copy_one.INTERNAL_proc()
+
+    with pytest.raises(SerializationError, match="procedure 'copy_one'"):
+        loads_procs(data, known=[ConfigScale])
+
+
+def test_errors():
+    foo, _ = _procs()
+    data = dumps_procs([foo.INTERNAL_proc()])
+
+    with pytest.raises(SerializationError, match="config 'ConfigScale'"):
+        loads_procs(data)
+    with pytest.raises(SerializationError, match="not a serialized"):
+        loads_procs(b"garbage")
+    with pytest.raises(SerializationError, match="version"):
+        loads_procs(data[:4] + b"\xff\xff" + data[6:])
+    with pytest.raises(SerializationError, match="corrupted"):
+        loads_procs(data[:-1] + bytes([data[-1] ^ 1]))
+
+
+def test_base():
+    foo, _ = _procs()
+    p = foo.INTERNAL_proc()
+    q = unroll_loop(foo, "ii").INTERNAL_proc()
+
+    data = dumps_procs([q], known=[copy_one], base=p)
+    assert len(data) < len(dumps_procs([q], known=[copy_one]))
+    (q2,) = loads_procs(data, known=[ConfigScale, copy_one], base=p)
+    assert str(q2) == str(q)
+    # symbols and source locations are those of the base
+    assert q2.args[0].name is p.args[0].name
+    assert q2.body[0].srcinfo is p.body[0].srcinfo
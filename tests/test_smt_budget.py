@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import logging
+
+import pytest
+
+from exo import proc, SchedulingError, clear_caches
+from exo.rewrite import smt_budget
+from exo.rewrite.new_analysis_core import *
+from exo.rewrite.new_eff import clear_check_memo
+from exo.rewrite.smt_budget import (
+    SMTTimeout,
+    get_smt_budget,
+    get_smt_spent,
+    reset_smt_budget,
+    set_smt_budget,
+    set_smt_timeout,
+    smt_scope,
+)
+from exo.stdlib.scheduling import *
+
+
+@pytest.fixture
+def smt_limits():
+    clear_check_memo()
+    reset_smt_budget()
+    yield
+    set_smt_budget(None)
+    set_smt_timeout(None)
+    reset_smt_budget()
+
+
+def _skewed():
+    @proc
+    def foo(n: size, A: f32[n + 1, n + 1]):
+        for i in seq(0, n):
+            for j in seq(0, n):
+                A[i + 1, j] = A[i, j + 1]
+
+    return foo
+
+
+def test_budget_counts_per_procedure(smt_limits):
+    set_smt_budget(1000.0)
+    x = AInt(Sym("x"))
+    slv = SMTSolver()
+    with smt_scope("test", "foo", None):
+        assert not slv.verify(AEq(x * x, AInt(2) * x))
+    assert get_smt_spent("foo") > 0
+    assert get_smt_spent("bar") == 0
+
+
+def test_budget_is_cleared_with_caches(smt_limits):
+    set_smt_budget(1000.0)
+    x = AInt(Sym("x"))
+    with smt_scope("test", "foo", None):
+        SMTSolver().verify(AEq(x * x, AInt(2) * x))
+    assert get_smt_spent("foo") > 0
+    clear_caches()
+    assert get_smt_spent("foo") == 0
+
+
+def test_budget_from_environment(smt_limits, monkeypatch):
+    monkeypatch.setattr(smt_budget, "_checked_env", False)
+    monkeypatch.setenv("EXO_SMT_BUDGET", "0")
+    # as with set_smt_budget(0.0), no time is left
+    assert get_smt_budget() == 0.0
+
+    monkeypatch.setattr(smt_budget, "_checked_env", False)
+    monkeypatch.setenv("EXO_SMT_BUDGET", "")
+    assert get_smt_budget() is None
+
+    monkeypatch.setattr(smt_budget, "_checked_env", False)
+    monkeypatch.setenv("EXO_SMT_BUDGET", "-1")
+    with pytest.raises(ValueError, match="must not be negative"):
+        get_smt_budget()
+
+
+def test_exhausted_budget_is_unproven(smt_limits, caplog):
+    foo = _skewed()
+    set_smt_budget(0.0)
+    with caplog.at_level(logging.WARNING, logger="exo.smt"):
+        with pytest.raises(SchedulingError, match="Check_ReorderLoops.*gave up"):
+            reorder_loops(foo, "i j")
+    assert "Check_ReorderLoops" in caplog.text
+    assert "budget" in caplog.text
+
+    # running out of time is not remembered as the outcome of the check
+    set_smt_budget(None)
+    with pytest.raises(SchedulingError, match="cannot be reordered"):
+        reorder_loops(foo, "i j")
+
+
+def test_exhausted_budget_in_bounds_check(smt_limits):
+    set_smt_budget(0.0)
+    with pytest.raises(TypeError, match="could not check the bounds of foo"):
+        _skewed()
+
+
+def test_query_timeout():
+    z3 = pytest.importorskip("z3")
+    from exo.rewrite.smt_backend import Z3Solver
+
+    x, y, z = z3.Ints("x y z")
+    slv = Z3Solver()
+    slv.set_timeout(0.05)
+    # z3 cannot refute this counter-example to Fermat's last theorem
+    slv.add_assertion(z3.And(x > 0, y > 0, z > 0))
+    with pytest.raises(SMTTimeout, match="timed out"):
+        slv.is_sat(x * x * x + y * y * y == z * z * z)
+    slv.reset()
+    assert slv.is_sat(x > 0)
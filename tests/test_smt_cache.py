@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import pytest
+
+from exo import proc
+from exo.rewrite import dependence, smt_cache
+from exo.rewrite.new_analysis_core import *
+from exo.rewrite.new_eff import clear_check_memo
+from exo.rewrite.smt_cache import (
+    SMTQueryCache,
+    canonicalize_query,
+    enable_query_cache,
+    disable_query_cache,
+)
+from exo.stdlib.scheduling import *
+
+
+@pytest.fixture
+def query_cache(tmp_path, monkeypatch):
+    # make sure that queries actually reach the solver
+    monkeypatch.setattr(SMTSolver, "PRESOLVE", False)
+    monkeypatch.setattr(dependence, "DEPENDENCE_TESTS", False)
+    cache = enable_query_cache(tmp_path / "smt.db")
+    yield cache
+    disable_query_cache()
+
+
+def _index_bound_query():
+    N = AInt(Sym("N"))
+    i = AInt(Sym("i"))
+    return AForAll(
+        [i.name],
+        AImplies(AAnd(AInt(0) <= i, i < N), i + AInt(1) <= N),
+    )
+
+
+def test_canonicalize_renames_syms_consistently():
+    a = canonicalize_query("(> N_12 0)\n(< i_40 N_12)\n(or i_40_def x)")
+    b = canonicalize_query("(> N_7 0)\n(< i_3 N_7)\n(or i_3_def x)")
+    assert a == b
+    assert canonicalize_query("(< i_1 N_2)") != canonicalize_query("(< i_1 i_1)")
+
+
+def test_cache_hit_across_solvers(query_cache):
+    for _ in range(2):
+        slv = SMTSolver()
+        assert slv.verify(_index_bound_query())
+
+    assert query_cache.stats.misses == 1
+    assert query_cache.stats.hits == 1
+    assert len(query_cache) == 1
+
+
+def test_cache_distinguishes_results(query_cache):
+    i = AInt(Sym("i"))
+    slv = SMTSolver()
+    assert slv.satisfy(AEq(i, AInt(3)))
+    assert not slv.verify(AEq(i, AInt(3)))
+    assert query_cache.stats.hits == 0
+
+    slv = SMTSolver()
+    assert slv.satisfy(AEq(i, AInt(3)))
+    assert not slv.verify(AEq(i, AInt(3)))
+    assert query_cache.stats.hits == 2
+
+
+def test_cache_invalidated_on_version_change(tmp_path):
+    path = tmp_path / "smt.db"
+    cache = SMTQueryCache(path, version="1.0")
+    cache.store(cache.key("sat", "(< x_1 0)"), True)
+    cache.close()
+
+    cache = SMTQueryCache(path, version="1.0")
+    assert len(cache) == 1
+    cache.close()
+
+    cache = SMTQueryCache(path, version="2.0")
+    assert len(cache) == 0
+    assert cache.lookup(cache.key("sat", "(< x_1 0)")) is None
+    cache.close()
+
+
+def test_cache_scheduling_checks(query_cache):
+    def make():
+        @proc
+        def foo(N: size, x: R[N, N]):
+            for i in seq(0, N):
+                for j in seq(0, N):
+                    x[i, j] = x[i, j] * 2.0
+
+        return foo
+
+    clear_check_memo()
+    foo1 = reorder_loops(make(), "i j")
+    misses = query_cache.stats.misses
+    assert misses > 0 and query_cache.stats.hits == 0
+
+    # bypass the in-memory memo so that the checks reach the solver
+    clear_check_memo()
+    foo2 = reorder_loops(make(), "i j")
+    assert query_cache.stats.misses == misses
+    assert query_cache.stats.hits == misses
+    assert str(foo1) == str(foo2)
+
+
+def test_cache_from_environment(tmp_path, monkeypatch):
+    disable_query_cache()
+    monkeypatch.setattr(smt_cache, "_checked_env", False)
+    monkeypatch.setenv("EXO_SMT_CACHE", str(tmp_path / "env.db"))
+    try:
+        assert smt_cache.get_query_cache() is not None
+        assert (tmp_path / "env.db").exists()
+    finally:
+        disable_query_cache()
+
+
+def test_solver_pool_reuses_clean_contexts():
+    import gc
+    from exo.rewrite.smt_pool import z3_solvers
+
+    gc.collect()
+    z3_solvers.clear()
+    slv = SMTSolver()
+    assert slv._solver is None  # no pysmt solver in Z3 mode
+    i = AInt(Sym("i"))
+    slv.assume(AEq(i, AInt(3)))
+    z3slv = slv.z3slv
+    del slv
+    gc.collect()
+    assert len(z3_solvers) == 1
+
+    slv = SMTSolver()
+    assert slv.z3slv is z3slv
+    assert len(z3slv.assertions()) == 0
+    assert slv.satisfy(AEq(i, AInt(4)))
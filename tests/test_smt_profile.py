@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import exo
+from exo import proc, SchedulingError
+from exo.rewrite.new_analysis_core import *
+from exo.rewrite.new_eff import clear_check_memo
+from exo.rewrite.smt_profile import (
+    enable_smt_profile,
+    disable_smt_profile,
+    get_smt_profile,
+)
+from exo.stdlib.scheduling import *
+
+
+@pytest.fixture
+def profile():
+    clear_check_memo()
+    prof = enable_smt_profile()
+    yield prof
+    disable_smt_profile()
+
+
+def _skewed():
+    @proc
+    def foo(n: size, A: f32[n + 1, n + 1]):
+        for i in seq(0, n):
+            for j in seq(0, n):
+                A[i + 1, j] = A[i, j + 1]
+
+    return foo
+
+
+def test_profile_disabled_by_default():
+    assert get_smt_profile() is None
+
+
+def test_profile_attributes_queries_to_checks(profile, tmp_path):
+    foo = _skewed()
+    with pytest.raises(SchedulingError):
+        reorder_loops(foo, "i j")
+
+    (e,) = [e for e in profile.entries.values() if e.check == "Check_ReorderLoops"]
+    assert e.calls == 1
+    assert e.queries > 0
+    assert e.sat + e.unsat + e.presolved == e.queries
+    assert e.sat > 0  # the loops cannot be reordered
+    assert e.max_nodes > 0 and e.nodes >= e.max_nodes
+    assert e.check_time >= e.smt_time
+    assert "test_smt_profile.py" in e.srcinfo
+
+    assert "Check_ReorderLoops @" in profile.summary()
+    profile.dump(tmp_path / "prof.json")
+    data = json.loads((tmp_path / "prof.json").read_text())
+    assert data["entries"][0]["check"] == "Check_ReorderLoops"
+
+
+def test_profile_queries_outside_of_checks(profile):
+    x = AInt(Sym("x"))
+    slv = SMTSolver()
+    assert slv.satisfy(AEq(x, AInt(3)))
+    (e,) = profile.entries.values()
+    assert e.check == "<no check>"
+    assert e.queries == 1 and e.sat == 1 and e.nodes == 3
+
+
+def test_profile_from_environment(tmp_path):
+    script = tmp_path / "schedule.py"
+    script.write_text(
+        textwrap.dedent(
+            """
+        from __future__ import annotations
+        from exo import proc
+        from exo.stdlib.scheduling import reorder_loops
+
+        @proc
+        def foo(n: size, A: f32[n, n]):
+            for i in seq(0, n):
+                for j in seq(0, n):
+                    A[i, j] = 0.0
+
+        reorder_loops(foo, "i j")
+        """
+        )
+    )
+    env = dict(os.environ)
+    env["EXO_SMT_PROFILE"] = str(tmp_path / "prof.json")
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(exo.__file__))
+    res = subprocess.run(
+        [sys.executable, str(script)], env=env, capture_output=True, text=True
+    )
+    assert res.returncode == 0, res.stderr
+    assert "SMT profile:" in res.stderr
+    data = json.loads((tmp_path / "prof.json").read_text())
+    assert any(e["check"] == "Check_ReorderLoops" for e in data["entries"])
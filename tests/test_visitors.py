@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from collections import Counter
+
+import pytest
+
+from exo import proc, DRAM
+from exo.core.LoopIR import LoopIR, LoopIR_Do, LoopIR_Rewrite, T
+from exo.core.prelude import null_srcinfo
+from exo.stdlib.scheduling import *
+
+
+def _foo():
+    @proc
+    def foo(n: size, x: f32[n], y: f32[n]):
+        for i in seq(0, n):
+            if i < 3:
+                y[i] = -x[i] * 2.0
+            else:
+                y[i] += x[i]
+
+    return foo._loopir_proc
+
+
+class _Collect(LoopIR_Do):
+    def __init__(self, proc):
+        self.seen = []
+        super().__init__(proc)
+
+    def do_s(self, s):
+        self.seen.append(type(s).__name__)
+        super().do_s(s)
+
+    def do_e(self, e):
+        self.seen.append(type(e).__name__)
+        super().do_e(e)
+
+
+def test_do_visits_every_node():
+    seen = _Collect(_foo()).seen
+    assert seen.count("For") == 1 and seen.count("If") == 1
+    assert seen.count("Assign") == 1 and seen.count("Reduce") == 1
+    assert seen.count("USub") == 1 and seen.count("Const") == 3
+    # the sizes of x and y, the loop bound, and the reads in the body
+    assert seen.count("Read") == 10
+
+
+def _walk(node, seen):
+    # visits every expression and statement by the fields of the nodes
+    if isinstance(node, list):
+        for x in node:
+            _walk(x, seen)
+    elif isinstance(node, (LoopIR.stmt, LoopIR.expr)):
+        seen.append(type(node).__name__)
+        for f in node.__annotations__:
+            _walk(getattr(node, f), seen)
+    elif isinstance(node, LoopIR.w_access):
+        for f in node.__annotations__:
+            _walk(getattr(node, f), seen)
+
+
+def test_do_agrees_with_a_generic_walk():
+    @proc
+    def gemm(A: f32[4, 4], B: f32[4, 4], C: f32[4, 4]):
+        for i in seq(0, 4):
+            for j in seq(0, 4):
+                if i < j:
+                    C[i, j] = 0.0
+                for k in seq(0, 4):
+                    C[i, j] += A[i, k] * B[k, j]
+
+    p = unroll_loop(gemm, "k")._loopir_proc
+    expected = []
+    _walk(p.body, expected)
+    seen = Counter(_Collect(p).seen)
+    # the visitor also visits the sizes of the arguments
+    assert seen - Counter(expected) == Counter({"Const": 6})
+    assert Counter(expected) - seen == Counter()
+    assert LoopIR_Rewrite().apply_proc(p) is p
+
+
+def test_per_class_overrides():
+    class DoubleConsts(LoopIR_Rewrite):
+        def _map_Const(self, e):
+            if e.type.is_real_scalar():
+                return e.update(val=2 * e.val)
+            return None
+
+    p = DoubleConsts().apply_proc(_foo())
+    assert "-x[i] * 4.0" in str(p)
+    assert "i < 3" in str(p)
+    # the base class is unaffected
+    assert LoopIR_Rewrite().apply_proc(p) is p
+
+
+def test_unknown_nodes():
+    free = LoopIR.Free(_foo().args[1].name, T.f32, DRAM, null_srcinfo())
+    with pytest.raises(NotImplementedError):
+        LoopIR_Rewrite().map_s(free)